@@ -0,0 +1,64 @@
+"""Compare the hash algorithms available for ``Environment.hash_algorithm``.
+
+Hashes bundle-sized inputs (1 to 5 MB of CSS-like text) the way webassets
+does, i.e. via ``make_digest()`` on a ``MemoryHunk``, and reports the
+throughput of each algorithm::
+
+    PYTHONPATH=src python benchmarks/hash_algorithms.py [runs]
+
+The ``xxhash`` algorithms are only included if the module is installed.
+"""
+
+import sys
+import timeit
+
+from webassets.cache import make_digest
+from webassets.merge import MemoryHunk
+from webassets.utils import resolve_hash_algorithm, using_hash_algorithm
+
+
+ALGORITHMS = ['md5', 'sha1', 'sha256', 'blake2b', 'blake2s',
+              'xxh64', 'xxh3_64', 'xxh3_128']
+SIZES_MB = [1, 2, 5]
+
+RULE = ('.block-%d .element--modifier { color: #%06x; '
+        'background: url("../img/sprite.png") no-repeat -%dpx 0; }\n')
+
+
+def make_bundle(size):
+    lines, length, i = [], 0, 0
+    while length < size:
+        line = RULE % (i, i * 2654435761 % 0xffffff, i % 512)
+        lines.append(line)
+        length += len(line)
+        i += 1
+    return ''.join(lines)[:size]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    algorithms = []
+    for name in ALGORITHMS:
+        try:
+            resolve_hash_algorithm(name)
+        except (EnvironmentError, ValueError):
+            print('skipping %s (not available)' % name)
+        else:
+            algorithms.append(name)
+
+    print('%-10s' % 'MB' + ''.join('%12s' % n for n in algorithms))
+    for mb in SIZES_MB:
+        data = make_bundle(mb * 1024 * 1024)
+        row = []
+        for name in algorithms:
+            with using_hash_algorithm(name):
+                # A new hunk every time, since hunks memoize their digest.
+                best = min(timeit.repeat(
+                    lambda: make_digest(MemoryHunk(data)),
+                    number=1, repeat=runs))
+            row.append('%9.1f ms' % (best * 1000))
+        print('%-10s' % mb + ''.join('%12s' % r for r in row))
+
+
+if __name__ == '__main__':
+    main()
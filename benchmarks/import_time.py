@@ -0,0 +1,45 @@
+"""Measure how long ``import webassets`` takes.
+
+Compares the default, where builtin filters are loaded on first use,
+to importing all of them upfront via ``load_builtin_filters()``. Each
+variant runs in a fresh interpreter::
+
+    PYTHONPATH=src python benchmarks/import_time.py [runs]
+"""
+
+import subprocess
+import sys
+import timeit
+
+
+VARIANTS = [
+    ('lazy', 'import webassets'),
+    ('lazy + get_filter()',
+     'import webassets.filter as f; f.get_filter("cssmin")'),
+    ('eager', 'import webassets.filter as f; f.load_builtin_filters()'),
+]
+
+
+def measure(code, runs):
+    timer = ('import time; t = time.perf_counter(); %s; '
+             'print(time.perf_counter() - t)' % code)
+    results = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', timer])
+        results.append(float(output))
+    return min(results)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    # Baseline: the interpreter start-up itself, for reference.
+    startup = min(timeit.repeat(
+        lambda: subprocess.check_call([sys.executable, '-c', 'pass']),
+        number=1, repeat=runs))
+    print('interpreter start-up: %8.1f ms' % (startup * 1000))
+    for label, code in VARIANTS:
+        print('%-21s %8.1f ms' % (label + ':', measure(code, runs) * 1000))
+
+
+if __name__ == '__main__':
+    main()
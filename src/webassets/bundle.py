@@ -1,15 +1,21 @@
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+import gzip
 import os
 from os import path
 
 from .filter import get_filter
-from .merge import (FileHunk, UrlHunk, FilterTool, merge, merge_filters,
-                    select_filters, MoreThanOneFilterError, NoFilters)
+from .merge import (FileHunk, MemoryHunk, HunkStore, FilterTool, merge,
+                    merge_filters, select_filters, split_css_rules,
+                    MoreThanOneFilterError, NoFilters)
 from .updater import SKIP_CACHE
 from .exceptions import BundleError, BuildError
-from .utils import cmp_debug_levels, hash_func
+from .utils import (
+    cmp_debug_levels, hash_func, get_hash_algorithm, using_hash_algorithm)
 from .env import ConfigurationContext, DictConfigStorage, BaseEnvironment
-from .utils import is_url, calculate_sri_on_file
+from .utils import (
+    is_url, calculate_sri_on_chunks, cached_sri_on_file, link_or_copy,
+    write_file)
 
 
 __all__ = ('Bundle', 'get_all_bundle_files',)
@@ -67,6 +73,18 @@ class ContextWrapper(object):
             return self._parent
         return self._parent.environment
 
+    @property
+    def config_version(self):
+        """Combines the configuration versions of all the levels of the
+        hierarchy. ``None`` if any of them does not support versioning.
+        """
+        versions = (self._parent.config_version,)
+        if self._overwrites is not None:
+            versions = (self._overwrites.config.config_version,) + versions
+        if None in versions:
+            return None
+        return versions
+
 
 def wrap(parent, overwrites):
     """Return a context object where the values from ``overwrites``
@@ -105,6 +123,9 @@ class Bundle(object):
     child bundles that do not know it.
     """
 
+    # The SRI string of the output, see _output_sri().
+    _sri = None
+
     def __init__(self, *contents, **options):
         self._env = options.pop('env', None)
         self.contents = contents
@@ -122,6 +143,7 @@ class Bundle(object):
             debug = options.pop('debug')
             if debug is not None:
                 self._config['debug'] = debug
+        self.outputs = options.pop('outputs', None)
 
         if options:
             raise TypeError("got unexpected keyword argument '%s'" %
@@ -166,6 +188,7 @@ class Bundle(object):
         else:
             filters = [value]
         self._filters = [get_filter(f) for f in filters]
+        self._id_memo = None
     filters = property(_get_filters, _set_filters)
 
     def _get_contents(self):
@@ -173,8 +196,33 @@ class Bundle(object):
     def _set_contents(self, value):
         self._contents = value
         self._resolved_contents = None
+        self._id_memo = None
     contents = property(_get_contents, _set_contents)
 
+    def _get_outputs(self):
+        return self._outputs
+    def _set_outputs(self, value):
+        outputs = {}
+        for name, spec in (value or {}).items():
+            if isinstance(spec, str):
+                spec = {'output': spec}
+            outputs[name] = BundleOutput(self, name, **spec)
+        self._outputs = outputs
+    outputs = property(_get_outputs, _set_outputs, doc=
+    """Additional outputs of this bundle, as a dict of names to dicts with
+    an ``output`` target and ``filters``, or just the output target::
+
+        Bundle('app.js', filters='babel', output='gen/app.js', outputs={
+            'min': {'output': 'gen/app.min.js', 'filters': 'rjsmin'},
+        })
+
+    The source files are read, their input filters applied and merged
+    once, for all outputs; the output filters of each output then replace
+    those of the bundle. The outputs are built along with the bundle, and
+    are available as :class:`Bundle` objects through this attribute, so
+    that you can ask for their urls, for example.
+    """)
+
     def _get_extra(self):
         if not self._extra and not has_files(self):
             # If this bundle has no extra values of it's own, and only
@@ -308,20 +356,23 @@ class Bundle(object):
             ctx = wrap(self.env, self)
         if not self.version or refresh:
             version = None
-            # First, try a manifest. This should be the fastest way.
-            if ctx.manifest:
-                version = ctx.manifest.query(self, ctx)
-            # Often the versioner is able to help.
-            if not version:
-                from .version import VersionIndeterminableError
-                if ctx.versions:
-                    try:
-                        version = ctx.versions.determine_version(self, ctx)
-                        assert version
-                    except VersionIndeterminableError as e:
-                        reason = e
-                else:
-                    reason = '"versions" option not set'
+            # The manifest may be a cache, whose keys are to be hashed
+            # like during a build.
+            with using_hash_algorithm(ctx.hash_algorithm):
+                # First, try a manifest. This should be the fastest way.
+                if ctx.manifest:
+                    version = ctx.manifest.query(self, ctx)
+                # Often the versioner is able to help.
+                if not version:
+                    from .version import VersionIndeterminableError
+                    if ctx.versions:
+                        try:
+                            version = ctx.versions.determine_version(self, ctx)
+                            assert version
+                        except VersionIndeterminableError as e:
+                            reason = e
+                    else:
+                        reason = '"versions" option not set'
             if not version:
                 raise BundleError((
                     'Cannot find version of %s. There is no manifest '
@@ -349,15 +400,35 @@ class Bundle(object):
         The hash therefore should be built upon data that actually affect the
         final build result.
         """
-        return hash_func((tuple(self.contents),
-                     self.output,
-                     tuple(self.filters),
-                     bool(self.debug)))
+        if self._env is not None:
+            # Hashed like during a build, see ``Environment.hash_algorithm``.
+            with using_hash_algorithm(self._env.hash_algorithm):
+                return self._id()
+        return self._id()
+
+    def _id(self):
+        # Nested bundles and filters memoize their own ids, so this
+        # snapshot is cheap to build; we only hash it again when it
+        # differs from the last time.
+        snapshot = (tuple([c.id() if isinstance(c, Bundle) else c
+                           for c in self.contents]),
+                    self.output,
+                    tuple([f.id() for f in self.filters]),
+                    bool(self.debug))
+        memo = getattr(self, '_id_memo', None)
+        if memo is not None and memo[0] == (get_hash_algorithm()[0], snapshot):
+            return memo[1]
+        digest = hash_func(snapshot)
+        self._id_memo = ((get_hash_algorithm()[0], snapshot), digest)
+        return digest
         # Note how self.depends is not included here. It could be, but we
         # really want this hash to only change for stuff that affects the
         # actual output bytes. Note that modifying depends will be effective
         # after the first rebuild in any case.
 
+    def __webassets_digest__(self):
+        return self.id()
+
     @property
     def is_container(self):
         """Return true if this is a container bundle, that is, a bundle that
@@ -387,7 +458,8 @@ class Bundle(object):
 
     def _merge_and_apply(self, ctx, output, force, parent_debug=None,
                          parent_filters=None, extra_filters=None,
-                         disable_cache=None):
+                         disable_cache=None, hunk_store=None,
+                         output_filters=None, merged=None):
         """Internal recursive build method.
 
         ``parent_debug`` is the debug setting used by the parent bundle. This
@@ -408,9 +480,18 @@ class Bundle(object):
         bundle dependency has changed, we must not rely on the cache, since the
         cache key is not taking into account changes in those dependencies
         (for now).
+
+        ``hunk_store`` is the ``HunkStore`` through which source files are
+        read, shared by all the bundles of a build.
+
+        ``output_filters``, if given, are applied in the output step
+        instead of those of the bundle (see ``Bundle.outputs``). ``merged``
+        may be a dict in which the results of the input step are shared
+        between several such calls.
         """
 
         parent_filters = parent_filters or []
+        hunk_store = hunk_store or HunkStore(read_once=not ctx.streaming)
         extra_filters = extra_filters or []
         # Determine the debug level to use. It determines if and which filters
         # should be applied.
@@ -451,7 +532,7 @@ class Bundle(object):
             # is problematic. However, by inspecting the support arguments,
             # we can deal with it. We probably then want to deprecate
             # the old syntax before 1.0 (TODO).
-            filter.setup()
+            _setup_filter(filter, ctx)
 
         # Given the debug level, determine which of the filters want to run
         selected_filters = select_filters(filters, current_debug_level)
@@ -466,8 +547,12 @@ class Bundle(object):
             selected_filters, select_filters(parent_filters, current_debug_level))
         filters_to_pass_down = merge_filters(filters, parent_filters)
 
-        # Prepare contents
-        resolved_contents = self.resolve_contents(ctx, force=True)
+        if output_filters is not None:
+            for filter in output_filters:
+                filter.set_context(ctx)
+                _setup_filter(filter, ctx)
+            selected_filters = select_filters(
+                output_filters, current_debug_level)
 
         # Unless we have been told by our caller to use or not use the cache
         # for this, try to decide for ourselves. The issue here is that when a
@@ -487,7 +572,71 @@ class Bundle(object):
         filtertool = FilterTool(
             ctx.cache, no_cache_read=actually_skip_cache_here,
             kwargs={'output': output[0],
-                    'output_path': output[1]})
+                    'output_path': output[1]},
+            streaming=bool(ctx.streaming))
+
+        # The results of the input step depend on the output directory
+        # (think cssrewrite), so they can only be shared for outputs in the
+        # same one.
+        merged_key = path.dirname(output[0])
+        if merged is not None and merged_key in merged:
+            hunks = merged[merged_key]
+        else:
+            hunks = self._apply_input(
+                ctx, output, force, current_debug_level, filtertool,
+                filters_to_run, filters_to_pass_down, disable_cache,
+                hunk_store)
+            if merged is not None:
+                merged[merged_key] = hunks
+
+        # If this bundle is empty (if it has nested bundles, they did
+        # not yield any hunks either), return None to indicate so.
+        if len(hunks) == 0:
+            return None
+
+        # Merge the individual files together. There is an optional hook for
+        # a filter here, by implementing a concat() method.
+        try:
+            try:
+                final = filtertool.apply_func(filters_to_run, 'concat', [hunks])
+            except MoreThanOneFilterError as e:
+                raise BuildError(e)
+            except NoFilters:
+                workers = 0 if ctx.streaming else (ctx.output_workers or 0)
+                if ctx.per_file_output or workers:
+                    # Output filters which give the same result either way
+                    # are applied to each file, so that they can be cached
+                    # per file, or run in parallel.
+                    distributed = _distributive_prefix(selected_filters)
+                    if distributed:
+                        hunks = _apply_distributed(
+                            filtertool, hunks, distributed, workers)
+                        selected_filters = selected_filters[len(distributed):]
+                final = merge([h for h, _ in hunks], lazy=ctx.streaming)
+        except IOError as e:
+            # IOErrors can be raised here if hunks are loaded for the
+            # first time. TODO: IOErrors can also be raised when
+            # a file is read during the filter-apply phase, but we don't
+            # convert it to a BuildError there...
+            raise BuildError(e)
+
+        # Apply output filters.
+        # TODO: So far, all the situations where bundle dependencies are
+        # used/useful, are based on input filters having those dependencies. Is
+        # it even required to consider them here with respect to the cache? We
+        # might be able to run this operation with the cache on (the FilterTool
+        # being possibly configured with cache reads off).
+        return filtertool.apply(final, selected_filters, 'output')
+
+    def _apply_input(self, ctx, output, force, current_debug_level,
+                     filtertool, filters_to_run, filters_to_pass_down,
+                     disable_cache, hunk_store):
+        """Read the contents of the bundle and apply the input filters,
+        as part of ``_merge_and_apply()``. Returns a list of
+        ``(hunk, item_data)`` tuples.
+        """
+        # Prepare contents
+        resolved_contents = self.resolve_contents(ctx, force=True)
 
         # Apply input()/open() filters to all the contents.
         hunks = []
@@ -496,7 +645,8 @@ class Bundle(object):
                 # Recursively process nested bundles.
                 hunk = cnt._merge_and_apply(
                     wrap(ctx, cnt), output, force, current_debug_level,
-                    filters_to_pass_down, disable_cache=disable_cache)
+                    filters_to_pass_down, disable_cache=disable_cache,
+                    hunk_store=hunk_store)
                 if hunk is not None:
                     hunks.append((hunk, {}))
 
@@ -517,15 +667,16 @@ class Bundle(object):
                         # that reading and hashing some files unnecessarily
                         # very often is better than running filters
                         # unnecessarily occasionally.
-                        cache_key=[FileHunk(cnt)] if not is_url(cnt) else [])
+                        cache_key=[hunk_store.file(cnt)]
+                            if not is_url(cnt) else [])
                 except MoreThanOneFilterError as e:
                     raise BuildError(e)
                 except NoFilters:
                     # Open the file ourselves.
                     if is_url(cnt):
-                        hunk = UrlHunk(cnt, env=ctx)
+                        hunk = hunk_store.url(cnt, env=ctx)
                     else:
-                        hunk = FileHunk(cnt)
+                        hunk = hunk_store.file(cnt)
 
                 # With the hunk, remember both the original relative
                 # path, as specified by the user, and the one that has
@@ -537,38 +688,10 @@ class Bundle(object):
                 hunk = filtertool.apply(hunk, filters_to_run, 'input',
                                             kwargs=item_data)
                 hunks.append((hunk, item_data))
-
-        # If this bundle is empty (if it has nested bundles, they did
-        # not yield any hunks either), return None to indicate so.
-        if len(hunks) == 0:
-            return None
-
-        # Merge the individual files together. There is an optional hook for
-        # a filter here, by implementing a concat() method.
-        try:
-            try:
-                final = filtertool.apply_func(filters_to_run, 'concat', [hunks])
-            except MoreThanOneFilterError as e:
-                raise BuildError(e)
-            except NoFilters:
-                final = merge([h for h, _ in hunks])
-        except IOError as e:
-            # IOErrors can be raised here if hunks are loaded for the
-            # first time. TODO: IOErrors can also be raised when
-            # a file is read during the filter-apply phase, but we don't
-            # convert it to a BuildError there...
-            raise BuildError(e)
-
-        # Apply output filters.
-        # TODO: So far, all the situations where bundle dependencies are
-        # used/useful, are based on input filters having those dependencies. Is
-        # it even required to consider them here with respect to the cache? We
-        # might be able to run this operation with the cache on (the FilterTool
-        # being possibly configured with cache reads off).
-        return filtertool.apply(final, selected_filters, 'output')
+        return hunks
 
     def _build(self, ctx, extra_filters=None, force=None, output=None,
-               disable_cache=None):
+               disable_cache=None, merged=None):
         """Internal bundle build function.
 
         This actually tries to build this very bundle instance, as opposed to
@@ -607,17 +730,29 @@ class Bundle(object):
 
         if not update_needed:
             # We can simply return the existing output file
-            return FileHunk(self.resolve_output(ctx, self.output))
-
+            hunk = FileHunk(self.resolve_output(ctx, self.output))
+            if ctx.precompress:
+                # In case the option has just been enabled.
+                sizes, written = _precompress(
+                    ctx, self, hunk, hunk.filename, missing_only=True)
+                if written and ctx.manifest:
+                    ctx.manifest.remember_meta(
+                        self, ctx, {'compressed_sizes': sizes})
+            return hunk
+
+        # The store, and with it the source contents it holds, is released
+        # once we are done here.
         hunk = self._merge_and_apply(
             ctx, [self.output, self.resolve_output(ctx, version='?')],
-            force, disable_cache=disable_cache, extra_filters=extra_filters)
+            force, disable_cache=disable_cache, extra_filters=extra_filters,
+            hunk_store=HunkStore(read_once=not ctx.streaming), merged=merged)
         if hunk is None:
             raise BuildError('Nothing to build for %s, is empty' % self)
 
         if output:
             # If we are given a stream, just write to it.
-            output.write(hunk.data())
+            for chunk in hunk.chunks():
+                output.write(chunk)
         else:
             if has_placeholder(self.output) and not ctx.versions:
                 raise BuildError((
@@ -636,11 +771,26 @@ class Bundle(object):
             if not path.exists(output_dir):
                 os.makedirs(output_dir)
 
-            hunk.save(output_filename)
+            if not hunk.save(output_filename, fsync=ctx.output_fsync) \
+                    and not ctx.cache:
+                # Without a cache to record the time of the build in (see
+                # TimestampUpdater), the updater goes by the timestamp of
+                # the output file, so it needs to be updated.
+                os.utime(output_filename, None)
             self.version = version
+            # Computed here, from memory, so the file need not be read
+            # again when the urls are requested with SRI.
+            self._sri = calculate_sri_on_chunks(hunk.file_chunks())
+            meta = {'sri': self._sri}
+            if ctx.precompress:
+                meta['compressed_sizes'] = _precompress(
+                    ctx, self, hunk, output_filename)[0]
 
             if ctx.manifest:
                 ctx.manifest.remember(self, ctx, version)
+                ctx.manifest.remember_meta(self, ctx, meta)
+            # The urls may have changed along with the version.
+            ctx.environment._urls_changed()
             if ctx.versions and version:
                 # Hook for the versioner (for example set the timestamp of
                 # the file) to the actual version.
@@ -671,10 +821,19 @@ class Bundle(object):
         """
         ctx = wrap(self.env, self)
         hunks = []
-        for bundle, extra_filters, new_ctx in self.iterbuild(ctx):
-            hunks.append(bundle._build(
-                new_ctx, extra_filters, force=force, output=output,
-                disable_cache=disable_cache))
+        with using_hash_algorithm(ctx.hash_algorithm):
+            for bundle, extra_filters, new_ctx in self.iterbuild(ctx):
+                # Additional outputs share the results of the input step.
+                merged = {}
+                hunks.append(bundle._build(
+                    new_ctx, extra_filters, force=force, output=output,
+                    disable_cache=disable_cache, merged=merged))
+                if output is None:
+                    for variant in bundle.outputs.values():
+                        hunks.append(variant._build(
+                            wrap(new_ctx, variant), extra_filters,
+                            force=force, disable_cache=disable_cache,
+                            merged=merged))
         return hunks
 
     def iterbuild(self, ctx):
@@ -727,6 +886,25 @@ class Bundle(object):
             url = "%s?%s" % (url, version)
         return url
 
+    def _output_sri(self, ctx):
+        """Return the SRI string of the output file, as computed when it
+        was built, by this process or, via the manifest, another one.
+        Only if neither knows it, the file is hashed.
+
+        The value from the manifest is not kept on the bundle; like the
+        version, it is kept in the url index of ``compile_urls()``.
+        """
+        sri = None
+        # Another process may have built the bundle since.
+        if ctx.manifest:
+            sri = ctx.manifest.query_meta(self, ctx).get('sri')
+        if sri is None:
+            sri = self._sri
+        if sri is None:
+            sri = cached_sri_on_file(
+                ctx.resolver.resolve_output_to_path(ctx, self.output, self))
+        return sri
+
     def _urls(self, ctx, extra_filters, *args, **kwargs):
         """Return a list of urls for this bundle, and all subbundles,
         and, when it becomes necessary, start a build process.
@@ -762,7 +940,7 @@ class Bundle(object):
                             *args, **kwargs)
             if calculate_sri:
                 return [{'uri': self._make_output_url(ctx),
-                         'sri': calculate_sri_on_file(ctx.resolver.resolve_output_to_path(ctx, self.output, self))}]
+                         'sri': self._output_sri(ctx)}]
             else:
                 return [self._make_output_url(ctx)]
         else:
@@ -789,7 +967,7 @@ class Bundle(object):
                     try:
                         url = ctx.resolver.resolve_source_to_url(ctx, cnt, org)
                         if calculate_sri:
-                            sri = calculate_sri_on_file(ctx.resolver.resolve_output_to_path(ctx, cnt, org))
+                            sri = cached_sri_on_file(ctx.resolver.resolve_output_to_path(ctx, cnt, org))
                     except ValueError:
                         # If we cannot generate a url to a path outside the
                         # media directory. So if that happens, we copy the
@@ -797,7 +975,7 @@ class Bundle(object):
                         external = pull_external(ctx, cnt)
                         url = ctx.resolver.resolve_source_to_url(ctx, external, org)
                         if calculate_sri:
-                            sri = calculate_sri_on_file(ctx.resolver.resolve_output_to_path(ctx, external, org))
+                            sri = cached_sri_on_file(ctx.resolver.resolve_output_to_path(ctx, external, org))
 
                     if calculate_sri:
                         urls.append({'uri': url, 'sri': sri})
@@ -822,38 +1000,260 @@ class Bundle(object):
                  true: list of {'uri': '<uri>', 'sri': '<sri-hash>'}.
         """
         ctx = wrap(self.env, self)
+        if not args and set(kwargs) <= set(['calculate_sri']):
+            urls = ctx.environment.query_url_index(self, ctx, **kwargs)
+            if urls is not None:
+                return urls
+
         urls = []
-        for bundle, extra_filters, new_ctx in self.iterbuild(ctx):
-            urls.extend(bundle._urls(new_ctx, extra_filters, *args, **kwargs))
+        with using_hash_algorithm(ctx.hash_algorithm):
+            for bundle, extra_filters, new_ctx in self.iterbuild(ctx):
+                urls.extend(
+                    bundle._urls(new_ctx, extra_filters, *args, **kwargs))
         return urls
 
 
+class BundleOutput(Bundle):
+    """An additional output of a bundle, see :attr:`Bundle.outputs`.
+
+    It has the contents and configuration of the bundle it belongs to,
+    but its own output target and output filters.
+    """
+
+    def __init__(self, bundle, name, output=None, filters=None):
+        self.bundle = bundle
+        self.name = name
+        Bundle.__init__(self, output=output, filters=filters)
+
+    @property
+    def config(self):
+        return self.bundle.config
+
+    def __repr__(self):
+        return "<%s %s of %r>" % (
+            self.__class__.__name__, self.name, self.bundle)
+
+    def _get_contents(self):
+        return self.bundle.contents
+    def _set_contents(self, value):
+        if value:
+            raise BundleError('The contents are those of %s' % self.bundle)
+        self._id_memo = None
+    contents = property(_get_contents, _set_contents)
+
+    def _get_env(self):
+        if self._env is None:
+            return self.bundle.env
+        return self._env
+    env = property(_get_env, Bundle.env.fset)
+
+    @property
+    def outputs(self):
+        return {}
+
+    @outputs.setter
+    def outputs(self, value):
+        if value:
+            raise BundleError('Outputs cannot have outputs of their own')
+
+    def resolve_contents(self, ctx=None, force=False):
+        return self.bundle.resolve_contents(ctx, force=force)
+
+    def resolve_depends(self, ctx):
+        return self.bundle.resolve_depends(ctx)
+
+    def id(self):
+        if self._env is None and self.bundle._env is not None:
+            with using_hash_algorithm(self.bundle._env.hash_algorithm):
+                return self._id()
+        return Bundle.id(self)
+
+    def _id(self):
+        return hash_func((self.bundle.id(), self.output,
+                          tuple([f.id() for f in self.filters])))
+
+    def _merge_and_apply(self, ctx, output, force, parent_debug=None,
+                         parent_filters=None, extra_filters=None,
+                         disable_cache=None, hunk_store=None,
+                         output_filters=None, merged=None):
+        return self.bundle._merge_and_apply(
+            ctx, output, force, parent_debug, parent_filters, extra_filters,
+            disable_cache, hunk_store, output_filters=self.filters,
+            merged=merged)
+
+
+def _compress_gz(data):
+    # A fixed mtime keeps the result the same for the same content.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _compress_br(data):
+    try:
+        import brotli
+    except ImportError:
+        raise EnvironmentError(
+            'The "brotli" package is required for the "br" format of the '
+            'precompress option.')
+    return brotli.compress(data)
+
+
+_COMPRESSORS = {'gz': _compress_gz, 'br': _compress_br}
+
+
+def _precompress(ctx, bundle, hunk, filename, missing_only=False):
+    """Write the compressed copies of the output ``hunk``, stored at
+    ``filename``, which :attr:`Environment.precompress` asks for. Returns
+    their sizes, for the manifest, and whether any copy was written.
+
+    A copy is only compressed again if the content changed since, as far as
+    the cache remembers. With ``missing_only``, only copies which do not
+    exist yet are written; this is checked before anything else, as it
+    happens every time an up to date bundle is looked at.
+    """
+    formats = ctx.precompress
+    if isinstance(formats, str):
+        formats = [formats]
+    for format in formats:
+        if format not in _COMPRESSORS:
+            raise BuildError('Unknown precompress format: %s' % format)
+
+    targets = [(format, '%s.%s' % (filename, format)) for format in formats]
+    if missing_only:
+        todo = [item for item in targets if not path.exists(item[1])]
+        if not todo:
+            return None, False
+        digest = hunk.id()
+    else:
+        digest = hunk.id()
+        todo = [item for item in targets if not (
+            path.exists(item[1]) and ctx.cache and
+            ctx.cache.get(('precompress', item[1])) == digest)]
+
+    if todo:
+        data = hunk.data_bytes()
+        # zlib and brotli release the GIL, so threads can compress the
+        # formats in parallel.
+        with ThreadPoolExecutor(max_workers=len(todo)) as executor:
+            results = list(executor.map(
+                lambda item: _COMPRESSORS[item[0]](data), todo))
+        for (format, target), compressed in zip(todo, results):
+            write_file(target, lambda: [compressed], fsync=ctx.output_fsync)
+            if ctx.cache:
+                ctx.cache.set(('precompress', target), digest)
+
+    sizes = {}
+    for format, target in targets:
+        if path.exists(target):
+            sizes[format] = os.stat(target).st_size
+    return sizes, bool(todo)
+
+
+EXTERNAL_DIRECTORY = 'webassets-external'
+
+
+def _external_name(filename):
+    # Use a hash to keep it unique and short, but attach the base filename
+    # for readability.
+    return "%s_%s" % (hash_func(filename), path.basename(filename))
+
+
+def _stat_stamp(filename):
+    st = os.stat(filename)
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+# The stat() values of the source and target files after they were last
+# pulled in by this process, by target filename.
+_external_index = {}
+
+
+def _external_is_fresh(filename, full_path):
+    try:
+        source, target = _stat_stamp(filename), _stat_stamp(full_path)
+    except OSError:
+        return False
+    if _external_index.get(full_path) == (source, target):
+        return True
+    # Otherwise, it may have been pulled in by another process: then it is
+    # either a hard link to the source, or a copy with its size and mtime.
+    return source == target or source[1:] == target[1:]
+
+
 def pull_external(ctx, filename):
     """Helper which will pull ``filename`` into
     :attr:`Environment.directory`, for the purposes of being able to
     generate a url for it.
+
+    The file is linked or copied there without being read by Python, see
+    :func:`webassets.utils.link_or_copy`, and only if it changed since.
     """
+    full_path = path.join(
+        ctx.directory, EXTERNAL_DIRECTORY, _external_name(filename))
 
-    # Generate the target filename. Use a hash to keep it unique and short,
-    # but attach the base filename for readability.
-    # The bit-shifting rids us of ugly leading - characters.
-    hashed_filename = hash_func(filename)
-    rel_path = path.join('webassets-external',
-        "%s_%s" % (hashed_filename, path.basename(filename)))
-    full_path = path.join(ctx.directory, rel_path)
-
-    # Copy the file if necessary
-    if path.isfile(full_path):
-        gs = lambda p: os.stat(p).st_mtime
-        if gs(full_path) > gs(filename):
-            return full_path
+    if _external_is_fresh(filename, full_path):
+        return full_path
     directory = path.dirname(full_path)
     if not path.exists(directory):
         os.makedirs(directory)
-    FileHunk(filename).save(full_path)
+    link_or_copy(filename, full_path)
+    _external_index[full_path] = (
+        _stat_stamp(filename), _stat_stamp(full_path))
     return full_path
 
 
+def collect_external(env):
+    """Delete the files in the ``webassets-external`` directory which
+    :func:`pull_external` no longer needs, since none of the bundles of
+    the environment ``env`` contain their source file anymore, along with
+    the leftovers of interrupted copies. Returns the deleted filenames.
+    """
+    directory = path.join(env.directory, EXTERNAL_DIRECTORY)
+    if not path.isdir(directory):
+        return []
+
+    with using_hash_algorithm(env.hash_algorithm):
+        needed = set()
+        for bundle in env:
+            for filename in get_all_bundle_files(bundle, wrap(env, bundle)):
+                needed.add(_external_name(filename))
+
+    deleted = []
+    for name in os.listdir(directory):
+        if name in needed:
+            continue
+        full_path = path.join(directory, name)
+        if not path.isfile(full_path):
+            continue
+        os.unlink(full_path)
+        _external_index.pop(full_path, None)
+        deleted.append(full_path)
+    return deleted
+
+
+def warmup_bundle(bundle, env):
+    """Resolve the contents of ``bundle``, as ``Environment.warmup()`` does
+    for all bundles. With ``auto_build``, the filters of the bundle and its
+    children are set up as well.
+
+    Nothing is built and the manifest is not touched, so that this may run
+    for several bundles in parallel.
+    """
+    ctx = wrap(env, bundle)
+    with using_hash_algorithm(ctx.hash_algorithm):
+        get_all_bundle_files(bundle, ctx)
+        if ctx.auto_build:
+            _warmup_filters(bundle, ctx)
+
+
+def _warmup_filters(bundle, ctx):
+    for filter in bundle.filters:
+        filter.set_context(ctx)
+        _setup_filter(filter, ctx)
+    for _, child in bundle.resolve_contents(ctx):
+        if isinstance(child, Bundle):
+            _warmup_filters(child, wrap(ctx, child))
+
+
 def get_all_bundle_files(bundle, ctx=None):
     """Return a flattened list of all source files of the given bundle, all
     its dependencies, recursively for all nested bundles.
@@ -875,6 +1275,81 @@ def get_all_bundle_files(bundle, ctx=None):
     return files
 
 
+def _setup_filter(filter, ctx):
+    """Call ``filter.setup()``, unless it has already been set up with the
+    configuration of ``ctx`` as it currently is.
+
+    Setup can be costly (config lookups, module imports, searching for
+    binaries), and builds or ``auto_build`` checks would otherwise repeat it
+    for every bundle, every time.
+
+    OS environment variables read through ``Filter.get_config()`` are part
+    of the configuration; a filter reading ``os.environ`` by itself only
+    sees changes after ``ConfigStorage.touch()``.
+    """
+    version = ctx.config_version
+    if version is None or getattr(filter, '_setup_version', None) != version \
+            or any(os.environ.get(name) != value
+                   for name, value in filter._environ_read.items()):
+        filter._environ_read = {}
+        filter.setup()
+        filter._setup_version = version
+
+
+def _distributive_prefix(filters):
+    """Return the leading filters among ``filters`` which have an
+    ``output()`` method that may be applied to each file separately (see
+    ``Filter.concat_distributive``).
+    """
+    prefix = []
+    for filter in filters:
+        if not getattr(filter, 'output', None):
+            # Does not take part in the output step at all.
+            prefix.append(filter)
+        elif getattr(filter, 'concat_distributive', False):
+            prefix.append(filter)
+        else:
+            break
+    # Only filters actually doing something are worth distributing.
+    while prefix and not getattr(prefix[-1], 'output', None):
+        prefix.pop()
+    return prefix
+
+
+def _apply_distributed(filtertool, hunks, filters, workers):
+    """Apply the output ``filters``, which are concat-distributive, to each
+    of ``hunks`` separately, in up to ``workers`` processes.
+
+    If the filters can even be applied to each CSS rule, large hunks are
+    split further, so that the work is spread more evenly.
+    """
+    if not workers:
+        return [(filtertool.apply(h, filters, 'output'), data)
+                for h, data in hunks]
+
+    by_rule = all(getattr(f, 'concat_distributive', False) == 'rules'
+                  for f in filters if getattr(f, 'output', None))
+    pieces, counts = [], []
+    for hunk, _ in hunks:
+        if by_rule:
+            parts = [MemoryHunk(p) for p in split_css_rules(hunk.data())]
+        else:
+            parts = [hunk]
+        pieces.extend(parts)
+        counts.append(len(parts))
+
+    results = filtertool.apply_parallel(pieces, filters, 'output', workers)
+    distributed = []
+    start = 0
+    for (hunk, data), count in zip(hunks, counts):
+        parts = results[start:start + count]
+        start += count
+        if count > 1:
+            parts = [MemoryHunk(''.join(p.data() for p in parts))]
+        distributed.append((parts[0], data))
+    return distributed
+
+
 def _effective_debug_level(ctx, bundle, extra_filters=None, default=None):
     """This is a helper used both in the urls() and the build() recursions.
 
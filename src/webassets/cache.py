@@ -13,14 +13,15 @@ classes in this module provide the "environment.cache" object, but
 also serve in other places.
 """
 
+import contextlib
 import os
 from os import path
 import errno
 import tempfile
 import warnings
-from webassets.merge import BaseHunk
 from webassets.filter import Filter, freezedicts
-from webassets.utils import md5_constructor, pickle
+from webassets.utils import (
+    function_digest, get_hash_algorithm, pickle, using_hash_algorithm)
 import types
 
 
@@ -33,15 +34,16 @@ def make_hashable(data):
     Mostly needs to support dict. The other special types we use
     as hash keys (Hunks, Filters) already have a proper hash() method.
 
-    See also ``make_md5``.
+    See also ``make_digest``.
 
     Note that we do not actually hash the data for the memory cache.
     """
     return freezedicts(data)
 
 
-def make_md5(*data):
-    """Make a md5 hash based on``data``.
+def make_digest(*data):
+    """Make a hash based on``data``, using the hash algorithm currently
+    in effect (md5 by default, see ``utils.using_hash_algorithm``).
 
     Specifically, this knows about ``Hunk`` objects, and makes sure
     the actual content is hashed.
@@ -51,38 +53,57 @@ def make_md5(*data):
     we had in the past some debugging headaches with the cache not
     working for this very reason.
 
-    MD5 is faster than sha, and we don't care so much about collisions.
-    We care enough however not to use hash().
+    Other types can take part by implementing a ``__webassets_digest__()``
+    method, returning a string that identifies the object's content (or
+    any other value supported here). Hunks, filters and bundles do this,
+    and memoize the result, so that they do not need to be hashed again
+    every time they are part of a key.
+
+    We don't care so much about collisions, which is why MD5 is an
+    acceptable default, and faster algorithms may be configured. We care
+    enough however not to use hash().
     """
-    def walk(obj):
-        if isinstance(obj, (tuple, list, frozenset)):
-            for item in obj:
-                for d in walk(item): yield d
-        elif isinstance(obj, (dict)):
-            for k in sorted(obj.keys()):
-                for d in walk(k): yield d
-                for d in walk(obj[k]): yield d
-        elif isinstance(obj, BaseHunk):
-            yield obj.data().encode('utf-8')
-        elif isinstance(obj, int):
-            yield str(obj).encode('utf-8')
-        elif isinstance(obj, str):
-            yield obj.encode('utf-8')
-        elif isinstance(obj, bytes):
-            yield obj
-        elif hasattr(obj, "id"):
-            for i in walk(obj.id()):
-                yield i
-        elif obj is None:
-            yield "None".encode('utf-8')
-        elif isinstance(obj, types.FunctionType):
-            yield str(hash(obj)).encode('utf-8')
-        else:
-            raise ValueError('Cannot MD5 type %s' % type(obj))
-    md5 = md5_constructor()
-    for d in walk(data):
-        md5.update(d)
-    return md5.hexdigest()
+    hasher = get_hash_algorithm()[1]()
+    _feed_digest(hasher.update, data)
+    return hasher.hexdigest()
+
+
+# Kept for backwards compatibility; despite the name, it uses the
+# hash algorithm currently in effect.
+make_md5 = make_digest
+
+
+def _feed_digest(update, obj):
+    """Pass the byte representation of ``obj`` to ``update``, see
+    ``make_digest``.
+    """
+    if isinstance(obj, str):
+        update(obj.encode('utf-8'))
+    elif isinstance(obj, (tuple, list, frozenset)):
+        for item in obj:
+            _feed_digest(update, item)
+    elif isinstance(obj, (dict)):
+        for k in sorted(obj.keys()):
+            _feed_digest(update, k)
+            _feed_digest(update, obj[k])
+    elif hasattr(type(obj), '__webassets_digest__'):
+        _feed_digest(update, obj.__webassets_digest__())
+    elif isinstance(obj, int):
+        update(str(obj).encode('utf-8'))
+    elif isinstance(obj, bytes):
+        update(obj)
+    elif hasattr(obj, "id"):
+        _feed_digest(update, obj.id())
+    elif obj is None:
+        update("None".encode('utf-8'))
+    elif isinstance(obj, types.FunctionType):
+        # Prefer an identity that is stable across processes.
+        digest = function_digest(obj)
+        if digest is None:
+            digest = str(hash(obj))
+        update(digest.encode('utf-8'))
+    else:
+        raise ValueError('Cannot MD5 type %s' % type(obj))
 
 
 def safe_unpickle(string):
@@ -107,6 +128,18 @@ class BaseCache(object):
     One cache instance can only be used safely with a single Environment.
     """
 
+    # The environment the cache belongs to, set by ``get_cache()``. The
+    # keys are hashed with its ``hash_algorithm``, not with whichever one
+    # is in effect where the cache is used.
+    env = None
+
+    def hashing(self):
+        """Return a context manager in which the keys are to be hashed.
+        """
+        if self.env is None:
+            return contextlib.nullcontext()
+        return using_hash_algorithm(self.env.hash_algorithm)
+
     def get(self, key):
         """Should return the cache contents, or False.
         """
@@ -141,11 +174,13 @@ class MemoryCache(BaseCache):
                id(self) == id(other)
 
     def get(self, key):
-        key = make_md5(make_hashable(key))
+        with self.hashing():
+            key = make_digest(make_hashable(key))
         return self.cache.get(key, None)
 
     def set(self, key, value):
-        key = make_md5(make_hashable(key))
+        with self.hashing():
+            key = make_digest(make_hashable(key))
         self.cache[key] = value
         try:
             self.keys.remove(key)
@@ -164,7 +199,7 @@ class FilesystemCache(BaseCache):
     """Uses a temporary directory on the disk.
     """
 
-    V = 2   # We have changed the cache format once
+    V = 3   # We have changed the cache format twice
 
     def __init__(self, directory, new_file_mode=None):
         self.directory = directory
@@ -178,8 +213,14 @@ class FilesystemCache(BaseCache):
                self.directory == other or \
                id(self) == id(other)
 
+    def _filename(self, key):
+        # Include the hash algorithm, so that entries written with a
+        # different one are never misread.
+        with self.hashing():
+            return '%s' % make_digest(self.V, get_hash_algorithm()[0], key)
+
     def get(self, key):
-        filename = path.join(self.directory, '%s' % make_md5(self.V, key))
+        filename = path.join(self.directory, self._filename(key))
         try:
             f = open(filename, 'rb')
         except IOError as e:
@@ -197,9 +238,9 @@ class FilesystemCache(BaseCache):
         return unpickled
 
     def set(self, key, data):
-        md5 = '%s' % make_md5(self.V, key)
-        filename = path.join(self.directory, md5)
-        fd, temp_filename = tempfile.mkstemp(prefix='.' + md5,
+        digest = self._filename(key)
+        filename = path.join(self.directory, digest)
+        fd, temp_filename = tempfile.mkstemp(prefix='.' + digest,
                 dir=self.directory)
         try:
             with os.fdopen(fd, 'wb') as f:
@@ -224,15 +265,18 @@ def get_cache(option, ctx):
         return None
 
     if isinstance(option, BaseCache):
-        return option
+        cache = option
     elif isinstance(option, type) and issubclass(option, BaseCache):
-        return option()
-
-    if option is True:
-        directory = path.join(ctx.directory, '.webassets-cache')
-        # Auto-create the default directory
-        if not path.exists(directory):
-            os.makedirs(directory)
+        cache = option()
     else:
-        directory = option
-    return FilesystemCache(directory, ctx.cache_file_mode)
+        if option is True:
+            directory = path.join(ctx.directory, '.webassets-cache')
+            # Auto-create the default directory
+            if not path.exists(directory):
+                os.makedirs(directory)
+        else:
+            directory = option
+        cache = FilesystemCache(directory, ctx.cache_file_mode)
+    if cache.env is None:
+        cache.env = ctx
+    return cache
@@ -1,6 +1,9 @@
+import gc
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from os import path
-from itertools import chain
+from itertools import chain, count
 from webassets.utils import is_url
 
 try:
@@ -23,6 +26,12 @@ class RegisterError(Exception):
     pass
 
 
+# Source of the version numbers of configuration storages. The numbers are
+# unique across all storages in the process, so a version also identifies
+# the storage it belongs to.
+_config_versions = count(1)
+
+
 class ConfigStorage(object):
     """This is the backend which :class:`Environment` uses to store
     its configuration values.
@@ -41,10 +50,27 @@ class ConfigStorage(object):
 
     A related reason is why we don't inherit from ``dict``. It would
     require us to re-implement a whole bunch of methods, like pop() etc.
+
+    Storages are expected to call :meth:`touch` whenever a value changes;
+    webassets uses the resulting :attr:`version` to know when it needs to
+    redo work based on the configuration, like ``Filter.setup()``. If a
+    storage does not support this, it may set :attr:`version` to ``None``.
     """
 
+    version = None
+
     def __init__(self, env):
         self.env = env
+        self.touch()
+
+    def touch(self):
+        """Mark the configuration as changed.
+
+        Call this yourself after modifying a mutable configuration value
+        in place, or an OS environment variable which filters read their
+        options from.
+        """
+        self.version = next(_config_versions)
 
     def get(self, key, default=None):
         try:
@@ -444,7 +470,8 @@ class BundleRegistry(object):
 env_options = [
     'directory', 'url', 'debug', 'cache', 'updater', 'auto_build',
     'url_expire', 'versions', 'manifest', 'load_path', 'url_mapping',
-    'cache_file_mode' ]
+    'cache_file_mode', 'hash_algorithm', 'streaming', 'per_file_output',
+    'output_workers', 'precompress', 'output_fsync' ]
 
 
 class ConfigurationContext(object):
@@ -501,11 +528,119 @@ class ConfigurationContext(object):
 
     """)
 
+    def _set_hash_algorithm(self, algorithm):
+        self._storage['hash_algorithm'] = algorithm
+    def _get_hash_algorithm(self):
+        return self._storage['hash_algorithm']
+    hash_algorithm = property(_get_hash_algorithm, _set_hash_algorithm, doc=
+    """The hash algorithm used for cache keys, for the ids of bundles
+    and filters, and for the ``hash`` versioner. The default is
+    ``md5``. Possible values are:
+
+      Any algorithm name from ``hashlib``
+          For example ``blake2b`` or ``sha1``.
+
+      ``xxh64``, ``xxh3_64``, ``xxh3_128``, ...
+          The algorithms of the `xxhash <https://pypi.org/project/xxhash/>`_
+          module, which needs to be installed.
+
+      A callable
+          A constructor returning a new hash object, in the style of
+          ``hashlib.md5``.
+
+    Changing this invalidates the cache.
+    """)
+
+    def _set_streaming(self, streaming):
+        self._storage['streaming'] = streaming
+    def _get_streaming(self):
+        return self._storage['streaming']
+    streaming = property(_get_streaming, _set_streaming, doc=
+    """Build bundles without holding all of their content in memory at
+    once, which helps with very large bundles. Defaults to ``False``.
+
+    Source files are then read piece by piece as needed, and filters
+    which support it (see ``Filter.streaming``) process the content in
+    pieces, with their output going to temporary files. Other filters
+    still receive the full content. The output of streaming filters is
+    not stored in the cache.
+    """)
+
+    def _set_per_file_output(self, per_file_output):
+        self._storage['per_file_output'] = per_file_output
+    def _get_per_file_output(self):
+        return self._storage['per_file_output']
+    per_file_output = property(_get_per_file_output, _set_per_file_output,
+                               doc=
+    """Apply output filters which support it (see
+    ``Filter.concat_distributive``), like the JavaScript and CSS minifiers,
+    to each source file separately, rather than to the merged content.
+    Defaults to ``False``.
+
+    The filtered files are cached individually, so that when one of the
+    files of a large bundle changes, only this one needs to be minified
+    again. The result is usually slightly larger.
+    """)
+
+    def _set_output_workers(self, output_workers):
+        self._storage['output_workers'] = output_workers
+    def _get_output_workers(self):
+        return self._storage['output_workers']
+    output_workers = property(_get_output_workers, _set_output_workers, doc=
+    """The number of processes in which output filters which support it
+    (see ``Filter.concat_distributive``) are applied to the pieces of a
+    bundle in parallel, or ``None`` (the default) to not do so.
+
+    The pieces are the source files of the bundle, which stylesheet
+    minifiers split further at the boundaries of top-level rules. Like
+    with :attr:`per_file_output`, they are cached individually. The
+    filters need to be picklable, and are not run in parallel in
+    :attr:`streaming` mode.
+    """)
+
+    def _set_precompress(self, precompress):
+        self._storage['precompress'] = precompress
+    def _get_precompress(self):
+        return self._storage['precompress']
+    precompress = property(_get_precompress, _set_precompress, doc=
+    """A list of compressed formats, ``gz`` and/or ``br``, in which a
+    copy of each output file is written next to it, like ``app.js.gz``.
+    Web servers like nginx (with ``gzip_static``) can serve those without
+    compressing files on every request. Defaults to ``None``.
+
+    Brotli requires the `brotli <https://pypi.org/project/Brotli/>`_
+    package. If the cache is enabled, files are not compressed again when
+    the output did not change. The sizes of the compressed files are
+    recorded in the manifest, if it supports that.
+    """)
+
+    def _set_output_fsync(self, output_fsync):
+        self._storage['output_fsync'] = output_fsync
+    def _get_output_fsync(self):
+        return self._storage['output_fsync']
+    output_fsync = property(_get_output_fsync, _set_output_fsync, doc=
+    """Output files are written to a temporary file first, which then
+    replaces the old version, so they are never seen half written. And if
+    the content did not change, they are not written at all, and keep
+    their modification time.
+
+    This option controls whether the data is flushed to disk before it
+    replaces the old file: ``'file'`` (or ``True``) flushes the file,
+    ``'full'`` additionally flushes the directory containing it, which
+    makes sure the new file survives a system crash. Defaults to ``None``,
+    leaving this up to the operating system.
+    """)
+
+    # The getters below store the resolved object back into the storage, so
+    # it will not have to be resolved again. If there is nothing to resolve
+    # (the option is disabled), we do not write, to avoid needlessly
+    # changing the configuration version (see ``ConfigStorage.touch``).
+
     def _set_cache(self, enable):
         self._storage['cache'] = enable
     def _get_cache(self):
         cache = get_cache(self._storage['cache'], self)
-        if cache != self._storage['cache']:
+        if cache is not None and cache != self._storage['cache']:
             self._storage['cache'] = cache
         return cache
     cache = property(_get_cache, _set_cache, doc=
@@ -550,7 +685,7 @@ class ConfigurationContext(object):
         self._storage['manifest'] = manifest
     def _get_manifest(self):
         manifest = get_manifest(self._storage['manifest'], env=self)
-        if manifest != self._storage['manifest']:
+        if manifest is not None and manifest != self._storage['manifest']:
             self._storage['manifest'] = manifest
         return manifest
     manifest = property(_get_manifest, _set_manifest, doc=
@@ -600,7 +735,7 @@ class ConfigurationContext(object):
         self._storage['versions'] = versions
     def _get_versions(self):
         versions = get_versioner(self._storage['versions'])
-        if versions != self._storage['versions']:
+        if versions is not None and versions != self._storage['versions']:
             self._storage['versions'] = versions
         return versions
     versions = property(_get_versions, _set_versions, doc=
@@ -633,7 +768,7 @@ class ConfigurationContext(object):
         self._storage['updater'] = updater
     def get_updater(self):
         updater = get_updater(self._storage['updater'])
-        if updater != self._storage['updater']:
+        if updater is not None and updater != self._storage['updater']:
             self._storage['updater'] = updater
         return updater
     updater = property(get_updater, set_updater, doc=
@@ -741,6 +876,14 @@ class ConfigurationContext(object):
     modifying this setting directly.
     """)
 
+    @property
+    def config_version(self):
+        """Changes whenever a configuration value is modified, see
+        :meth:`ConfigStorage.touch`. ``None`` if this is not supported
+        by the storage.
+        """
+        return getattr(self._storage, 'version', None)
+
     def _set_resolver(self, resolver):
         self._storage['resolver'] = resolver
     def _get_resolver(self):
@@ -756,6 +899,15 @@ class BaseEnvironment(BundleRegistry, ConfigurationContext):
     config_storage_class = None
     resolver_class = Resolver
 
+    # See compile_urls().
+    _url_index = None
+    _url_index_bundles = ()
+    # The manifest the index was compiled with, if it tracks changes by
+    # other processes, and its generation at the time.
+    _url_index_manifest = None
+    _url_index_generation = None
+    _url_version = 0
+
     def __init__(self, **config):
         BundleRegistry.__init__(self)
         self._config = self.config_storage_class(self)
@@ -778,6 +930,12 @@ class BaseEnvironment(BundleRegistry, ConfigurationContext):
         self.config.setdefault('url_mapping', {})
         self.config.setdefault('resolver', self.resolver_class())
         self.config.setdefault('cache_file_mode', None)
+        self.config.setdefault('hash_algorithm', 'md5')
+        self.config.setdefault('streaming', False)
+        self.config.setdefault('per_file_output', False)
+        self.config.setdefault('output_workers', None)
+        self.config.setdefault('precompress', None)
+        self.config.setdefault('output_fsync', None)
 
         self.config.update(config)
 
@@ -789,6 +947,134 @@ class BaseEnvironment(BundleRegistry, ConfigurationContext):
         # a custom dictionary which won't uphold our caseless semantics.
         return self._config
 
+    def compile_urls(self, bundles=None):
+        """Determine the urls of all registered bundles, or of the given
+        ``bundles``, along with their SRI hashes, and answer
+        :meth:`Bundle.urls` from this index from then on, without touching
+        the filesystem or the manifest.
+
+        This is meant for production, once the assets have been built: no
+        builds are triggered for the bundles in the index, even with
+        :attr:`auto_build`. The index is dropped when the configuration
+        changes, or a bundle is built by this process. It is compiled
+        again when the manifest tells that another process changed it (see
+        ``Manifest.generation()``); otherwise, as with a file manifest,
+        call :meth:`refresh_urls` after new versions of the assets have
+        been deployed.
+        """
+        from .bundle import wrap
+        from .version import Manifest
+        bundles = list(self if bundles is None else bundles)
+        self._url_index = None
+        manifest = self.manifest
+        if manifest and type(manifest).generation is not Manifest.generation:
+            self._url_index_manifest = manifest
+            self._url_index_generation = manifest.generation(self)
+        else:
+            self._url_index_manifest = self._url_index_generation = None
+        index = {}
+        for bundle in bundles:
+            urls = tuple(bundle.urls(calculate_sri=True))
+            index[id(bundle)] = (
+                bundle, wrap(self, bundle).config_version, urls)
+        self._url_index = index
+        self._url_index_bundles = bundles
+
+    @property
+    def url_version(self):
+        """Changes whenever the urls of bundles may have changed, because
+        a bundle was built by this process, or :meth:`refresh_urls` was
+        called. Along with :attr:`config_version`, this tells those who
+        keep urls around when they need to ask for them again.
+        """
+        return self._url_version
+
+    def _urls_changed(self):
+        self._url_index = None
+        self._url_version += 1
+
+    def refresh_urls(self):
+        """Compile the index of urls again, for the same bundles as the
+        last call to :meth:`compile_urls`. The versions of the bundles are
+        looked up anew, and the manifest is read again.
+        """
+        if self.manifest:
+            self.manifest.reload()
+        for bundle in self._url_index_bundles:
+            bundle.version = None
+            bundle._sri = None
+        self._urls_changed()
+        self.compile_urls(self._url_index_bundles)
+
+    def warmup(self, freeze=True, workers=None):
+        """Do the work needed to answer :meth:`Bundle.urls` for all the
+        registered bundles up front: resolve their contents, load the
+        manifest, determine versions and SRI hashes, and, unless
+        :attr:`auto_build` is enabled, compile the index of urls (see
+        :meth:`compile_urls`). With :attr:`auto_build`, the filters are
+        set up as well, and any bundles which need it are built.
+
+        Call this in the master process of a preforking server, like
+        gunicorn with ``--preload``, so that the workers inherit the
+        results. With ``freeze``, :func:`gc.freeze` is called afterwards,
+        so that garbage collections in the workers do not touch, and
+        thereby copy, the memory shared with the master.
+
+        ``workers`` is the number of threads in which the contents of the
+        bundles are resolved, and their filters set up, in parallel; by
+        default, one after another. Anything involving the manifest, like
+        builds, always happens one bundle after another.
+
+        Returns a dict of the seconds each bundle took.
+        """
+        from .bundle import warmup_bundle
+        bundles = list(self)
+
+        def resolve(bundle):
+            start = time.perf_counter()
+            warmup_bundle(bundle, self)
+            return time.perf_counter() - start
+
+        if workers and workers > 1 and len(bundles) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                timings = list(executor.map(resolve, bundles))
+        else:
+            timings = [resolve(bundle) for bundle in bundles]
+
+        # Builds share the manifest, so they are not done in parallel.
+        for i, bundle in enumerate(bundles):
+            start = time.perf_counter()
+            bundle.urls(calculate_sri=True)
+            timings[i] += time.perf_counter() - start
+
+        if not self.auto_build:
+            self.compile_urls(bundles)
+        if freeze and hasattr(gc, 'freeze'):
+            gc.collect()
+            gc.freeze()
+        return dict(zip(bundles, timings))
+
+    def query_url_index(self, bundle, ctx, calculate_sri=False):
+        """Return the urls of ``bundle`` from the index built by
+        :meth:`compile_urls`, in the format of :meth:`Bundle.urls`, or
+        ``None`` if they are not in the index, or no longer valid.
+        """
+        if not self._url_index:
+            return None
+        manifest = self._url_index_manifest
+        if manifest is not None and \
+                manifest.generation(self) != self._url_index_generation:
+            self.refresh_urls()
+        entry = self._url_index and self._url_index.get(id(bundle))
+        if entry is None or entry[0] is not bundle:
+            return None
+        version = ctx.config_version
+        if version is None or version != entry[1]:
+            return None
+        if calculate_sri:
+            return [dict(url) for url in entry[2]]
+        return [url['uri'] for url in entry[2]]
+
 
 class DictConfigStorage(ConfigStorage):
     """Using a lower-case dict for configuration values.
@@ -808,8 +1094,10 @@ class DictConfigStorage(ConfigStorage):
         key = key.lower()
         if not self._set_deprecated(key, value):
             self._dict.__setitem__(key.lower(), value)
+        self.touch()
     def __delitem__(self, key):
         self._dict.__delitem__(key.lower())
+        self.touch()
 
 
 class Environment(BaseEnvironment):
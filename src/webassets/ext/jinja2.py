@@ -1,9 +1,14 @@
+import threading
 import warnings
+from collections import OrderedDict
+
 import jinja2
 from jinja2.ext import Extension
 from jinja2 import nodes
 from webassets import Bundle
+from webassets.bundle import wrap
 from webassets.loaders import GlobLoader, LoaderError
+from webassets.version import Manifest
 from webassets.exceptions import ImminentDeprecationWarning
 
 
@@ -24,8 +29,13 @@ class AssetsExtension(Extension):
 
     BundleClass = Bundle   # Helpful for mocking during tests.
 
+    # How many bundles constructed for the tags are kept, see _get_bundle().
+    BUNDLE_CACHE_SIZE = 512
+
     def __init__(self, environment):
         super(AssetsExtension, self).__init__(environment)
+        self._bundles = OrderedDict()
+        self._bundles_lock = threading.Lock()
 
         # Add the defaults to the environment
         environment.extend(
@@ -164,11 +174,28 @@ class AssetsExtension(Extension):
                 result.append(f)
         return result
 
-    def _render_assets(self, filter, output, dbg, depends, files, caller=None):
-        env = self.environment.assets_environment
-        if env is None:
-            raise RuntimeError('No assets environment configured in '+
-                               'Jinja2 environment')
+    def _get_bundle(self, env, filter, output, dbg, depends, files):
+        """Return the cache entry for the bundle with the given options.
+
+        The same bundle is used every time the tag is rendered with these
+        options, so that it does not have to set itself up again, like a
+        bundle registered with the environment. As renders may happen in
+        several threads at once, the bundle is connected to ``env`` for
+        good, rather than bound for each render.
+        """
+        contents = self.resolve_contents(files, env)
+        key = (id(env), _freeze((filter, output, dbg, depends, contents)))
+        try:
+            hash(key)
+        except TypeError:
+            # Options which cannot be hashed, a new bundle it is.
+            key = None
+        if key is not None:
+            with self._bundles_lock:
+                entry = self._bundles.get(key)
+                if entry is not None and entry['env'] is env:
+                    self._bundles.move_to_end(key)
+                    return entry
 
         # Construct a bundle with the given options
         bundle_kwargs = {
@@ -177,12 +204,63 @@ class AssetsExtension(Extension):
             'debug': dbg,
             'depends': depends
         }
-        bundle = self.BundleClass(
-            *self.resolve_contents(files, env), **bundle_kwargs)
+        entry = {'env': env, 'bundle': self.BundleClass(
+            *contents, env=env, **bundle_kwargs)}
+        if key is not None:
+            with self._bundles_lock:
+                self._bundles[key] = entry
+                # Evict the bundle least recently used.
+                while len(self._bundles) > self.BUNDLE_CACHE_SIZE:
+                    self._bundles.popitem(last=False)
+        return entry
+
+    def _get_urls(self, env, entry):
+        """Return the urls of the bundle of the cache ``entry``, which
+        are kept until the configuration changes, or a build or a call to
+        ``Environment.refresh_urls()`` may have changed them, or the
+        manifest was changed by another process, as far as it is able to
+        tell (see ``Manifest.generation()``; with a file manifest, which is
+        read only once, call ``Environment.refresh_urls()`` after a
+        deployment).
+
+        With ``auto_build``, the urls are never kept, so that the bundle
+        is checked for changes every time.
+        """
+        bundle = entry['bundle']
+        ctx = wrap(env, bundle)
+        version = ctx.config_version
+        if ctx.auto_build or version is None:
+            return bundle.urls(calculate_sri=True)
+        if entry.get('config_version') != version:
+            # Resolving a manifest given by name reads it; this is done
+            # once per configuration, and only manifests which track
+            # their generation are asked for it.
+            manifest = ctx.manifest
+            if manifest and type(manifest).generation is Manifest.generation:
+                manifest = None
+            entry['manifest'], entry['config_version'] = manifest, version
+        manifest = entry['manifest']
+        token = (version, env.url_version,
+                 manifest.generation(ctx) if manifest else None)
+        if entry.get('token') != token:
+            if 'token' in entry:
+                # The version kept by the bundle may be outdated as well.
+                bundle.version = None
+            entry['urls'] = bundle.urls(calculate_sri=True)
+            entry['token'] = token
+        return entry['urls']
+
+    def _render_assets(self, filter, output, dbg, depends, files, caller=None):
+        env = self.environment.assets_environment
+        if env is None:
+            raise RuntimeError('No assets environment configured in '+
+                               'Jinja2 environment')
+
+        entry = self._get_bundle(env, filter, output, dbg, depends, files)
+        bundle = entry['bundle']
 
         # Retrieve urls (this may or may not cause a build)
-        with bundle.bind(env):
-            urls = bundle.urls(calculate_sri=True)
+        urls = self._get_urls(env, entry)
 
         # For each url, execute the content of this template tag (represented
         # by the macro ```caller`` given to use by Jinja2).
@@ -198,6 +276,15 @@ class AssetsExtension(Extension):
 assets = AssetsExtension  # nicer import name
 
 
+def _freeze(value):
+    """Turn the lists in the tag options ``value`` into tuples, so it can
+    be used as a dict key.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
 class Jinja2Loader(GlobLoader):
     """Parse all the Jinja2 templates in the given directory, try to
     find bundles in active use.
@@ -2,12 +2,16 @@
 contents (think minification, compression).
 """
 
+import codecs
+import io
 import os
 import subprocess
 import inspect
 import shlex
+import shutil
 import tempfile
-import pkgutil
+import threading
+import types
 from webassets import six
 try:
     frozenset
@@ -15,7 +19,7 @@ except NameError:
     from sets import ImmutableSet as frozenset
 from webassets.exceptions import FilterError
 from webassets.importlib import import_module
-from webassets.utils import hash_func
+from webassets.utils import function_digest, get_hash_algorithm, hash_func
 
 
 __all__ = ('Filter', 'CallableFilter', 'get_filter', 'register_filter',
@@ -124,6 +128,44 @@ class Filter(object):
     # it's own output target just for those files that need the compilation.
     max_debug_level = False
 
+    # Whether the filter can process content piece by piece. If set, in
+    # streaming mode (see ``Environment.streaming``), the ``_in`` stream
+    # passed to the filter pulls in the content only as it is read, and
+    # ``out`` is backed by a temporary file. Such a filter should avoid
+    # ``_in.read()`` without a size, which would load everything at once.
+    # Other filters are given the full content in memory, as usual.
+    streaming = False
+
+    # Whether the filter works with bytes (UTF-8) rather than strings. The
+    # ``_in`` and ``out`` streams are then binary. This saves decoding and
+    # encoding for filters which pass the content along to an external
+    # tool, for example.
+    bytes_capable = False
+
+    # Whether the ``output()`` of the filter may be applied to each part of
+    # the content separately, giving an equivalent result to applying it
+    # to the merged content. This is true for most minifiers. With
+    # ``Environment.per_file_output``, such output filters then run on
+    # each source file, and are cached per file. Stylesheet filters which
+    # may even be applied to each top-level rule separately can say
+    # ``'rules'``; see ``Environment.output_workers``.
+    concat_distributive = False
+
+    # The filter methods (``input``, ``output``) which ``transform()``
+    # implements. Instead of going through those, a chain of filters then
+    # passes the content along as plain strings.
+    transforms = ()
+
+    # Adjacent filters in a chain with the same (not ``None``) key can
+    # apply their ``transform()`` together, through a classmethod
+    # ``transform_fused(filters, text, **kw)`` of the first filter. See
+    # ``CSSUrlRewriter``, which rewrites url() statements in a single pass.
+    fusion_key = None
+
+    # The OS environment variables ``get_config()`` read during
+    # ``setup()``, with their values, so that a change is noticed.
+    _environ_read = {}
+
     def __init__(self, **kwargs):
         self.ctx = None
         self._options = parse_options(self.__class__.options)
@@ -147,6 +189,29 @@ class Filter(object):
             return self.id() == other.id()
         return NotImplemented
 
+    def __getstate__(self):
+        # Filters are pickled to run them in other processes (see
+        # ``Environment.output_workers``), after setup() has been called.
+        # The context stays behind, and modules that setup() stored on
+        # the instance are imported again when unpickling.
+        state = self.__dict__.copy()
+        state['ctx'] = None
+        modules = {}
+        for key, value in list(state.items()):
+            if isinstance(value, types.ModuleType):
+                modules[key] = value.__name__
+                del state[key]
+            elif key.endswith('_memo'):
+                del state[key]
+        state['_pickled_modules'] = modules
+        return state
+
+    def __setstate__(self, state):
+        modules = state.pop('_pickled_modules', {})
+        self.__dict__.update(state)
+        for key, name in modules.items():
+            setattr(self, key, import_module(name))
+
     def set_context(self, ctx):
         """This is called before the filter is used."""
         self.ctx = ctx
@@ -191,6 +256,8 @@ class Filter(object):
 
         if value is None and not env is False:
             value = os.environ.get(env)
+            if self._environ_read is not Filter._environ_read:
+                self._environ_read[env] = value
             if value is not None:
                 if type == list:
                     value = smartsplit(value, ',')
@@ -227,7 +294,32 @@ class Filter(object):
         """
         # freezedicts() allows filters to return dict objects as part
         # of unique(), which are not per-se supported by hash().
-        return hash_func((self.name, freezedicts(self.unique()),))
+        unique = freezedicts(self.unique())
+        # Hashing is memoized for as long as unique() does not change.
+        snapshot = (get_hash_algorithm()[0], self.name, unique)
+        memo = getattr(self, '_id_memo', None)
+        if memo is not None and memo[0] == snapshot:
+            return memo[1]
+        digest = hash_func((self.name, unique,))
+        self._id_memo = (snapshot, digest)
+        return digest
+
+    def __webassets_digest__(self):
+        return self.id()
+
+    def tool_fingerprint(self):
+        """Identifies the version of any external tooling this filter
+        depends on, like a binary or a ``.jar`` file.
+
+        The value is included in the cache key of this filter's results,
+        such that upgrading the tool invalidates those cache entries,
+        and only those. Return ``None`` (the default) if the filter does
+        not depend on anything outside of Python.
+
+        Unlike :meth:`id`, this is allowed to change between Python
+        invocations. It is called after :meth:`setup`.
+        """
+        return None
 
     def setup(self):
         """Overwrite this to have the filter do initial setup work,
@@ -242,7 +334,11 @@ class Filter(object):
         want to use options as well, don't forget to call super().
 
         Note: This may be called multiple times if one filter instance
-        is used with different asset environment instances.
+        is used with different asset environment instances. During a
+        build, it is called again only if the configuration, or an OS
+        environment variable read through ``get_config()``, has changed
+        since. Call ``ConfigStorage.touch()`` if the filter depends on
+        anything else.
         """
         for attribute, (_, configvar, type) in self._options.items():
             if not configvar:
@@ -266,6 +362,14 @@ class Filter(object):
         This will be called for every output file.
         """
 
+    def transform(self, text, **kw):
+        """Implement your actual filter here, as a function of strings.
+
+        This is called instead of the methods listed in ``transforms``,
+        which should do the same thing, and is given the content as a
+        string rather than a stream. Return the filtered content.
+        """
+
     def open(self, out, source_path, **kw):
         """Implement your actual filter here.
 
@@ -301,9 +405,21 @@ class Filter(object):
 
         return []
 
+    def get_content_cache_keys(self, hunk, **kw):
+        """Additional cache keys dependent on the content the filter is
+        applied to, given as ``hunk``, like the files it references.
+
+        Only called for the ``input()`` and ``output()`` methods, with the
+        same keyword arguments as ``get_additional_cache_keys()``. Avoid
+        ``hunk.data()``, which holds all of the content in memory; iterate
+        over ``hunk.chunks()`` instead.
+        """
+        return []
+
     # We just declared those for demonstration purposes
     del input
     del output
+    del transform
     del open
     del concat
 
@@ -311,22 +427,30 @@ class Filter(object):
 class CallableFilter(Filter):
     """Helper class that create a simple filter wrapping around
     callable.
+
+    To be able to cache the filter's results across processes, it needs
+    an identity that does not change between them. For plain functions,
+    this is derived from their name and code; otherwise, or to be
+    explicit, you may pass a ``cache_id``. It should change whenever the
+    behaviour of the callable changes.
     """
 
-    def __init__(self, callable):
+    def __init__(self, callable, cache_id=None):
         super(CallableFilter, self).__init__()
         self.callable = callable
+        self.cache_id = cache_id
 
     def unique(self):
-        # XXX This means the cache will never work for those filters.
-        # This is actually a deeper problem: Originally unique() was
-        # used to remove duplicate filters. Now it is also for the cache
-        # key. The latter would benefit from ALL the filter's options being
-        # included. Possibly this might just be what we should do, at the
-        # expense of the "remove duplicates" functionality (because it
-        # is never really needed anyway). It's also illdefined when a filter
-        # should be a removable duplicate - most options probably SHOULD make
-        # a filter no longer being considered duplicate.
+        # Originally unique() was used to remove duplicate filters. Now it
+        # is also for the cache key, so we need something that is stable
+        # across processes. If we cannot determine such a thing, fall back
+        # to the callable itself; the cache will then not work for this
+        # filter beyond the current process.
+        if self.cache_id is not None:
+            return ('cache_id', self.cache_id)
+        digest = function_digest(self.callable)
+        if digest is not None:
+            return ('callable', digest)
         return self.callable
 
     def output(self, _in, out, **kw):
@@ -408,6 +532,33 @@ class ExternalTool(six.with_metaclass(ExternalToolMetaclass, Filter)):
     argv = []
     method = None
 
+    # The executable the tool runs if none has been configured. This is
+    # only used to determine :meth:`tool_fingerprint`.
+    default_binary = None
+
+    def get_binary(self):
+        """Return the command line (as a list) that is used to invoke the
+        external tool, as far as it can be determined.
+
+        By default, this looks for an option which is configured through a
+        ``*_BIN`` setting, then falls back to :attr:`default_binary`, and
+        finally to the first item of ``argv``.
+        """
+        for attribute, (_, configvar, _) in self._options.items():
+            if configvar and configvar.upper().endswith('_BIN'):
+                value = getattr(self, attribute, None)
+                if value:
+                    return (list(value) if isinstance(value, (list, tuple))
+                            else self.parse_binary(value))
+        if self.default_binary:
+            return [self.default_binary]
+        if self.argv and '{' not in self.argv[0]:
+            return [self.argv[0]]
+        return []
+
+    def tool_fingerprint(self):
+        return _fingerprint_files(self.get_binary())
+
     def open(self, out, source_path, **kw):
         self._evaluate([out, source_path], kw, out)
 
@@ -479,8 +630,15 @@ class ExternalTool(six.with_metaclass(ExternalToolMetaclass, Filter)):
                        item.format(input=input_file, output=output_file), argv))
 
         try:
+            from webassets.merge import HunkReader
+            if isinstance(data, HunkReader):
+                # Streaming mode, see ``Filter.streaming``.
+                cls._subprocess_streamed(
+                    argv, out, data, cwd, input_file, output_file)
+                return
+
             data = (data.read() if hasattr(data, 'read') else data)
-            if data is not None:
+            if isinstance(data, str):
                 data = data.encode('utf-8')
 
             if input_file.created:
@@ -513,11 +671,14 @@ class ExternalTool(six.with_metaclass(ExternalToolMetaclass, Filter)):
                         stdout.decode('utf-8').strip(),
                         stderr.decode('utf-8').strip()))
             else:
+                # A binary ``out`` is given to bytes-capable filters.
+                binary = isinstance(out, (io.BufferedIOBase, io.RawIOBase))
                 if output_file.created:
                     with open(output_file.filename, 'rb') as f:
-                        out.write(f.read().decode('utf-8'))
+                        result = f.read()
+                    out.write(result if binary else result.decode('utf-8'))
                 else:
-                    if isinstance(stdout, bytes):
+                    if isinstance(stdout, bytes) and not binary:
                         out.write(stdout.decode('utf-8'))
                     else:
                         out.write(stdout)
@@ -527,6 +688,82 @@ class ExternalTool(six.with_metaclass(ExternalToolMetaclass, Filter)):
             if input_file.created:
                 os.unlink(input_file.filename)
 
+    @classmethod
+    def _subprocess_streamed(cls, argv, out, data, cwd, input_file,
+                             output_file):
+        """Like ``subprocess()``, for a ``data`` stream that is passed to
+        the process piece by piece, with the output passed on to ``out``
+        in the same way.
+        """
+        from webassets.merge import CHUNK_SIZE
+
+        if input_file.created:
+            with open(input_file.filename, 'w', encoding='utf-8',
+                      newline='') as f:
+                shutil.copyfileobj(data, f, CHUNK_SIZE)
+            # No longer pass to stdin
+            data = None
+        try:
+            proc = subprocess.Popen(
+                argv,
+                stdout=subprocess.PIPE,
+                stdin=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                shell=os.name == 'nt')
+        except OSError:
+            raise FilterError('Program file not found: %s.' % argv[0])
+
+        # Feed stdin and collect stderr in the background, while we read
+        # stdout, such that none of the pipes can block the process.
+        errors, stderr = [], []
+        def feed():
+            try:
+                if data is not None:
+                    for chunk in iter(lambda: data.read(CHUNK_SIZE), ''):
+                        proc.stdin.write(chunk.encode('utf-8'))
+            except BrokenPipeError:
+                # The process exited; its result code will tell us why.
+                pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+        def drain():
+            stderr.append(proc.stderr.read())
+        threads = [threading.Thread(target=feed),
+                   threading.Thread(target=drain)]
+        for thread in threads:
+            thread.start()
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        for chunk in iter(lambda: proc.stdout.read(CHUNK_SIZE), b''):
+            if not output_file.created:
+                out.write(decoder.decode(chunk))
+        if not output_file.created:
+            out.write(decoder.decode(b'', final=True))
+        for thread in threads:
+            thread.join()
+        proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+        if errors:
+            raise errors[0]
+        if proc.returncode:
+            raise FilterError(
+                '%s: subprocess returned a non-success result code: '
+                '%s, stderr=%s' % (
+                    cls.name or cls.__name__,
+                    proc.returncode,
+                    stderr[0].decode('utf-8').strip()))
+        if output_file.created:
+            with open(output_file.filename, 'r', encoding='utf-8',
+                      newline='') as f:
+                shutil.copyfileobj(f, out, CHUNK_SIZE)
+
     @classmethod
     def parse_binary(cls, string):
         r"""
@@ -577,14 +814,113 @@ class JavaTool(ExternalTool):
         else:
             self.java_bin = 'java'
 
+    def get_binary(self):
+        return [self.java_bin, getattr(self, 'jar', None)]
+
     def subprocess(self, args, out, data=None):
         ExternalTool.subprocess(
             [self.java_bin, '-jar', self.jar] + args, out, data)
 
 
+_TOOL_FINGERPRINTS = {}
+
+
+def _fingerprint_files(argv):
+    """Return a hash identifying the files the command line ``argv``
+    refers to (path, size and modification time), or ``None`` if none
+    of them can be found.
+
+    The result is computed only once per process for any given ``argv``.
+    """
+    argv = tuple(a for a in argv if a)
+    if not argv:
+        return None
+    try:
+        return _TOOL_FINGERPRINTS[argv]
+    except KeyError:
+        pass
+
+    stats = []
+    for i, arg in enumerate(argv):
+        # The first item is usually a bare executable name to be found
+        # on the PATH; further items (a script run by node, a jar) are
+        # only considered if they are existing files.
+        filename = shutil.which(arg) if i == 0 else None
+        filename = filename or (arg if os.path.isfile(arg) else None)
+        if not filename:
+            continue
+        filename = os.path.realpath(filename)
+        try:
+            st = os.stat(filename)
+        except OSError:
+            continue
+        stats.append((filename, st.st_size, st.st_mtime_ns))
+
+    fingerprint = hash_func(stats) if stats else None
+    _TOOL_FINGERPRINTS[argv] = fingerprint
+    return fingerprint
+
+
 _FILTERS = {}
 
 
+# The builtin filters, by name, and the modules which define them. Those
+# modules are only imported once a filter is first requested, so that
+# ``import webassets`` does not pay for all of them (or for probing
+# optional dependencies some of them do at import time).
+_BUILTIN_FILTERS = {
+    'autoprefixer': 'webassets.filter.autoprefixer',
+    'autoprefixer6': 'webassets.filter.autoprefixer',
+    'babel': 'webassets.filter.babel',
+    'cleancss': 'webassets.filter.cleancss',
+    'clevercss': 'webassets.filter.clevercss',
+    'closure_js': 'webassets.filter.closure',
+    'closure_stylesheets_compiler': 'webassets.filter.closure_stylesheets',
+    'closure_stylesheets_minifier': 'webassets.filter.closure_stylesheets',
+    'closure_tmpl': 'webassets.filter.closure_templates',
+    'coffeescript': 'webassets.filter.coffeescript',
+    'compass': 'webassets.filter.compass',
+    'css_slimmer': 'webassets.filter.slimmer',
+    'cssmin': 'webassets.filter.cssmin',
+    'cssprefixer': 'webassets.filter.cssprefixer',
+    'cssrewrite': 'webassets.filter.cssrewrite',
+    'cssutils': 'webassets.filter.cssutils',
+    'datauri': 'webassets.filter.datauri',
+    'dustjs': 'webassets.filter.dust',
+    'handlebars': 'webassets.filter.handlebars',
+    'jade': 'webassets.filter.jade',
+    'jinja2': 'webassets.filter.jinja2',
+    'jsmin': 'webassets.filter.jsmin',
+    'jspacker': 'webassets.filter.jspacker',
+    'jst': 'webassets.filter.jst',
+    'less': 'webassets.filter.less',
+    'less_ruby': 'webassets.filter.less_ruby',
+    'libsass': 'webassets.filter.libsass',
+    'node-sass': 'webassets.filter.node_sass',
+    'node-scss': 'webassets.filter.node_sass',
+    'postcss': 'webassets.filter.postcss',
+    'pyscss': 'webassets.filter.pyscss',
+    'rcssmin': 'webassets.filter.rcssmin',
+    'replace': 'webassets.filter.replace',
+    'requirejs': 'webassets.filter.requirejs',
+    'rjsmin': 'webassets.filter.rjsmin',
+    'sass': 'webassets.filter.sass',
+    'sass_ruby': 'webassets.filter.sass_ruby',
+    'scss': 'webassets.filter.sass',
+    'scss_ruby': 'webassets.filter.sass_ruby',
+    'slimit': 'webassets.filter.slimit',
+    'spritemapper': 'webassets.filter.spritemapper',
+    'stylus': 'webassets.filter.stylus',
+    'typescript': 'webassets.filter.typescript',
+    'uglifyjs': 'webassets.filter.uglifyjs',
+    'yui_css': 'webassets.filter.yui',
+    'yui_js': 'webassets.filter.yui',
+}
+
+# Builtin filter modules which have already been imported.
+_LOADED_MODULES = set()
+
+
 def register_filter(f):
     """Add the given filter to the list of know filters.
     """
@@ -595,6 +931,35 @@ def register_filter(f):
     _FILTERS[f.name] = f
 
 
+def _load_builtin_module(module_name):
+    """Import the builtin filter module ``module_name``, and register the
+    filters it contains.
+
+    Filters which have been registered under the same name before (by
+    the user) are not replaced. Each module is only processed once, so a
+    filter that was unregistered later on does not come back.
+    """
+    import warnings
+    if module_name in _LOADED_MODULES:
+        return
+    _LOADED_MODULES.add(module_name)
+    try:
+        module = import_module(module_name)
+    except Exception as e:
+        warnings.warn('Error while loading builtin filter '
+                      'module \'%s\': %s' % (module_name, e))
+        return
+    for attr_name in dir(module):
+        attr = getattr(module, attr_name)
+        if inspect.isclass(attr) and issubclass(attr, Filter):
+            if not attr.name:
+                # Skip if filter has no name; those are
+                # considered abstract base classes.
+                continue
+            if attr.name not in _FILTERS:
+                register_filter(attr)
+
+
 def get_filter(f, *args, **kwargs):
     """Resolves ``f`` to a filter instance.
 
@@ -602,13 +967,16 @@ def get_filter(f, *args, **kwargs):
     giving the class, or a filter name.
 
     *args and **kwargs are passed along to the filter when it's
-    instantiated.
+    instantiated. For a callable, only a ``cache_id`` may be given;
+    see ``CallableFilter``.
     """
     if isinstance(f, Filter):
         # Don't need to do anything.
         assert not args and not kwargs
         return f
     elif isinstance(f, str):
+        if f not in _FILTERS and f in _BUILTIN_FILTERS:
+            _load_builtin_module(_BUILTIN_FILTERS[f])
         if f in _FILTERS:
             klass = _FILTERS[f]
         else:
@@ -616,13 +984,15 @@ def get_filter(f, *args, **kwargs):
     elif inspect.isclass(f) and issubclass(f, Filter):
         klass = f
     elif callable(f):
-        assert not args and not kwargs
-        return CallableFilter(f)
+        # The only argument supported for callables is ``cache_id``.
+        assert not args and set(kwargs) <= {'cache_id'}
+        return CallableFilter(f, **kwargs)
     else:
         raise ValueError('Unable to resolve to a filter: %s' % f)
 
     return klass(*args, **kwargs)
 
+
 CODE_FILES = ['.py', '.pyc', '.so']
 
 
@@ -681,42 +1051,10 @@ def unique_modules(directory):
 
 
 def load_builtin_filters():
-    from os import path
-    import warnings
+    """Import all the builtin filter modules right away.
 
-    # load modules to work based with and without pyinstaller
-    # from: https://github.com/webcomics/dosage/blob/master/dosagelib/loader.py
-    # see: https://github.com/pyinstaller/pyinstaller/issues/1905
-
-    # load modules using iter_modules()
-    # (should find all filters in normal build, but not pyinstaller)
-    prefix = __name__ + '.'
-    module_names = [m[1] for m in pkgutil.iter_modules(__path__, prefix)]
-
-    # special handling for PyInstaller
-    importers = map(pkgutil.get_importer, __path__)
-    toc = set()
-    for i in importers:
-        if hasattr(i, 'toc'):
-            toc |= i.toc
-    for elm in toc:
-        if elm.startswith(prefix):
-            module_names.append(elm)
-
-    for module_name in module_names:
-        #module_name = 'webassets.filter.%s' % name
-        try:
-            module = import_module(module_name)
-        except Exception as e:
-            warnings.warn('Error while loading builtin filter '
-                          'module \'%s\': %s' % (module_name, e))
-        else:
-            for attr_name in dir(module):
-                attr = getattr(module, attr_name)
-                if inspect.isclass(attr) and issubclass(attr, Filter):
-                    if not attr.name:
-                        # Skip if filter has no name; those are
-                        # considered abstract base classes.
-                        continue
-                    register_filter(attr)
-load_builtin_filters()
+    Normally, this happens on demand, when a filter is first requested by
+    name. Doing it upfront can be useful in a process that forks workers.
+    """
+    for module_name in sorted(set(_BUILTIN_FILTERS.values())):
+        _load_builtin_module(module_name)
@@ -34,6 +34,7 @@ class AutoprefixerFilter(ExternalTool):
 
     """
     name = 'autoprefixer'
+    default_binary = 'autoprefixer'
     options = {
         'autoprefixer': 'AUTOPREFIXER_BIN',
         'browsers': 'AUTOPREFIXER_BROWSERS',
@@ -57,6 +58,7 @@ class AutoprefixerFilter(ExternalTool):
 
 class Autoprefixer6Filter(AutoprefixerFilter):
     name = 'autoprefixer6'
+    default_binary = 'postcss'
 
     options = {
         'autoprefixer': 'AUTOPREFIXER_BIN',
@@ -50,6 +50,7 @@ class Babel(ExternalTool):
         May be set to False to make babel not run in debug
     """
     name = 'babel'
+    default_binary = 'babel'
     max_debug_level = None
 
     options = {
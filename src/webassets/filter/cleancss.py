@@ -19,6 +19,9 @@ class CleanCSS(ExternalTool):
     """
 
     name = 'cleancss'
+    default_binary = 'cleancss'
+    streaming = True
+    bytes_capable = True
     options = {
         'binary': 'CLEANCSS_BIN',
         'extra_args': 'CLEANCSS_EXTRA_ARGS',
@@ -39,6 +39,8 @@ __all__ = ('ClosureJS',)
 class ClosureJS(JavaTool):
 
     name = 'closure_js'
+    streaming = True
+    bytes_capable = True
     options = {
         'opt': 'CLOSURE_COMPRESSOR_OPTIMIZATION',
         'extra_args': 'CLOSURE_EXTRA_ARGS',
@@ -21,5 +21,11 @@ class CSSMin(Filter):
         else:
             self.cssmin = cssmin
 
+    concat_distributive = 'rules'
+    transforms = ('output',)
+
+    def transform(self, text, **kw):
+        return self.cssmin.cssmin(text)
+
     def output(self, _in, out, **kw):
-        out.write(self.cssmin.cssmin(_in.read()))
+        out.write(self.transform(_in.read(), **kw))
@@ -1,6 +1,10 @@
+import functools
 import os
+import posixpath
+import time
 from os.path import join
-from webassets.utils import common_path_prefix
+from webassets.utils import (
+    DIGEST_MIN_AGE, FileMemo, common_path_prefix, get_hash_algorithm)
 from webassets.utils import urlparse
 from . import urlpath
 try:
@@ -10,12 +14,70 @@ except ImportError:
     # support ordering - it's just a nice bonus.
     OrderedDict = dict
 
-from .base import CSSUrlRewriter, addsep, path2url
+from .base import (
+    CSSUrlRewriter, addsep, iter_url_matches, path2url, split_url_match)
 
 
 __all__ = ('CSSRewrite',)
 
 
+@functools.lru_cache(maxsize=4096)
+def _relative_url(source_url, output_url, url):
+    """Rewrite ``url``, as found in the file at ``source_url``, to point
+    to the same location from ``output_url``.
+
+    Memoized, since stylesheets tend to repeat the same urls many times.
+    """
+    # If path is an absolute one, keep it
+    parsed = urlparse.urlparse(url)
+    if parsed.scheme or parsed.path.startswith('/'):
+        return url
+
+    abs_source_url = urlparse.urljoin(source_url, url)
+
+    # relpath() will not detect this case
+    if urlparse.urlparse(abs_source_url).scheme:
+        return abs_source_url
+
+    # rewritten url: relative path from new location (output)
+    # to location of referenced file (source + current url)
+    return urlpath.relpath(output_url, abs_source_url)
+
+
+class _PrefixTrie(object):
+    """Finds which of a number of prefixes a string starts with.
+
+    If several match, the prefix added first wins.
+    """
+
+    def __init__(self):
+        self.root = {}
+        self.count = 0
+
+    def add(self, prefix, value):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        # None is not a character, so can be used to mark the end.
+        if None not in node:
+            node[None] = (self.count, prefix, value)
+            self.count += 1
+
+    def match(self, string):
+        """Return ``(prefix, value)`` for the first prefix of ``string``,
+        or ``None``.
+        """
+        node = self.root
+        found = node.get(None)
+        for char in string:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node and (found is None or node[None] < found):
+                found = node[None]
+        return found[1:] if found else None
+
+
 class CSSRewrite(CSSUrlRewriter):
     """Source filter that rewrites relative urls in CSS files.
 
@@ -42,6 +104,15 @@ class CSSRewrite(CSSUrlRewriter):
 
         get_filter('cssrewrite', replace=lambda url: re.sub(r'^/?images/', '/images/', url))
         get_filter('cssrewrite', replace=lambda url: '/images/'+url[7:] if url.startswith('images/') else url)
+
+    To be able to serve images and fonts with far future expires headers,
+    the filter can add a digest of the referenced file to each relative
+    url, using the ``digest`` option (``CSSREWRITE_DIGEST``). With
+    ``'query'`` (or ``True``), it is added as a query string
+    (``icon.png?1a2b3c4d``), with ``'filename'``, it is inserted into the
+    filename (``icon.1a2b3c4d.png``); your web server then needs to serve
+    ``icon.png`` for such a url. The referenced files are watched by the
+    ``timestamp`` updater, so that the CSS is rebuilt when they change.
     """
 
     # TODO: If we want to support inline assets, this needs to be
@@ -50,61 +121,138 @@ class CSSRewrite(CSSUrlRewriter):
 
     name = 'cssrewrite'
     max_debug_level = 'merge'
+    options = {
+        'digest': 'CSSREWRITE_DIGEST',
+    }
 
-    def __init__(self, replace=False):
-        super(CSSRewrite, self).__init__()
+    # The digests by filename, so that files referenced repeatedly are
+    # only read once per process.
+    _digests = FileMemo()
+
+    def __init__(self, replace=False, **kwargs):
+        super(CSSRewrite, self).__init__(**kwargs)
         self.replace = replace
 
     def unique(self):
         # Allow mixing the standard version of this filter, and replace mode.
         return self.replace
 
-    def input(self, _in, out, **kw):
+    def prepare(self, kw, urls=None):
+        super(CSSRewrite, self).prepare(kw, urls)
+        self._depends = []
         if self.replace not in (False, None) and not callable(self.replace):
             # For replace mode, make sure we have all the directories to be
             # rewritten in form of a url, so we can later easily match it
-            # against the urls encountered in the CSS.
-            replace_dict = False
+            # against the urls encountered in the CSS. This only depends
+            # on the directory, so is done once.
             root = addsep(self.ctx.directory)
-            replace_dict = OrderedDict()
-            for repldir, sub in self.replace.items():
-                repldir = addsep(os.path.normpath(join(root, repldir)))
-                replurl = path2url(repldir[len(common_path_prefix([root, repldir])):])
-                replace_dict[replurl] = sub
-            self.replace_dict = replace_dict
-
-        return super(CSSRewrite, self).input(_in, out, **kw)
+            if getattr(self, '_replace_root', None) != root:
+                replace_dict = OrderedDict()
+                for repldir, sub in self.replace.items():
+                    repldir = addsep(os.path.normpath(join(root, repldir)))
+                    replurl = path2url(repldir[len(common_path_prefix([root, repldir])):])
+                    replace_dict[replurl] = sub
+                self.replace_dict = replace_dict
+                self.replace_trie = _PrefixTrie()
+                for replurl, sub in replace_dict.items():
+                    self.replace_trie.add(replurl, sub)
+                self._replace_root = root
 
     def replace_url(self, url):
+        digest = None
+        if self.digest:
+            filename = self._referenced_file(
+                url, self.source_path, strip_query=True)
+            if filename and os.path.isfile(filename):
+                digest = self._file_digest(filename)
+                if filename not in self._depends:
+                    self._depends.append(filename)
+
+        url = self._rewrite_url(url) or url
+        if digest:
+            url = self._add_digest(url, digest)
+        return url
+
+    def replace_done(self):
+        # Record the files digests were added for, for the updater to
+        # watch (see ``TimestampUpdater.remember_build_time()``).
+        if self.digest and self.ctx.cache:
+            self.ctx.cache.set(
+                ('filter-depends', self.source_path), self._depends)
+
+    def _rewrite_url(self, url):
         # Replace mode: manually adjust the location of files
         if callable(self.replace):
             return self.replace(url)
         elif self.replace is not False:
-            for to_replace, sub in self.replace_dict.items():
-                targeturl = urlparse.urljoin(self.source_url, url)
-                if targeturl.startswith(to_replace):
-                    url = "%s%s" % (sub, targeturl[len(to_replace):])
-                    # Only apply the first match
-                    break
+            targeturl = urlparse.urljoin(self.source_url, url)
+            # Only apply the first match
+            match = self.replace_trie.match(targeturl)
+            if match:
+                to_replace, sub = match
+                url = "%s%s" % (sub, targeturl[len(to_replace):])
 
         # Default mode: auto correct relative urls
         else:
-            # If path is an absolute one, keep it
-            parsed = urlparse.urlparse(url)
-            if not parsed.scheme and not parsed.path.startswith('/'):
-                abs_source_url = urlparse.urljoin(self.source_url, url)
+            url = _relative_url(self.source_url, self.output_url, url)
+
+        return url
 
-                # relpath() will not detect this case
-                if urlparse.urlparse(abs_source_url).scheme:
-                    return abs_source_url
+    def _add_digest(self, url, digest):
+        parts = urlparse.urlsplit(url)
+        if self.digest == 'filename':
+            base, ext = posixpath.splitext(parts.path)
+            parts = parts._replace(path='%s.%s%s' % (base, digest, ext))
+        else:
+            query = '%s&%s' % (parts.query, digest) if parts.query else digest
+            parts = parts._replace(query=query)
+        return urlparse.urlunsplit(parts)
 
-                # rewritten url: relative path from new location (output)
-                # to location of referenced file (source + current url)
-                url = urlpath.relpath(self.output_url, abs_source_url)
+    def _file_digest(self, filename):
+        """Return the digest of ``filename``, using the cache of the
+        environment, and an in-process one, keyed by the stat of the file.
+        """
+        stat = os.stat(filename)
+        algorithm, constructor = get_hash_algorithm()
+        stamp = (stat.st_mtime_ns, stat.st_size, algorithm)
+        digest = self._digests.get(filename, stamp)
+        if digest is not None:
+            return digest
 
-        return url
+        # Like the in-process memo, the cache does not keep the digests
+        # of files which were just changed, see ``FileMemo``.
+        settled = time.time() - stat.st_mtime >= DIGEST_MIN_AGE
+        key = ('cssrewrite-digest', filename) + stamp
+        digest = self.ctx.cache.get(key) if self.ctx.cache else None
+        if not digest:
+            hasher = constructor()
+            with open(filename, 'rb') as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()[:8]
+            if self.ctx.cache and settled:
+                self.ctx.cache.set(key, digest)
+        self._digests.set(filename, stamp, digest, stat.st_mtime)
+        return digest
 
     def get_additional_cache_keys(self, **kw):
         if 'output_path' in kw:
             return [os.path.dirname(kw['output_path'])]
         return []
+
+    def get_content_cache_keys(self, hunk, **kw):
+        keys = []
+        source_path = kw.get('source_path')
+        if self.digest and source_path:
+            # The referenced files are part of the result, so they go
+            # into the cache key.
+            files = []
+            for m in iter_url_matches(hunk):
+                filename = self._referenced_file(
+                    split_url_match(m)[2], source_path, strip_query=True)
+                if filename and os.path.isfile(filename) and \
+                        filename not in files:
+                    files.append(filename)
+            keys.append(('digest', self.digest, [
+                (f, self._file_digest(f)) for f in files]))
+        return keys
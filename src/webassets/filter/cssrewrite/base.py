@@ -2,7 +2,7 @@ import os
 import re
 from os.path import join, normpath
 from webassets.filter import Filter
-from webassets.utils import common_path_prefix
+from webassets.utils import common_path_prefix, urlparse
 
 
 __all__ = ()
@@ -30,16 +30,26 @@ class PatternRewriter(Filter):
     #   method to call -> pattern to call it for (as a compiled regex)
     patterns = {}
 
-    def input(self, _in, out, **kw):
-        content = _in.read()
+    @property
+    def transforms(self):
+        # Subclasses may still customize input() rather than transform();
+        # these need to be called through the stream.
+        if type(self).input is PatternRewriter.input:
+            return ('input',)
+        return ()
+
+    def transform(self, content, **kw):
         for func, pattern in self.patterns.items():
             if not callable(func):
                 func = getattr(self, func)
             # Should this pass along **kw? How many subclasses would need it?
-            # As is, subclasses needing access need to overwrite input() and
-            # set class attributes.
+            # As is, subclasses needing access need to overwrite transform()
+            # and set class attributes.
             content = pattern.sub(func, content)
-        out.write(content)
+        return content
+
+    def input(self, _in, out, **kw):
+        out.write(self.transform(_in.read(), **kw))
 
 
 urltag_re = re.compile(r"""
@@ -68,45 +78,162 @@ class CSSUrlRewriter(PatternRewriter):
         'rewrite_url': urltag_re
     }
 
-    def input(self, _in, out, **kw):
+    @property
+    def fusion_key(self):
+        # Filters which only implement replace_url() can rewrite the urls
+        # of a file in a single pass, see transform_fused().
+        cls = type(self)
+        if (cls.patterns is CSSUrlRewriter.patterns
+                and cls.rewrite_url is CSSUrlRewriter.rewrite_url
+                and cls.transform is CSSUrlRewriter.transform
+                and 'input' in self.transforms):
+            return CSSUrlRewriter
+        return None
+
+    @classmethod
+    def transform_fused(cls, filters, content, **kw):
+        """Apply the url() rewriting of all ``filters``, in order, with a
+        single pass over ``content``.
+        """
+        urls = {}
+        for filter in filters:
+            filter.prepare(kw, urls)
+        replacers = [filter.replace_url for filter in filters]
+        content = urltag_re.sub(
+            lambda m: _rewrite_match(m, replacers), content)
+        for filter in filters:
+            filter.replace_done()
+        return content
+
+    def prepare(self, kw, urls=None):
+        """Set up the attributes ``replace_url()`` relies on, for the
+        source file described by the filter keyword arguments ``kw``.
+
+        ``urls`` may be a dict in which the resolved urls are shared
+        between filters.
+        """
         source, source_path, output, output_path = \
             kw['source'], kw['source_path'], kw['output'], kw['output_path']
 
         self.source_path = source_path
         self.output_path = output_path
-        self.source_url = self.ctx.resolver.resolve_source_to_url(
-            self.ctx, source_path, source)
-        self.output_url = self.ctx.resolver.resolve_output_to_url(
-            self.ctx, output)
-
-        return super(CSSUrlRewriter, self).input(_in, out, **kw)
+        if urls is None:
+            urls = {}
+        key = id(self.ctx)
+        if key not in urls:
+            urls[key] = (
+                self.ctx.resolver.resolve_source_to_url(
+                    self.ctx, source_path, source),
+                self.ctx.resolver.resolve_output_to_url(self.ctx, output))
+        self.source_url, self.output_url = urls[key]
+
+    def transform(self, content, **kw):
+        self.prepare(kw)
+        content = super(CSSUrlRewriter, self).transform(content, **kw)
+        self.replace_done()
+        return content
 
     def rewrite_url(self, m):
-        # Get the regex matches; note how we maintain the exact
-        # whitespace around the actual url; we'll indeed only
-        # replace the url itself.
-        text_before = m.groups()[0]
-        url = m.groups()[1]
-        text_after = m.groups()[2]
-
-        # Normalize the url: remove quotes
-        quotes_used = ''
-        if url[:1] in '"\'':
-            quotes_used = url[:1]
-            url = url[1:]
-        if url[-1:] in '"\'':
-            url = url[:-1]
-
-        url = self.replace_url(url) or url
-
-        result = 'url(%s%s%s%s%s)' % (
-            text_before, quotes_used, url, quotes_used, text_after)
-        return result
+        return _rewrite_match(m, (self.replace_url,))
 
     def replace_url(self, url):
         """Implement this to return a replacement for each URL found."""
         raise NotImplementedError()
 
+    def replace_done(self):
+        """Called once all urls of the source file set up by
+        ``prepare()`` have been replaced.
+        """
+
+    @staticmethod
+    def _referenced_file(url, source_path, strip_query=False):
+        """Return the local file the relative ``url`` in the source file
+        ``source_path`` refers to, whether it exists or not, or ``None``
+        for data:, absolute and empty urls.
+
+        Urls with a query or fragment, like ``sprite.svg#icon``, are only
+        resolved, to the file without them, if ``strip_query`` is set.
+        """
+        if url.startswith('data:'):
+            # Don't even both sending data: through urlsplit(),
+            # who knows how well it'll deal with a lot of data.
+            return None
+
+        parsed = urlparse.urlsplit(url)
+        if parsed.scheme or parsed.netloc or not parsed.path or \
+                parsed.path.startswith('/'):
+            return None
+        if not strip_query and ('?' in url or '#' in url):
+            return None
+
+        # Notes:
+        #  - Django might need to override this for staticfiles if it
+        #    it should be possible to resolve cross-references between
+        #    different directories.
+        #  - For Flask-Assets blueprints, the logic might need to be:
+        #    1) Take source_path, convert into correct url via absurl().
+        #    2) Join with the URL be be replaced.
+        #    3) Convert url back to the filesystem path to which the url
+        #       would map (the hard part?).
+        return normpath(join(
+            os.path.dirname(source_path), urlparse.unquote(parsed.path)))
+
+
+# Where a piece of CSS can be cut without cutting a ``urltag_re`` match in
+# two: after a line break, or a closing parenthesis which is not escaped.
+_url_boundary_re = re.compile(r'[\r\n]|(?<!\\)(?:\\\\)*\)')
+
+
+def iter_url_matches(hunk):
+    """Iterate over the ``urltag_re`` matches in the content of ``hunk``,
+    reading it in pieces, rather than all at once.
+    """
+    rest = ''
+    for chunk in hunk.chunks():
+        text = rest + chunk
+        cut = 0
+        for m in _url_boundary_re.finditer(text):
+            cut = m.end()
+        for m in urltag_re.finditer(text, 0, cut):
+            yield m
+        rest = text[cut:]
+    for m in urltag_re.finditer(rest):
+        yield m
+
+
+def split_url_match(m):
+    """Split the ``urltag_re`` match ``m`` into the whitespace before the
+    url, the quotes used, the url itself, and the whitespace after it.
+    """
+    # Get the regex matches; note how we maintain the exact
+    # whitespace around the actual url; we'll indeed only
+    # replace the url itself.
+    text_before = m.groups()[0]
+    url = m.groups()[1]
+    text_after = m.groups()[2]
+
+    # Normalize the url: remove quotes
+    quotes_used = ''
+    if url[:1] in '"\'':
+        quotes_used = url[:1]
+        url = url[1:]
+    if url[-1:] in '"\'':
+        url = url[:-1]
+    return text_before, quotes_used, url, text_after
+
+
+def _rewrite_match(m, replacers):
+    """Rewrite the url of the ``urltag_re`` match ``m``, passing it through
+    each of the ``replacers`` in turn.
+    """
+    text_before, quotes_used, url, text_after = split_url_match(m)
+    for replace_url in replacers:
+        url = replace_url(url) or url
+
+    result = 'url(%s%s%s%s%s)' % (
+        text_before, quotes_used, url, quotes_used, text_after)
+    return result
+
 
 if __name__ == '__main__':
     for text, expect in [
@@ -1,9 +1,11 @@
 from base64 import b64encode
+import functools
 import mimetypes
 import os
-from webassets.utils import urlparse
 
-from webassets.filter.cssrewrite.base import CSSUrlRewriter
+from webassets.utils import FileMemo
+from webassets.filter.cssrewrite.base import (
+    CSSUrlRewriter, iter_url_matches, split_url_match)
 
 
 __all__ = ('CSSDataUri',)
@@ -25,6 +27,9 @@ class CSSDataUri(CSSUrlRewriter):
     The filter respects a ``DATAURI_MAX_SIZE`` option, which is the maximum
     size (in bytes) of external files to include. The default limit is what
     I think should be a reasonably conservative number, 2048 bytes.
+
+    The files referenced are part of the cache key, so that a changed image
+    is picked up even if the stylesheet did not change.
     """
 
     name = 'datauri'
@@ -32,40 +37,53 @@ class CSSDataUri(CSSUrlRewriter):
         'max_size': 'DATAURI_MAX_SIZE',
     }
 
-    def replace_url(self, url):
-        if url.startswith('data:'):
-            # Don't even both sending data: through urlparse(),
-            # who knows how well it'll deal with a lot of data.
-            return
+    # The data uris by filename, shared by all instances so that files
+    # used in several stylesheets are only encoded once.
+    _encoded = FileMemo(size=1024)
 
-        # Ignore any urls which are not relative
-        parsed = urlparse.urlparse(url)
-        if parsed.scheme or parsed.netloc or parsed.path.startswith('/'):
-            return
+    def get_content_cache_keys(self, hunk, **kw):
+        source_path = kw.get('source_path')
+        if not source_path:
+            return []
+        # Note that earlier filters may still change the urls; we go by
+        # what is referenced in the source file.
+        keys = []
+        for m in iter_url_matches(hunk):
+            filename = self._referenced_file(split_url_match(m)[2],
+                                             source_path)
+            if filename:
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    keys.append((filename, None))
+                else:
+                    keys.append((filename, stat.st_mtime_ns, stat.st_size))
+        return keys
 
-        # Since this runs BEFORE cssrewrite, we can thus assume that urls
-        # will be relative to the file location.
-        #
-        # Notes:
-        #  - Django might need to override this filter for staticfiles if it
-        #    it should be possible to resolve cross-references between
-        #    different directories.
-        #  - For Flask-Assets blueprints, the logic might need to be:
-        #    1) Take source_path, convert into correct url via absurl().
-        #    2) Join with the URL be be replaced.
-        #    3) Convert url back to the filesystem path to which the url
-        #       would map (the hard part?).
-        #
-
-        filename = os.path.join(os.path.dirname(self.source_path), url)
+    def replace_url(self, url):
+        filename = self._referenced_file(url, self.source_path)
+        if not filename:
+            return
 
         try:
-            if os.stat(filename).st_size <= (self.max_size or 2048):
+            stat = os.stat(filename)
+            if stat.st_size <= (self.max_size or 2048):
+                stamp = (stat.st_mtime_ns, stat.st_size)
+                uri = self._encoded.get(filename, stamp)
+                if uri is not None:
+                    return uri
                 with open(filename, 'rb') as f:
                     data = b64encode(f.read())
-                return 'data:%s;base64,%s' % (
-                    mimetypes.guess_type(filename)[0], data.decode())
+                uri = 'data:%s;base64,%s' % (
+                    _guess_type(filename), data.decode())
+                self._encoded.set(filename, stamp, uri, stat.st_mtime)
+                return uri
         except (OSError, IOError):
             # Ignore the file not existing.
             # TODO: When we have a logging system, this could produce a warning
             return
+
+
+@functools.lru_cache(maxsize=1024)
+def _guess_type(filename):
+    return mimetypes.guess_type(filename)[0]
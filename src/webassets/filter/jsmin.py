@@ -28,6 +28,7 @@ class JSMin(Filter):
     """
 
     name = 'jsmin'
+    concat_distributive = True
 
     def setup(self):
         import jsmin
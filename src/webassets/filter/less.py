@@ -87,6 +87,7 @@ class Less(ExternalTool):
     """
 
     name = 'less'
+    default_binary = 'lessc'
     options = {
         'less': ('binary', 'LESS_BIN'),
         'run_in_debug': 'LESS_RUN_IN_DEBUG',
@@ -37,6 +37,7 @@ class NodeSass(Sass):
     """
 
     name = 'node-sass'
+    default_binary = 'node-sass'
     options = {
         'binary': 'NODE_SASS_BIN',
         'debug_info': 'NODE_SASS_DEBUG_INFO',
@@ -39,6 +39,7 @@ class PostCSS(ExternalTool):
 
     """
     name = 'postcss'
+    default_binary = 'postcss'
 
     options = {
         'binary': 'POSTCSS_BIN',
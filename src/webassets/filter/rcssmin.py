@@ -30,6 +30,12 @@ class RCSSMin(Filter):
         else:
             self.rcssmin = rcssmin
 
-    def output(self, _in, out, **kw):
+    concat_distributive = 'rules'
+    transforms = ('output',)
+
+    def transform(self, text, **kw):
         keep = self.keep_bang_comments or False
-        out.write(self.rcssmin.cssmin(_in.read(), keep_bang_comments=keep))
+        return self.rcssmin.cssmin(text, keep_bang_comments=keep)
+
+    def output(self, _in, out, **kw):
+        out.write(self.transform(_in.read(), **kw))
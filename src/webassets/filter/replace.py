@@ -1,8 +1,5 @@
 import re
-from webassets.filter import (
-    Filter,
-    register_filter
-)
+from webassets.filter import Filter, freezedicts
 
 
 class ReplaceFilter(Filter):
@@ -17,24 +14,100 @@ class ReplaceFilter(Filter):
                 pattern=r'\\s*{{\\s*STATIC_URL\\s*}}\\s*',
                 repl=settings.STATIC_URL,
             )
+
+        Instead of a single pattern, a mapping of patterns to replacements
+        may be given. All substitutions are then done in a single pass
+        over the text, so a replacement is not searched for the patterns
+        again:
+
+            replace_tokens = ReplaceFilter(pattern={
+                '{{ STATIC_URL }}': settings.STATIC_URL,
+                '{{ VERSION }}': version,
+            }, literal=True)
+
+        With ``literal``, the patterns and replacements are plain strings
+        rather than regular expressions and templates; where several
+        patterns match at the same position, the longest one wins.
+        Otherwise, the first pattern in the mapping that matches wins.
+        Patterns with groups or flags cannot be combined; if there are any,
+        the patterns are applied one after another instead.
     """
 
     name = 'replace'
     max_debug_level = None
 
-    def __init__(self, pattern=None, repl=None, as_output=True, **kwargs):
+    def __init__(self, pattern=None, repl=None, as_output=True, literal=False,
+                 **kwargs):
         self.pattern = pattern
         self.repl = repl
         self.as_output = as_output
+        self.literal = literal
 
         super(ReplaceFilter, self).__init__(**kwargs)
 
     def unique(self):
         """ Return a hashable representation of the parameters to allow different instances of this filter. """
-        return self.pattern, self.repl
+        return self.pattern, self.repl, self.literal
+
+    @property
+    def transforms(self):
+        return ('output',) if self.as_output else ('input',)
+
+    def transform(self, text, **kwargs):
+        return self._matcher()(text)
+
+    def _matcher(self):
+        """Return a function doing the substitutions, compiled once for
+        as long as the options do not change.
+        """
+        snapshot = (freezedicts(self.pattern), self.repl, self.literal)
+        memo = getattr(self, '_matcher_memo', None)
+        if memo is None or memo[0] != snapshot:
+            memo = (snapshot, self._compile())
+            self._matcher_memo = memo
+        return memo[1]
+
+    def _compile(self):
+        if isinstance(self.pattern, dict):
+            items = list(self.pattern.items())
+        else:
+            items = [(self.pattern, self.repl)]
+
+        if self.literal:
+            # Prefer the longest of the tokens matching at a position.
+            items.sort(key=lambda item: len(item[0]), reverse=True)
+            items = [(re.compile(re.escape(p)), _literal(r)) for p, r in items]
+        else:
+            items = [(re.compile(p), r) for p, r in items]
+
+        if len(items) == 1:
+            regex, repl = items[0]
+            return lambda text: regex.sub(repl, text)
+
+        default_flags = re.compile('').flags
+        if any(regex.groups or regex.flags != default_flags
+               for regex, _ in items):
+            # Group numbers and backreferences would no longer be valid
+            # within a combined pattern, nor can flags be combined.
+            def substitute(text):
+                for regex, repl in items:
+                    text = regex.sub(repl, text)
+                return text
+            return substitute
+
+        combined = re.compile('|'.join(
+            '(?P<_%d>%s)' % (i, regex.pattern)
+            for i, (regex, _) in enumerate(items)))
+        repls = {}
+        for i, (_, repl) in enumerate(items):
+            if not callable(repl):
+                repl = _template(repl)
+            repls['_%d' % i] = repl
+        return lambda text: combined.sub(
+            lambda m: repls[m.lastgroup](m), text)
 
     def _process(self, _in, out, **kwargs):
-        out.write(re.sub(self.pattern, self.repl, _in.read()))
+        out.write(self.transform(_in.read(), **kwargs))
 
     def output(self, _in, out, **kwargs):
         if self.as_output:
@@ -49,4 +122,11 @@ class ReplaceFilter(Filter):
             self._process(_in, out, **kwargs)
 
 
-register_filter(ReplaceFilter)
+def _literal(repl):
+    return lambda m: repl
+
+
+def _template(repl):
+    if '\\' not in repl:
+        return _literal(repl)
+    return lambda m: m.expand(repl)
@@ -29,6 +29,12 @@ class RJSMin(Filter):
         'keep_bang_comments': 'RJSMIN_KEEP_BANG_COMMENTS',
     }
 
-    def output(self, _in, out, **kw):
+    concat_distributive = True
+    transforms = ('output',)
+
+    def transform(self, text, **kw):
         keep = self.keep_bang_comments or False
-        out.write(rjsmin.jsmin(_in.read(), keep_bang_comments=keep))
+        return rjsmin.jsmin(text, keep_bang_comments=keep)
+
+    def output(self, _in, out, **kw):
+        out.write(self.transform(_in.read(), **kw))
@@ -102,6 +102,7 @@ class Sass(ExternalTool):
     # directory).
 
     name = 'sass'
+    default_binary = 'sass'
     options = {
         'binary': 'SASS_BIN',
         'use_scss': ('scss', 'SASS_USE_SCSS'),
@@ -138,6 +138,7 @@ class RubySass(ExternalTool):
     # directory).
 
     name = 'sass_ruby'
+    default_binary = 'sass'
     options = {
         'binary': 'SASS_BIN',
         'use_scss': ('scss', 'SASS_USE_SCSS'),
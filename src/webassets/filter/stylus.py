@@ -31,6 +31,7 @@ class Stylus(ExternalTool):
     """
 
     name = 'stylus'
+    default_binary = 'stylus'
     options = {
         'stylus': 'STYLUS_BIN',
         'plugins': option('STYLUS_PLUGINS', type=list),
@@ -19,11 +19,20 @@ class UglifyJS(ExternalTool):
     """
 
     name = 'uglifyjs'
+    default_binary = 'uglifyjs'
+    streaming = True
+    bytes_capable = True
     options = {
         'binary': 'UGLIFYJS_BIN',
         'extra_args': 'UGLIFYJS_EXTRA_ARGS',
     }
 
+    @property
+    def concat_distributive(self):
+        # Extra arguments, like --mangle toplevel, may make the result
+        # depend on all of the code.
+        return not self.extra_args
+
     def output(self, _in, out, **kw):
         # UglifyJS 2 doesn't properly read data from stdin (#212).
         args = [self.binary or 'uglifyjs', '{input}', '--output', '{output}']
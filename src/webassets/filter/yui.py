@@ -25,6 +25,9 @@ __all__ = ('YUIJS', 'YUICSS',)
 
 class YUIBase(JavaTool):
 
+    streaming = True
+    bytes_capable = True
+
     def setup(self):
         super(YUIBase, self).setup()
 
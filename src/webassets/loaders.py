@@ -66,7 +66,8 @@ class YAMLLoader(object):
             debug=data.get('debug', None),
             extra=data.get('extra', {}),
             config=data.get('config', {}),
-            depends=data.get('depends', None))
+            depends=data.get('depends', None),
+            outputs=data.get('outputs', None))
         return Bundle(*list(self._yield_bundle_contents(data)), **kwargs)
 
     def _get_bundles(self, obj, known_bundles=None):
@@ -1,19 +1,38 @@
 """Contains the core functionality that manages merging of assets.
 """
 import contextlib
+import io
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
 
 import logging
 from io import open
 from urllib.request import Request as URLRequest, urlopen
 from urllib.error import HTTPError
 
-from .utils import cmp_debug_levels, StringIO, hash_func
+from .utils import (cmp_debug_levels, StringIO, hash_func, get_hash_algorithm,
+                    write_file, FileMemo)
 
 
-__all__ = ('FileHunk', 'MemoryHunk', 'merge', 'FilterTool',
+__all__ = ('FileHunk', 'MemoryHunk', 'HunkStore', 'merge', 'FilterTool',
            'MoreThanOneFilterError', 'NoFilters')
 
 
+# Size of the pieces in which content is passed along when streaming,
+# see ``BaseHunk.chunks()``.
+CHUNK_SIZE = 64 * 1024
+
+# Filter output in streaming mode is kept in memory up to this size, and
+# then moved to a temporary file.
+SPOOL_SIZE = 1024 * 1024
+
+# Stylesheets larger than this are split into several pieces to be filtered
+# in parallel, see ``split_css_rules()``.
+PARALLEL_CHUNK_SIZE = 256 * 1024
+
+
 # Log which is used to output low-level information about what the build does.
 # This is setup such that it does not output just because the root level
 # "webassets" logger is set to level DEBUG (for example via the commandline
@@ -38,7 +57,26 @@ class BaseHunk(object):
         raise NotImplementedError()
 
     def id(self):
-        return hash_func(self.data())
+        return self.__webassets_digest__()
+
+    def __webassets_digest__(self):
+        """Digest of the hunk's content, as used in cache keys.
+
+        Subclasses memoize it where they can tell the content is
+        unchanged.
+        """
+        return hash_func(self.data_bytes())
+
+    def _memoized_digest(self, compute=None):
+        """``__webassets_digest__()``, computed once per hash algorithm,
+        for subclasses whose content does not change.
+        """
+        algorithm = get_hash_algorithm()[0]
+        memo = getattr(self, '_digest_memo', None)
+        if memo is None or memo[0] != algorithm:
+            compute = compute or (lambda: BaseHunk.__webassets_digest__(self))
+            memo = self._digest_memo = (algorithm, compute())
+        return memo[1]
 
     def __eq__(self, other):
         if isinstance(other, BaseHunk):
@@ -49,17 +87,70 @@ class BaseHunk(object):
     def data(self):
         raise NotImplementedError()
 
-    def save(self, filename):
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(self.data())
+    def data_bytes(self):
+        """The content, encoded as UTF-8.
+
+        Subclasses which have the content in this form anyway override
+        this, so that consumers who need bytes (hashing, external tools,
+        writing files) do not need to go through ``data()`` and encode
+        it again.
+        """
+        return self.data().encode('utf-8')
+
+    def chunks(self):
+        """Iterate over the content in pieces, which, unlike ``data()``,
+        does not require all of it to be in memory at once.
+
+        The default implementation yields ``data()`` in one piece.
+        """
+        yield self.data()
+
+    def chunks_bytes(self):
+        """Like ``chunks()``, but the pieces are encoded as UTF-8."""
+        for chunk in self.chunks():
+            yield chunk.encode('utf-8')
+
+    def _streamed_digest(self):
+        """``__webassets_digest__()``, computed from ``chunks_bytes()``."""
+        hasher = get_hash_algorithm()[1]()
+        for chunk in self.chunks_bytes():
+            hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def file_chunks(self):
+        """Like ``chunks_bytes()``, but with the line endings of the
+        platform, as the content is written to files by ``save()``.
+        """
+        if os.linesep == '\n':
+            return self.chunks_bytes()
+        # Translate the line endings, as text mode would.
+        return (chunk.replace('\n', os.linesep).encode('utf-8')
+                for chunk in self.chunks())
+
+    def save(self, filename, fsync=None):
+        """Write the content to ``filename``, unless it already has this
+        content; see :func:`webassets.utils.write_file`. Returns ``False``
+        if the file was left alone.
+        """
+        return write_file(filename, self.file_chunks, fsync=fsync)
 
 
 class FileHunk(BaseHunk):
     """Exposes a single file through as a hunk.
+
+    If ``read_once`` is set, the file is read only the first time its
+    contents are needed, and later changes to it are not seen by this
+    hunk. See ``HunkStore``.
     """
 
-    def __init__(self, filename):
+    # Content digests by filename, along with the stat() values they
+    # are valid for; shared between instances, so that subsequent builds
+    # within the same process do not need to hash unchanged files again.
+    _digests = FileMemo()
+
+    def __init__(self, filename, read_once=False):
         self.filename = filename
+        self.read_once = read_once
 
     def __repr__(self):
         return '<%s %s>' % (self.__class__.__name__, self.filename)
@@ -68,11 +159,69 @@ class FileHunk(BaseHunk):
         pass
 
     def data(self):
-        f = open(self.filename, 'r', encoding='utf-8')
+        if self.read_once and hasattr(self, '_data'):
+            return self._data
+        if self.read_once and hasattr(self, '_bytes'):
+            data = self._bytes.decode('utf-8')
+            if '\r' in data:
+                # What reading in text mode does.
+                data = data.replace('\r\n', '\n').replace('\r', '\n')
+        else:
+            f = open(self.filename, 'r', encoding='utf-8')
+            try:
+                data = f.read()
+            finally:
+                f.close()
+        if self.read_once:
+            self._data = data
+        return data
+
+    def data_bytes(self):
+        if self.read_once and hasattr(self, '_bytes'):
+            data = self._bytes
+        else:
+            with open(self.filename, 'rb') as f:
+                data = f.read()
+            if self.read_once:
+                self._bytes = data
+        if b'\r' in data:
+            # data() normalizes line endings, and we need to match it.
+            return self.data().encode('utf-8')
+        return data
+
+    def chunks(self):
+        if self.read_once:
+            # Read it all, since it will be kept anyway.
+            yield self.data()
+            return
+        with open(self.filename, 'r', encoding='utf-8') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), ''):
+                yield chunk
+
+    def chunks_bytes(self):
+        if self.read_once:
+            yield self.data_bytes()
+            return
+        for chunk in BaseHunk.chunks_bytes(self):
+            yield chunk
+
+    def __webassets_digest__(self):
+        if self.read_once:
+            return self._memoized_digest(self._file_digest)
+        return self._file_digest()
+
+    def _file_digest(self):
         try:
-            return f.read()
-        finally:
-            f.close()
+            st = os.stat(self.filename)
+        except OSError:
+            return BaseHunk.__webassets_digest__(self)
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        key = (get_hash_algorithm()[0], self.filename)
+        digest = self._digests.get(key, stamp)
+        if digest is None:
+            digest = self._streamed_digest()
+            self._digests.set(key, stamp, digest, st.st_mtime)
+        return digest
 
 
 class UrlHunk(BaseHunk):
@@ -127,11 +276,17 @@ class UrlHunk(BaseHunk):
                     self.env.cache.set(('url', 'contents', self.url), self._data)
         return self._data
 
+    def __webassets_digest__(self):
+        return self._memoized_digest()
+
 
 class MemoryHunk(BaseHunk):
     """Content that is no longer a direct representation of a source file. It
     might have filters applied, and is probably the result of merging multiple
     individual source files together.
+
+    ``data`` may be given as a string, as UTF-8 encoded bytes, or as a
+    stream.
     """
 
     def __init__(self, data, files=None):
@@ -152,27 +307,292 @@ class MemoryHunk(BaseHunk):
     def data(self):
         if hasattr(self._data, 'read'):
             return self._data.read()
+        if isinstance(self._data, bytes):
+            return self._data.decode('utf-8')
         return self._data
 
-    def save(self, filename):
-        f = open(filename, 'w', encoding='utf-8')
+    def data_bytes(self):
+        if isinstance(self._data, bytes):
+            return self._data
+        return BaseHunk.data_bytes(self)
+
+    def chunks(self):
+        if hasattr(self._data, 'read'):
+            for chunk in iter(lambda: self._data.read(CHUNK_SIZE), ''):
+                yield chunk
+        else:
+            yield self.data()
+
+    def chunks_bytes(self):
+        if isinstance(self._data, bytes):
+            yield self._data
+        else:
+            for chunk in BaseHunk.chunks_bytes(self):
+                yield chunk
+
+    def __webassets_digest__(self):
+        # Streams can only be read once, so we cannot memoize those.
+        if hasattr(self._data, 'read'):
+            return BaseHunk.__webassets_digest__(self)
+        return self._memoized_digest()
+
+
+class MergedHunk(BaseHunk):
+    """The concatenation of multiple hunks, joined by ``separator``, as
+    returned by ``merge()`` in streaming mode.
+
+    Nothing is read until needed; ``chunks()`` then passes the content
+    through piece by piece, while ``data()`` assembles all of it.
+    """
+
+    def __init__(self, hunks, separator):
+        self.hunks = hunks
+        self.separator = separator
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.hunks)
+
+    def mtime(self):
+        pass
+
+    def data(self):
+        return ''.join(self.chunks())
+
+    def chunks(self):
+        for i, hunk in enumerate(self.hunks):
+            if i:
+                yield self.separator
+            for chunk in hunk.chunks():
+                yield chunk
+
+    def __webassets_digest__(self):
+        return self._memoized_digest(self._streamed_digest)
+
+
+class TempFileHunk(BaseHunk):
+    """Content which has been streamed into ``file``, a temporary file
+    opened in text mode, as filters do in streaming mode. The file goes
+    away along with the hunk.
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.file)
+
+    def mtime(self):
+        pass
+
+    def data(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def chunks(self):
+        self.file.seek(0)
+        for chunk in iter(lambda: self.file.read(CHUNK_SIZE), ''):
+            yield chunk
+
+    def __webassets_digest__(self):
+        return self._memoized_digest(self._streamed_digest)
+
+
+class HunkReader(io.TextIOBase):
+    """A read-only stream over the content of ``hunk``, which is pulled
+    from ``hunk.chunks()`` as it is read.
+
+    This is what streaming filters get as their input.
+    """
+
+    def __init__(self, hunk):
+        self.hunk = hunk
+        self._chunks = hunk.chunks()
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def _fill(self, until):
+        # Read chunks into the buffer until ``until(buffer)`` says stop,
+        # or there are no more.
+        while not until(self._buffer):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return
+            self._buffer += chunk
+
+    def _take(self, size):
+        result, self._buffer = self._buffer[:size], self._buffer[size:]
+        return result
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            result = self._buffer + ''.join(self._chunks)
+            self._buffer = ''
+            return result
+        self._fill(lambda buffer: len(buffer) >= size)
+        return self._take(size)
+
+    def readline(self, size=-1):
+        if size is None or size < 0:
+            size = None
+        self._fill(lambda buffer: '\n' in buffer or
+                                  (size is not None and len(buffer) >= size))
+        end = self._buffer.find('\n') + 1 or len(self._buffer)
+        if size is not None:
+            end = min(end, size)
+        return self._take(end)
+
+
+class HunkStore(object):
+    """Hands out the hunks for the source files of a build, such that all
+    the steps of the build share them: each file is read and decoded only
+    once, and its digest (for cache keys) computed only once.
+
+    A store should only live for the duration of a single build, both to
+    release the memory, and because changes to the files are not seen
+    after they have been read.
+
+    With ``read_once`` disabled, as in streaming mode, the contents are
+    not kept in memory, but read again as needed.
+    """
+
+    def __init__(self, read_once=True):
+        self.read_once = read_once
+        self._hunks = {}
+
+    def file(self, filename):
+        """Return a ``FileHunk`` for ``filename``."""
         try:
-            f.write(self.data())
-        finally:
-            f.close()
+            return self._hunks[filename]
+        except KeyError:
+            hunk = self._hunks[filename] = FileHunk(
+                filename, read_once=self.read_once)
+            return hunk
+
+    def url(self, url, env=None):
+        """Return a ``UrlHunk`` for ``url``."""
+        try:
+            return self._hunks[url]
+        except KeyError:
+            hunk = self._hunks[url] = UrlHunk(url, env=env)
+            return hunk
 
 
-def merge(hunks, separator=None):
+def merge(hunks, separator=None, lazy=False):
     """Merge the given list of hunks, returning a new ``MemoryHunk`` object.
+
+    If ``lazy`` is set, a ``MergedHunk`` is returned instead, which does
+    not read the hunks until its content is needed.
     """
     # TODO: combine the list of source files, we'd like to collect them
     # The linebreak is important in certain cases for Javascript
     # files, like when a last line is a //-comment.
     if not separator:
         separator = '\n'
+    if lazy:
+        return MergedHunk(list(hunks), separator)
     return MemoryHunk(separator.join([h.data() for h in hunks]))
 
 
+def _as_text(content):
+    """Return ``content``, a hunk, a stream or a string, as a string."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, BaseHunk):
+        return content.data()
+    content = content.getvalue()
+    if isinstance(content, bytes):
+        return content.decode('utf-8')
+    return content
+
+
+def _as_bytes(content):
+    """Return ``content``, a hunk, a stream or a string, as bytes."""
+    if isinstance(content, str):
+        return content.encode('utf-8')
+    if isinstance(content, BaseHunk):
+        return content.data_bytes()
+    content = content.getvalue()
+    if isinstance(content, str):
+        return content.encode('utf-8')
+    return content
+
+
+def _fuse_filters(filters, type):
+    """Group ``filters`` for running method ``type``.
+
+    Returns a list of filter lists. Adjacent filters which may apply
+    their ``transform()`` together (see ``Filter.fusion_key``) share a
+    list, any other filter is on its own.
+    """
+    groups = []
+    last_key = None
+    for filter in filters:
+        key = None
+        if type in getattr(filter, 'transforms', ()):
+            key = getattr(filter, 'fusion_key', None)
+        if key is not None and key == last_key:
+            groups[-1].append(filter)
+        else:
+            groups.append([filter])
+        last_key = key
+    return groups
+
+
+def _transform(filters, text, kwargs):
+    """Run the ``transform()`` of a group of ``filters`` on ``text``."""
+    if len(filters) > 1:
+        return type(filters[0]).transform_fused(filters, text, **kwargs)
+    return filters[0].transform(text, **kwargs)
+
+
+def _run_filters(filters, type, text, kwargs):
+    """Apply method ``type`` of ``filters`` to ``text``, returning the
+    result as a string. Used by ``FilterTool.apply_parallel()``, in the
+    worker processes.
+    """
+    for filter in filters:
+        if type in getattr(filter, 'transforms', ()):
+            text = filter.transform(text, **kwargs)
+        else:
+            out = StringIO(u'')
+            getattr(filter, type)(StringIO(text), out, **kwargs)
+            text = out.getvalue()
+    return text
+
+
+_css_token_re = re.compile(
+    r"""/\*.*?(?:\*/|$)|"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|[{};]""",
+    re.DOTALL)
+
+
+def split_css_rules(text, size=None):
+    """Split the stylesheet ``text`` into pieces of at least ``size``
+    characters (``PARALLEL_CHUNK_SIZE`` by default), where possible.
+    Pieces end with a top-level rule or statement, so that they can be
+    processed independently.
+    """
+    if size is None:
+        size = PARALLEL_CHUNK_SIZE
+    pieces = []
+    start = depth = 0
+    for m in _css_token_re.finditer(text):
+        token = m.group()
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth = max(depth - 1, 0)
+        elif token != ';' or depth:
+            continue
+        if depth == 0 and m.end() - start >= size:
+            pieces.append(text[start:m.end()])
+            start = m.end()
+    if start < len(text) or not pieces:
+        pieces.append(text[start:])
+    return pieces
+
+
 class MoreThanOneFilterError(Exception):
 
     def __init__(self, message, filters):
@@ -191,33 +611,61 @@ class FilterTool(object):
     this operation (though the result will still be written to the cache).
 
     ``kwargs`` are options that should be passed along to the filters.
+
+    If ``streaming`` is given, filters which support it (see
+    ``Filter.streaming``) read their input from, and write their output
+    to streams which do not hold the full content in memory.
     """
 
     VALID_TRANSFORMS = ('input', 'output',)
     VALID_FUNCS =  ('open', 'concat',)
 
-    def __init__(self, cache=None, no_cache_read=False, kwargs=None):
+    def __init__(self, cache=None, no_cache_read=False, kwargs=None,
+                 streaming=False):
         self.cache = cache
         self.no_cache_read = no_cache_read
         self.kwargs = kwargs or {}
+        self.streaming = streaming
+
+    def _cache_get(self, key):
+        """Return the cached content for ``key``, or ``None``."""
+        if self.cache and not self.no_cache_read:
+            log.debug('Checking cache for key %s', key)
+            content = self.cache.get(key)
+            if not content in (False, None):
+                log.debug('Using cached result for %s', key)
+                return content
+        return None
 
     def _wrap_cache(self, key, func):
         """Return cache value ``key``, or run ``func``.
         """
-        if self.cache:
-            if not self.no_cache_read:
-                log.debug('Checking cache for key %s', key)
-                content = self.cache.get(key)
-                if not content in (False, None):
-                    log.debug('Using cached result for %s', key)
-                    return MemoryHunk(content)
-
-        content = func().getvalue()
+        content = self._cache_get(key)
+        if content is not None:
+            return MemoryHunk(content)
+
+        result = func()
+        if isinstance(result, TempFileHunk):
+            # Streamed results are too large to hold in the cache.
+            return result
+        if isinstance(result, str):
+            content = result
+        elif isinstance(result, BaseHunk):
+            content = result.data()
+        else:
+            content = result.getvalue()
         if self.cache:
             log.debug('Storing result in cache with key %s', key,)
             self.cache.set(key, content)
         return MemoryHunk(content)
 
+    @staticmethod
+    def _tool_fingerprints(filters):
+        """Part of the cache key which changes when the external tools
+        used by ``filters`` are upgraded, see ``Filter.tool_fingerprint``.
+        """
+        return [f.tool_fingerprint() for f in filters]
+
     def apply(self, hunk, filters, type, kwargs=None):
         """Apply the given list of filters to the hunk, returning a new
         ``MemoryHunk`` object.
@@ -240,21 +688,69 @@ class FilterTool(object):
         kwargs_final.update(kwargs or {})
 
         def func():
-            data = StringIO(hunk.data())
-            for filter in filters:
+            # The content is passed on as a string, or as bytes between
+            # filters which support that (see ``Filter.bytes_capable``).
+            # Filters implementing ``Filter.transform`` skip the streams.
+            data = hunk
+            for group in _fuse_filters(filters, type):
+                filter = group[0]
                 log.debug('Running method "%s" of  %s with kwargs=%s',
-                    type, filter, kwargs_final)
-                out = StringIO(u'') # For 2.x, StringIO().getvalue() returns str
+                    type, group, kwargs_final)
+                if type in getattr(filter, 'transforms', ()):
+                    data = _transform(group, _as_text(data), kwargs_final)
+                    continue
+                if getattr(filter, 'bytes_capable', False):
+                    if not isinstance(data, BytesIO):
+                        data = BytesIO(_as_bytes(data))
+                    out = BytesIO()
+                else:
+                    if not isinstance(data, StringIO):
+                        data = StringIO(_as_text(data))
+                    out = StringIO(u'') # For 2.x, StringIO().getvalue() returns str
                 getattr(filter, type)(data, out, **kwargs_final)
                 data = out
                 data.seek(0)
 
             return data
 
+        def streaming_func():
+            current = hunk
+            for group in _fuse_filters(filters, type):
+                filter = group[0]
+                log.debug('Running method "%s" of  %s with kwargs=%s',
+                    type, group, kwargs_final)
+                if getattr(filter, 'streaming', False):
+                    data = HunkReader(current)
+                    out = tempfile.SpooledTemporaryFile(
+                        max_size=SPOOL_SIZE, mode='w+', encoding='utf-8',
+                        newline='')
+                    getattr(filter, type)(data, out, **kwargs_final)
+                    current = TempFileHunk(out)
+                elif type in getattr(filter, 'transforms', ()):
+                    current = MemoryHunk(
+                        _transform(group, current.data(), kwargs_final))
+                else:
+                    # Materialize the content for this filter.
+                    data = StringIO(current.data())
+                    out = StringIO(u'')
+                    getattr(filter, type)(data, out, **kwargs_final)
+                    current = MemoryHunk(out.getvalue())
+            return current
+
+        key = self._apply_cache_key(hunk, filters, type, kwargs_final)
+        return self._wrap_cache(
+            key, streaming_func if self.streaming else func)
+
+    def _apply_cache_key(self, hunk, filters, type, kwargs_final):
+        """The key under which the result of ``apply()`` is cached."""
         additional_cache_keys = []
         if kwargs_final:
             for filter in filters:
-                additional_cache_keys += filter.get_additional_cache_keys(**kwargs_final)
+                additional_cache_keys += filter.get_additional_cache_keys(
+                    **kwargs_final)
+                content_keys = getattr(filter, 'get_content_cache_keys', None)
+                if content_keys:
+                    additional_cache_keys += content_keys(hunk, **kwargs_final)
 
         # Note that the key used to cache this hunk is different from the key
         # the hunk will expose to subsequent merges, i.e. hunk.key() is always
@@ -269,8 +765,54 @@ class FilterTool(object):
         # key, such a change would invalidate the caches for all subsequent
         # operations on this hunk as well, even though it didn't actually
         # change after all.
-        key = ("hunk", hunk, tuple(filters), type, additional_cache_keys)
-        return self._wrap_cache(key, func)
+        return ("hunk", hunk, tuple(filters), type, additional_cache_keys,
+                self._tool_fingerprints(filters))
+
+    def apply_parallel(self, hunks, filters, type, workers, kwargs=None):
+        """Apply the given list of filters to each of ``hunks``, like
+        ``apply()``, returning a list of ``MemoryHunk`` objects.
+
+        The results not found in the cache are computed in a pool of up to
+        ``workers`` processes, to which the filters are passed by pickling.
+        """
+        assert type in self.VALID_TRANSFORMS
+        filters = [f for f in filters if getattr(f, type, None)]
+        if not filters:
+            return list(hunks)
+
+        kwargs_final = self.kwargs.copy()
+        kwargs_final.update(kwargs or {})
+
+        results = [None] * len(hunks)
+        pending = []
+        for i, hunk in enumerate(hunks):
+            key = self._apply_cache_key(hunk, filters, type, kwargs_final)
+            content = self._cache_get(key)
+            if content is not None:
+                results[i] = MemoryHunk(content)
+            else:
+                pending.append((i, key, hunk.data()))
+
+        log.debug('Running method "%s" of %s on %d of %d hunks with %d '
+                  'workers', type, filters, len(pending), len(hunks), workers)
+        if len(pending) > 1 and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                contents = list(executor.map(
+                    _run_filters,
+                    [filters] * len(pending), [type] * len(pending),
+                    [text for _, _, text in pending],
+                    [kwargs_final] * len(pending),
+                    chunksize=max(1, len(pending) // (workers * 4))))
+        else:
+            contents = [_run_filters(filters, type, text, kwargs_final)
+                        for _, _, text in pending]
+
+        for (i, key, _), content in zip(pending, contents):
+            if self.cache:
+                log.debug('Storing result in cache with key %s', key,)
+                self.cache.set(key, content)
+            results[i] = MemoryHunk(content)
+        return results
 
     def apply_func(self, filters, type, args, kwargs=None, cache_key=None):
         """Apply a filter that is not a "stream in, stream out" transform (i.e.
@@ -314,7 +856,8 @@ class FilterTool(object):
             for filter in filters:
                 additional_cache_keys += filter.get_additional_cache_keys(**kwargs_final)
 
-        key = ("hunk", args, tuple(filters), type, cache_key or [], additional_cache_keys)
+        key = ("hunk", args, tuple(filters), type, cache_key or [],
+               additional_cache_keys, self._tool_fingerprints(filters))
         return self._wrap_cache(key, func)
 
 
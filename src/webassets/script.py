@@ -5,7 +5,7 @@ import logging
 from io import StringIO
 
 from webassets.loaders import PythonLoader, YAMLLoader
-from webassets.bundle import get_all_bundle_files
+from webassets.bundle import get_all_bundle_files, collect_external
 from webassets.exceptions import BuildError
 from webassets.updater import TimestampUpdater
 from webassets.merge import MemoryHunk
@@ -299,6 +299,8 @@ class CleanCommand(Command):
             if os.path.exists(file_path):
                 os.unlink(file_path)
                 self.log.info("Deleted asset: %s" % bundle.output)
+        for file_path in collect_external(self.environment):
+            self.log.info("Deleted external file: %s" % file_path)
         if isinstance(self.environment.cache, FilesystemCache):
             shutil.rmtree(self.environment.cache.directory)
 
@@ -26,6 +26,8 @@ the cache is a superior solution for getting essentially the same speed
 increase as using the hash to reliably determine which bundles to skip.
 """
 
+import time
+
 from webassets.exceptions import BundleError, BuildError
 from webassets.utils import RegistryMetaclass, is_url, hash_func
 
@@ -115,6 +117,7 @@ class TimestampUpdater(BundleDefUpdater):
         from .bundle import Bundle
         from webassets.version import TimestampVersion
 
+        filter_depends = ()
         if not o_modified:
             try:
                 resolved_output = bundle.resolve_output(ctx)
@@ -139,6 +142,13 @@ class TimestampUpdater(BundleDefUpdater):
             except OSError:
                 # If the output file does not exist, we'll have to rebuild
                 return True
+            # An output file whose content did not change is not written
+            # again, so its timestamp may be older than the last build.
+            if ctx.cache:
+                build = ctx.cache.get(('build-time', resolved_output))
+                if build:
+                    built, filter_depends = build
+                    o_modified = max(o_modified, built)
 
        # Recurse through the bundle hierarchy. Check the timestamp of all
         # the bundle source files, as well as any additional
@@ -163,6 +173,20 @@ class TimestampUpdater(BundleDefUpdater):
                     else:
                         if s_modified > o_modified:
                             return result
+        return self.check_filter_depends(filter_depends, o_modified)
+
+    def check_filter_depends(self, filenames, o_modified):
+        """Check the files which filters have recorded as dependencies of
+        the source files of a bundle, like the images the ``cssrewrite``
+        filter adds digests for (see ``remember_build_time()``).
+        """
+        from webassets.version import TimestampVersion
+        for filename in filenames:
+            try:
+                if TimestampVersion.get_timestamp(filename) > o_modified:
+                    return True
+            except OSError:
+                return True
         return False
 
     def needs_rebuild(self, bundle, ctx):
@@ -177,8 +201,39 @@ class TimestampUpdater(BundleDefUpdater):
         # that are created, while still caching the globs as long
         # no changes happen.
         bundle._resolved_depends = None
+        if ctx.cache:
+            self.remember_build_time(bundle, ctx)
         super(TimestampUpdater, self).build_done(bundle, ctx)
 
+    def remember_build_time(self, bundle, ctx):
+        """If the output file was not written, because its content did
+        not change, its timestamp tells nothing about when the bundle was
+        last built. Record the time of the build in the cache instead.
+
+        Along with it, the files which filters recorded as dependencies of
+        the source files of the bundle are kept, so that they can be
+        checked without looking them up for every source file. Filters
+        record those in the cache, as a list of filenames under the key
+        ``('filter-depends', source_path)``.
+        """
+        from webassets.bundle import get_all_bundle_files
+        from webassets.version import TimestampVersion
+        now = int(time.time())
+        try:
+            resolved_output = bundle.resolve_output(ctx)
+            o_modified = TimestampVersion.get_timestamp(resolved_output)
+        except (BundleError, OSError):
+            return
+        filter_depends = []
+        for source_path in set(get_all_bundle_files(bundle, ctx)):
+            for filename in ctx.cache.get(
+                    ('filter-depends', source_path)) or ():
+                if filename not in filter_depends:
+                    filter_depends.append(filename)
+        if o_modified < now or filter_depends:
+            ctx.cache.set(('build-time', resolved_output),
+                          (now if o_modified < now else 0, filter_depends))
+
 
 class AlwaysUpdater(BaseUpdater):
 
@@ -1,10 +1,19 @@
 import base64
 import contextlib
+import contextvars
+import functools
 import hashlib
 import os
 import pickle
 import sys
 import re
+import shutil
+import stat
+import threading
+import time
+import types
+import uuid
+from collections import OrderedDict
 from io import StringIO
 from itertools import takewhile
 from urllib import parse as urlparse
@@ -19,8 +28,67 @@ md5_constructor = hashlib.md5
 set = set
 
 def hash_func(data):
-    from .cache import make_md5
-    return make_md5(data)
+    from .cache import make_digest
+    return make_digest(data)
+
+
+def resolve_hash_algorithm(algorithm):
+    """Return a ``(name, constructor)`` tuple for the hash ``algorithm``.
+
+    ``algorithm`` may be the name of an algorithm from ``hashlib`` (like
+    ``md5`` or ``blake2b``), the name of one from the ``xxhash`` module
+    (like ``xxh64`` or ``xxh3_128``), if it is installed, or a constructor
+    which returns an object with the ``hashlib`` interface. ``None`` means
+    the default, ``md5``.
+    """
+    if algorithm is None:
+        return 'md5', md5_constructor
+    if callable(algorithm):
+        return algorithm().name, algorithm
+
+    constructor = None
+    if algorithm.startswith('xxh'):
+        try:
+            import xxhash
+        except ImportError:
+            raise EnvironmentError(
+                'The "xxhash" module is required for the hash '
+                'algorithm "%s"' % algorithm)
+        constructor = getattr(xxhash, algorithm, None)
+    elif algorithm in hashlib.algorithms_guaranteed \
+            and not algorithm.startswith('shake'):
+        constructor = getattr(hashlib, algorithm)
+    if constructor is None:
+        raise ValueError('Unknown hash algorithm: %s' % algorithm)
+    return algorithm, constructor
+
+
+_hash_algorithm = contextvars.ContextVar(
+    'webassets_hash_algorithm', default=('md5', md5_constructor))
+
+
+def get_hash_algorithm():
+    """Return the ``(name, constructor)`` tuple of the hash algorithm
+    currently in use by ``hash_func``, see ``using_hash_algorithm``.
+    """
+    return _hash_algorithm.get()
+
+
+@contextlib.contextmanager
+def using_hash_algorithm(algorithm):
+    """Make ``hash_func``, and thus all cache keys and ids, use the given
+    hash ``algorithm`` (see ``resolve_hash_algorithm``) within the block.
+    """
+    current = _hash_algorithm.get()
+    if algorithm in current or (algorithm is None and current[0] == 'md5'):
+        # Already in effect, as when nested.
+        yield
+        return
+    token = _hash_algorithm.set(resolve_hash_algorithm(algorithm))
+    try:
+        yield
+    finally:
+        _hash_algorithm.reset(token)
 
 
 _directory_separator_re = re.compile(r"[/\\]+")
@@ -180,6 +248,86 @@ def cmp_debug_levels(level1, level2):
         raise BundleError('Invalid debug value: %s' % e)
 
 
+def function_digest(func):
+    """Return a digest identifying the Python function ``func``, which,
+    unlike ``hash(func)``, is the same across processes.
+
+    It is based on the function's module, qualified name and code,
+    including constants, default arguments and the values of any
+    closure variables. ``functools.partial`` objects are supported as
+    well.
+
+    Returns ``None`` if no stable identity can be determined, for example
+    because the function closes over an arbitrary object.
+
+    Note that functions called by ``func`` are referenced by name only;
+    if their code changes, the digest does not.
+    """
+    md5 = md5_constructor()
+    seen = set()
+
+    def feed(obj):
+        if obj is None or isinstance(obj, (bool, int, float, complex)):
+            md5.update(repr(obj).encode('utf-8'))
+        elif isinstance(obj, str):
+            md5.update(b's%d:' % len(obj))
+            md5.update(obj.encode('utf-8', 'surrogatepass'))
+        elif isinstance(obj, bytes):
+            md5.update(b'b%d:' % len(obj))
+            md5.update(obj)
+        elif isinstance(obj, (tuple, list, frozenset, set)):
+            items = sorted(obj, key=repr) \
+                if isinstance(obj, (set, frozenset)) else obj
+            md5.update(b'%s%d(' % (type(obj).__name__.encode(), len(items)))
+            for item in items:
+                if not feed(item):
+                    return False
+            md5.update(b')')
+        elif isinstance(obj, dict):
+            md5.update(b'dict%d(' % len(obj))
+            for key in sorted(obj, key=repr):
+                if not (feed(key) and feed(obj[key])):
+                    return False
+            md5.update(b')')
+        elif isinstance(obj, types.CodeType):
+            md5.update(b'code(')
+            md5.update(obj.co_code)
+            if not (feed(obj.co_consts) and feed(obj.co_names)):
+                return False
+            md5.update(b')')
+        elif isinstance(obj, types.FunctionType):
+            if id(obj) in seen:
+                # A recursive reference via a closure.
+                md5.update(b'recursive')
+                return True
+            seen.add(id(obj))
+            md5.update(b'function(')
+            if not feed((obj.__module__, obj.__qualname__, obj.__code__,
+                         obj.__defaults__, obj.__kwdefaults__)):
+                return False
+            for cell in obj.__closure__ or ():
+                try:
+                    value = cell.cell_contents
+                except ValueError:
+                    # Empty cell; the variable is not yet assigned.
+                    value = None
+                if not feed(value):
+                    return False
+            md5.update(b')')
+        elif isinstance(obj, functools.partial):
+            md5.update(b'partial(')
+            if not feed((obj.func, obj.args, obj.keywords)):
+                return False
+            md5.update(b')')
+        else:
+            return False
+        return True
+
+    if not feed(func):
+        return None
+    return md5.hexdigest()
+
+
 def is_url(s):
     if not isinstance(s, str):
         return False
@@ -187,6 +335,164 @@ def is_url(s):
     return bool(parsed.scheme and parsed.netloc) and len(parsed.scheme) > 1
 
 
+def _temp_name(filename):
+    directory, basename = os.path.split(filename)
+    return os.path.join(directory, '.%s.%s.tmp' % (
+        basename, uuid.uuid4().hex[:8]))
+
+
+def _has_content(filename, chunks):
+    """Whether the file ``filename`` consists of exactly the bytes in
+    ``chunks``. Stops reading at the first difference.
+    """
+    with open(filename, 'rb') as f:
+        for chunk in chunks:
+            if f.read(len(chunk)) != chunk:
+                return False
+        return not f.read(1)
+
+
+def write_file(filename, chunks, fsync=None):
+    """Write the bytes returned by ``chunks``, a callable returning an
+    iterable, to ``filename``.
+
+    If the file already has this content, it is left alone, so that its
+    modification time does not change. Otherwise, the content is written
+    to a temporary file in the same directory, which then replaces
+    ``filename``; readers thus never see a partially written file.
+
+    ``fsync`` may be ``'file'`` (or ``True``), to flush the file to disk
+    before it replaces the old one, or ``'full'``, to also flush the
+    directory afterwards, so the new file survives a crash.
+
+    Returns ``False`` if the file was left alone.
+    """
+    if os.path.isfile(filename) and _has_content(filename, chunks()):
+        return False
+
+    directory = os.path.dirname(filename)
+    temp = _temp_name(filename)
+    # Opened like open() would, so the file mode follows the umask.
+    fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                 getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks():
+                f.write(chunk)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        try:
+            os.chmod(temp, stat.S_IMODE(os.stat(filename).st_mode))
+        except OSError:
+            pass
+        os.replace(temp, filename)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+    if fsync == 'full' and hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory or '.', os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    return True
+
+
+# The ioctl which makes a file share the data of another on filesystems
+# like Btrfs and XFS, see ioctl_ficlone(2).
+_FICLONE = 0x40049409
+
+
+def _reflink(src, dst, size):
+    import fcntl
+    fcntl.ioctl(dst, _FICLONE, src)
+
+
+def _copy_file_range(src, dst, size):
+    while size > 0:
+        copied = os.copy_file_range(src, dst, size)
+        if not copied:
+            break
+        size -= copied
+
+
+def _sendfile(src, dst, size):
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst, src, offset, size - offset)
+        if not sent:
+            break
+        offset += sent
+
+
+def _copyfileobj(src, dst, size):
+    with open(src, 'rb', closefd=False) as fsrc, \
+            open(dst, 'wb', closefd=False) as fdst:
+        shutil.copyfileobj(fsrc, fdst)
+
+
+_copy_strategies = [('reflink', _reflink)]
+if hasattr(os, 'copy_file_range'):
+    _copy_strategies.append(('copy_file_range', _copy_file_range))
+if hasattr(os, 'sendfile'):
+    _copy_strategies.append(('sendfile', _sendfile))
+_copy_strategies.append(('copy', _copyfileobj))
+
+
+def link_or_copy(source, target):
+    """Make ``target`` have the content of the file ``source``, as cheaply
+    as the system allows, and without reading it into Python.
+
+    Tries, in this order: a hard link, which shares the file; a reflink,
+    which shares the data until either file changes (on filesystems which
+    support it); ``copy_file_range()`` and ``sendfile()``, which copy
+    within the kernel; and finally a plain copy. Copies are given the
+    modification time of ``source``.
+
+    Like :func:`write_file`, the new file replaces ``target`` only when
+    complete. Returns the name of the method used.
+    """
+    temp = _temp_name(target)
+    try:
+        os.link(source, temp)
+    except (OSError, AttributeError):
+        pass
+    else:
+        os.replace(temp, target)
+        return 'hardlink'
+
+    st = os.stat(source)
+    try:
+        with open(source, 'rb') as fsrc:
+            fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                         getattr(os, 'O_BINARY', 0), 0o666)
+            with os.fdopen(fd, 'wb') as fdst:
+                for method, copy in _copy_strategies:
+                    try:
+                        copy(fsrc.fileno(), fdst.fileno(), st.st_size)
+                    except (OSError, ImportError):
+                        # Not supported here; start over with the next.
+                        fsrc.seek(0)
+                        fdst.seek(0)
+                        fdst.truncate()
+                        continue
+                    break
+        os.utime(temp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(temp, target)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+    return method
+
+
 def calculate_sri(data):
     """Calculate SRI string for data buffer."""
     hash = hashlib.sha384()
@@ -196,6 +502,15 @@ def calculate_sri(data):
     return 'sha384-{}'.format(hash_base64)
 
 
+def calculate_sri_on_chunks(chunks):
+    """Calculate SRI string for the data in the iterable ``chunks``."""
+    hash = hashlib.sha384()
+    for chunk in chunks:
+        hash.update(chunk)
+    hash_base64 = base64.b64encode(hash.digest()).decode()
+    return 'sha384-{}'.format(hash_base64)
+
+
 def calculate_sri_on_file(file_name):
     """Calculate SRI string if file can be found. Otherwise silently return None"""
     BUF_SIZE = 65536
@@ -212,3 +527,80 @@ def calculate_sri_on_file(file_name):
         return 'sha384-{}'.format(hash_base64)
     except FileNotFoundError:
         return None
+
+
+# How many files a ``FileMemo`` keeps values for by default.
+DIGEST_CACHE_SIZE = 4096
+
+# Values for files changed within this many seconds are not kept, as a
+# filesystem with a coarse timestamp resolution may not show another change
+# made in the same time span.
+DIGEST_MIN_AGE = 2
+
+
+class FileMemo(object):
+    """Keeps values computed from files, like digests, along with the
+    ``stamp`` (the ``stat()`` values) they are valid for, so that they
+    need not be computed again while a file does not change.
+
+    Values are kept for at most ``size`` files, dropping the least
+    recently used ones, and not for files changed within the last
+    ``DIGEST_MIN_AGE`` seconds. May be used from several threads.
+    """
+
+    def __init__(self, size=DIGEST_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def get(self, key, stamp):
+        """Return the value for ``key``, if it was kept for ``stamp``, or
+        ``None``.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stamp:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, stamp, value, mtime):
+        """Keep ``value`` for ``key`` and ``stamp``, unless the
+        modification time of the file, ``mtime``, is too recent.
+        """
+        with self._lock:
+            if time.time() - mtime < DIGEST_MIN_AGE:
+                self._entries.pop(key, None)
+                return
+            self._entries[key] = (stamp, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# SRI strings by filename, along with the stat() values they are valid for.
+_sri_cache = FileMemo()
+
+
+def cached_sri_on_file(file_name):
+    """Like ``calculate_sri_on_file``, but the file is only hashed again
+    if its size or modification time changed since.
+    """
+    try:
+        st = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+    stamp = (st.st_size, st.st_mtime_ns)
+    sri = _sri_cache.get(file_name, stamp)
+    if sri is None:
+        sri = calculate_sri_on_file(file_name)
+        if sri is not None:
+            _sri_cache.set(file_name, stamp, sri, st.st_mtime)
+    return sri
@@ -4,9 +4,11 @@ implementations.
 
 import os
 import pickle
+import uuid
 
 from webassets.merge import FileHunk
-from webassets.utils import md5_constructor, RegistryMetaclass, is_url
+from webassets.utils import (
+    resolve_hash_algorithm, RegistryMetaclass, is_url)
 
 
 __all__ = ('get_versioner', 'VersionIndeterminableError',
@@ -128,14 +130,16 @@ class TimestampVersion(Version):
 
 
 class HashVersion(Version):
-    """Uses the MD5 hash of the content as the version.
+    """Uses the hash of the content as the version.
 
     By default, only the first 8 characters of the hash are used, which
     should be sufficient. This can be changed by passing the appropriate
     ``length`` value to ``__init__`` (or ``None`` to use the full hash).
 
-    You can also customize the hash used by passing the ``hash`` argument.
-    All constructors from ``hashlib`` are supported.
+    The hash algorithm is the one configured in
+    :attr:`Environment.hash_algorithm`, MD5 by default. You can also
+    customize the hash used by passing the ``hash`` argument. All
+    constructors from ``hashlib`` are supported.
     """
 
     id = 'hash'
@@ -145,7 +149,7 @@ class HashVersion(Version):
         args = [int(length)] if length else []
         return cls(*args)
 
-    def __init__(self, length=8, hash=md5_constructor):
+    def __init__(self, length=8, hash=None):
         self.length = length
         self.hasher = hash
 
@@ -159,8 +163,12 @@ class HashVersion(Version):
                 raise VersionIndeterminableError(
                     'output target has a placeholder')
 
-        hasher = self.hasher()
-        hasher.update(hunk.data().encode('utf-8'))
+        hasher = self.hasher
+        if hasher is None:
+            hasher = resolve_hash_algorithm(ctx.hash_algorithm)[1]
+        hasher = hasher()
+        for chunk in hunk.chunks_bytes():
+            hasher.update(chunk)
         return hasher.hexdigest()[:self.length]
 
 
@@ -204,6 +212,31 @@ class Manifest(metaclass=RegistryMetaclass(
     def query(self, bundle, ctx):
         raise NotImplementedError()
 
+    def remember_meta(self, bundle, ctx, meta):
+        """Store the dict ``meta`` of additional information about the
+        output of ``bundle``, like the sizes of compressed copies. Keys
+        already stored are kept, unless given again.
+
+        Manifests which do not support this may ignore it.
+        """
+
+    def query_meta(self, bundle, ctx):
+        """Return the dict of information stored by ``remember_meta()``.
+        """
+        return {}
+
+    def reload(self):
+        """Forget any data held in memory, so that it is read again from
+        the data source. Called by ``Environment.refresh_urls()``.
+        """
+
+    def generation(self, ctx):
+        """Return a value which changes whenever another process may have
+        changed the data of the manifest, so that those who keep versions
+        around know to look them up again. ``None`` if the manifest does
+        not track this, or its data is only ever read once.
+        """
+
 
 get_manifest = Manifest.resolve
 
@@ -217,11 +250,17 @@ class FileManifest(Manifest):
     ``CacheManifest`` instead.
 
     By default, the file is named ".webassets-manifest" and stored in
-    ``Environment.directory``.
+    ``Environment.directory``. The information given to ``remember_meta()``
+    is stored in a second file next to it, with ".meta" appended to the
+    name, so that the manifest itself remains a plain dict of outputs and
+    versions for other readers.
     """
 
     id = 'file'
 
+    # The version of the structure of the meta file.
+    META_FORMAT = 1
+
     @classmethod
     def make(cls, ctx, filename=None):
         if not filename:
@@ -230,7 +269,9 @@ class FileManifest(Manifest):
 
     def __init__(self, filename):
         self.filename = filename
+        self.meta_filename = '%s.meta' % filename
         self._load_manifest()
+        self._load_meta()
 
     def remember(self, bundle, ctx, version):
         self.manifest[bundle.output] = version
@@ -241,6 +282,19 @@ class FileManifest(Manifest):
             self._load_manifest()
         return self.manifest.get(bundle.output, None)
 
+    def remember_meta(self, bundle, ctx, meta):
+        self.meta.setdefault(bundle.output, {}).update(meta)
+        self._save_meta()
+
+    def query_meta(self, bundle, ctx):
+        if ctx.auto_build:
+            self._load_meta()
+        return self.meta.get(bundle.output, {})
+
+    def reload(self):
+        self._load_manifest()
+        self._load_meta()
+
     def _load_manifest(self):
         if os.path.exists(self.filename):
             with open(self.filename, 'rb') as f:
@@ -252,6 +306,19 @@ class FileManifest(Manifest):
         with open(self.filename, 'wb') as f:
             pickle.dump(self.manifest, f, protocol=2)
 
+    def _load_meta(self):
+        self.meta = {}
+        if os.path.exists(self.meta_filename):
+            with open(self.meta_filename, 'rb') as f:
+                stored = pickle.load(f)
+            if stored.get('format') == self.META_FORMAT:
+                self.meta = stored['outputs']
+
+    def _save_meta(self):
+        with open(self.meta_filename, 'wb') as f:
+            pickle.dump({'format': self.META_FORMAT, 'outputs': self.meta},
+                        f, protocol=2)
+
 
 class JsonManifest(FileManifest):
     """Same as ``FileManifest``, but uses JSON instead of pickle."""
@@ -277,6 +344,19 @@ class JsonManifest(FileManifest):
         with open(self.filename, 'w') as f:
             self.json.dump(self.manifest, f, indent=4, sort_keys=True)
 
+    def _load_meta(self):
+        self.meta = {}
+        if os.path.exists(self.meta_filename):
+            with open(self.meta_filename, 'r') as f:
+                stored = self.json.load(f)
+            if stored.get('format') == self.META_FORMAT:
+                self.meta = stored['outputs']
+
+    def _save_meta(self):
+        with open(self.meta_filename, 'w') as f:
+            self.json.dump({'format': self.META_FORMAT, 'outputs': self.meta},
+                           f, indent=4, sort_keys=True)
+
 
 class CacheManifest(Manifest):
     """Stores version data in the webassets cache.
@@ -300,11 +380,26 @@ class CacheManifest(Manifest):
     def remember(self, bundle, ctx, version):
         self._check(ctx)
         ctx.cache.set(('manifest', bundle.output), version)
+        ctx.cache.set(('manifest-generation',), uuid.uuid4().hex)
 
     def query(self, bundle, ctx):
         self._check(ctx)
         return ctx.cache.get(('manifest', bundle.output))
 
+    def generation(self, ctx):
+        self._check(ctx)
+        return ctx.cache.get(('manifest-generation',))
+
+    def remember_meta(self, bundle, ctx, meta):
+        self._check(ctx)
+        stored = dict(self.query_meta(bundle, ctx))
+        stored.update(meta)
+        ctx.cache.set(('manifest-meta', bundle.output), stored)
+
+    def query_meta(self, bundle, ctx):
+        self._check(ctx)
+        return ctx.cache.get(('manifest-meta', bundle.output)) or {}
+
 
 class SymlinkManifest(Manifest):
     """Creates a symlink to the actual file.
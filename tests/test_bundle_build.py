@@ -6,6 +6,8 @@ more likely` found in `test_bundle_various.py``.
 
 
 import os
+import re
+from unittest.mock import patch
 
 from pytest import raises as assert_raises
 import pytest
@@ -153,6 +155,470 @@ class TestBuildVarious(TempEnvironmentHelper):
         assert buffer.getvalue() == 'A\nB'
         assert not self.exists('out')    # file was not written.
 
+    def test_filter_setup_is_memoized(self):
+        """Filter.setup() runs once, until the configuration changes."""
+        class SetupCountingFilter(Filter):
+            setup_calls = 0
+            def setup(self):
+                SetupCountingFilter.setup_calls += 1
+            def output(self, _in, out, **kw):
+                out.write(_in.read())
+        b = self.mkbundle('in1', output='out', filters=SetupCountingFilter())
+        b.build(force=True)
+        b.build(force=True)
+        assert SetupCountingFilter.setup_calls == 1
+
+        # A change to the environment or bundle config is noticed
+        self.env.config['some_setting'] = 'value'
+        b.build(force=True)
+        assert SetupCountingFilter.setup_calls == 2
+        b.config['some_setting'] = 'value'
+        b.build(force=True)
+        assert SetupCountingFilter.setup_calls == 3
+
+        # Invalidation may also be requested explicitly
+        self.env.config.touch()
+        b.build(force=True)
+        assert SetupCountingFilter.setup_calls == 4
+
+    def test_filter_setup_notices_os_environ(self):
+        """A filter is set up again when an OS environment variable it
+        read through get_config() changes.
+        """
+        class EnvFilter(Filter):
+            def setup(self):
+                self.binary = self.get_config(env='ENV_FILTER_BIN',
+                                              require=False)
+            def output(self, _in, out, **kw):
+                out.write(self.binary or '')
+        b = self.mkbundle('in1', output='out', filters=EnvFilter())
+        with patch.dict('os.environ', {'ENV_FILTER_BIN': 'a'}):
+            b.build(force=True)
+            assert self.get('out') == 'a'
+            os.environ['ENV_FILTER_BIN'] = 'b'
+            b.build(force=True)
+            assert self.get('out') == 'b'
+
+    def test_source_files_read_once(self):
+        """During a build, each source file is read only once, even if
+        used for cache keys and filters, and by multiple bundles."""
+        self.env.cache = MemoryCache(100)
+        class InputFilter(Filter):
+            def input(self, _in, out, **kw):
+                out.write(_in.read().upper())
+        reads = []
+        import webassets.merge
+        real_open = webassets.merge.open
+        def counting_open(filename, mode='r', *a, **kw):
+            if 'r' in mode:
+                reads.append(filename)
+            return real_open(filename, mode, *a, **kw)
+        b = self.mkbundle(
+            'in1', self.mkbundle('in1', 'in2'),
+            output='out', filters=InputFilter())
+        with patch('webassets.merge.open', counting_open, create=True):
+            b.build(force=True)
+        assert self.get('out') == 'A\nA\nB'
+        assert sorted(reads) == [self.path('in1'), self.path('in2')]
+
+
+class TestBytesCapableFilters(TempEnvironmentHelper):
+    """Filters can work with bytes instead of strings."""
+
+    def test_bytes_filters(self):
+        received = []
+        class BytesFilter(Filter):
+            bytes_capable = True
+            def output(self, _in, out, **kw):
+                data = _in.read()
+                received.append(data)
+                out.write(data.upper())
+        class TextFilter(Filter):
+            def output(self, _in, out, **kw):
+                data = _in.read()
+                received.append(data)
+                out.write(data + u'ñ')
+        self.create_files({'in1': u'fooñ', 'in2': 'bar'})
+        self.mkbundle('in1', 'in2', output='out', filters=[
+            BytesFilter(), TextFilter()]).build()
+        assert received == [u'fooñ\nbar'.encode('utf-8'), u'FOOñ\nBAR']
+        assert self.get('out') == u'FOOñ\nBARñ'
+
+    def test_line_endings(self):
+        """Bytes and string content agree on how line endings are
+        treated."""
+        from webassets.merge import FileHunk, MemoryHunk
+        self.create_files({'crlf': 'a\r\nb', 'lf': 'a\nb'})
+        for name in ('crlf', 'lf'):
+            for read_once in (False, True):
+                hunk = FileHunk(self.path(name), read_once=read_once)
+                assert hunk.data_bytes() == b'a\nb'
+                assert hunk.data() == 'a\nb'
+                assert hunk.id() == MemoryHunk(b'a\nb').id() == \
+                    MemoryHunk('a\nb').id()
+
+
+class TestTransformFilters(TempEnvironmentHelper):
+    """Filters implementing ``transform()`` are given strings."""
+
+    def test_transform_filters(self):
+        received = []
+        class TransformFilter(Filter):
+            transforms = ('input', 'output')
+            def transform(self, text, **kw):
+                received.append(text)
+                return text + '!'
+            def input(self, _in, out, **kw):
+                raise AssertionError('transform() should have been used')
+            output = input
+        class StreamFilter(Filter):
+            def output(self, _in, out, **kw):
+                out.write(_in.read().upper())
+        self.create_files({'in1': 'foo', 'in2': 'bar'})
+        self.mkbundle('in1', 'in2', output='out', filters=[
+            TransformFilter(), StreamFilter()]).build()
+        assert received == ['foo', 'bar', 'foo!\nbar!']
+        assert self.get('out') == 'FOO!\nBAR!!'
+
+    def test_pattern_rewriter_subclass_input(self):
+        """Subclasses which customize input() still have it called."""
+        from webassets.filter.cssrewrite import CSSRewrite
+        class MyRewrite(CSSRewrite):
+            def input(self, _in, out, **kw):
+                out.write('/* mine */')
+                super(MyRewrite, self).input(_in, out, **kw)
+        assert CSSRewrite().transforms == ('input',)
+        assert MyRewrite().transforms == ()
+        self.create_files({'in': 'h1 { background: url(a.png) }'})
+        self.mkbundle('in', output='sub/out', filters=MyRewrite()).build()
+        assert self.get('sub/out') == \
+            '/* mine */h1 { background: url(../a.png) }'
+
+
+class TestPerFileOutput(TempEnvironmentHelper):
+    """Test the ``per_file_output`` option."""
+
+    default_files = {'in1': 'a', 'in2': 'b', 'in3': 'c'}
+
+    def setup_method(self):
+        super().setup_method()
+        self.env.per_file_output = True
+        self.env.cache = True
+        self.received = received = []
+        class Minify(Filter):
+            concat_distributive = True
+            def output(self, _in, out, **kw):
+                data = _in.read()
+                received.append(data)
+                out.write(data.upper())
+        class Wrap(Filter):
+            def output(self, _in, out, **kw):
+                out.write('(%s)' % _in.read())
+        self.minify, self.wrap = Minify(), Wrap()
+
+    def test_applied_per_file(self):
+        bundle = self.mkbundle('in1', 'in2', 'in3', output='out',
+                               filters=[self.minify, self.wrap])
+        bundle.build()
+        assert self.received == ['a', 'b', 'c']
+        assert self.get('out') == '(A\nB\nC)'
+
+        # Only the changed file is filtered again.
+        self.create_files({'in2': 'x'})
+        bundle.build(force=True)
+        assert self.received == ['a', 'b', 'c', 'x']
+        assert self.get('out') == '(A\nX\nC)'
+
+    def test_only_leading_filters(self):
+        """Filters after one which needs the merged content are not
+        distributed."""
+        bundle = self.mkbundle('in1', 'in2', 'in3', output='out',
+                               filters=[self.wrap, self.minify])
+        bundle.build()
+        assert self.received == ['(a\nb\nc)']
+        assert self.get('out') == '(A\nB\nC)'
+
+    def test_disabled(self):
+        self.env.per_file_output = False
+        self.mkbundle('in1', 'in2', 'in3', output='out',
+                      filters=[self.minify]).build()
+        assert self.received == ['a\nb\nc']
+
+
+class TestOutputs(TempEnvironmentHelper):
+    """Test additional outputs of a bundle."""
+
+    default_files = {'in1': 'a', 'in2': 'b'}
+
+    def setup_method(self):
+        super().setup_method()
+        self.inputs = inputs = []
+        class Input(Filter):
+            def input(self, _in, out, **kw):
+                inputs.append(kw['output'])
+                out.write(_in.read() + '!')
+        class Upper(Filter):
+            def output(self, _in, out, **kw):
+                out.write(_in.read().upper())
+        class Wrap(Filter):
+            def output(self, _in, out, **kw):
+                out.write('(%s)' % _in.read())
+        self.input, self.upper, self.wrap = Input(), Upper(), Wrap()
+
+    def test_shared_input(self):
+        bundle = self.mkbundle(
+            'in1', 'in2', output='out', filters=[self.input, self.upper],
+            outputs={'wrapped': {'output': 'out.wrapped',
+                                 'filters': [self.wrap]},
+                     'plain': 'out.plain'})
+        hunks = bundle.build()
+        assert len(hunks) == 3
+        assert self.inputs == ['out', 'out']
+        assert self.get('out') == 'A!\nB!'
+        assert self.get('out.wrapped') == '(a!\nb!)'
+        assert self.get('out.plain') == 'a!\nb!'
+
+        # The outputs can be used like bundles.
+        wrapped = bundle.outputs['wrapped']
+        assert wrapped.urls() == ['/out.wrapped?%s' % wrapped.get_version()]
+        wrapped.build(force=True)
+        assert self.get('out.wrapped') == '(a!\nb!)'
+
+    def test_debug_level(self):
+        """The output filters of an output respect the debug level."""
+        self.env.debug = 'merge'
+        bundle = self.mkbundle(
+            'in1', 'in2', output='out',
+            outputs={'wrapped': {'output': 'out.wrapped',
+                                 'filters': [self.wrap]}})
+        bundle.build()
+        assert self.get('out.wrapped') == 'a\nb'
+
+    def test_other_directory(self):
+        """The input step is not shared with outputs in another
+        directory."""
+        bundle = self.mkbundle(
+            'in1', 'in2', output='out', filters=[self.input],
+            outputs={'sub': 'sub/out'})
+        bundle.build()
+        assert self.inputs == ['out', 'out', 'sub/out', 'sub/out']
+        assert self.get('sub/out') == 'a!\nb!'
+
+    def test_id(self):
+        bundle = self.mkbundle('in1', output='out',
+                               outputs={'a': 'out.a', 'b': 'out.b'})
+        ids = set([bundle.id(), bundle.outputs['a'].id(),
+                   bundle.outputs['b'].id()])
+        assert len(ids) == 3
+        old = bundle.outputs['a'].id()
+        bundle.contents = ('in2',)
+        assert bundle.outputs['a'].id() != old
+
+
+class TestWriteOutput(TempEnvironmentHelper):
+    """Test how the output file is written."""
+
+    default_files = {'in': 'foo'}
+
+    def test_unchanged_content(self):
+        """A file which already has the content is not written again."""
+        self.env.cache = MemoryCache(100)
+        bundle = self.mkbundle('in', output='out')
+        bundle.build()
+        mtime = self.setmtime('out', mod=-100)
+        bundle.build(force=True)
+        assert os.path.getmtime(self.path('out')) == mtime
+
+        self.create_files({'in': 'bar'})
+        bundle.build(force=True)
+        assert self.get('out') == 'bar'
+        assert os.path.getmtime(self.path('out')) > mtime
+
+    def test_replaced(self):
+        """The new content goes to a temporary file first, which then
+        replaces the output file.
+        """
+        bundle = self.mkbundle('in', output='out')
+        bundle.build()
+        with open(self.path('out')) as f:
+            self.create_files({'in': 'bar'})
+            self.env.output_fsync = 'full'
+            bundle.build(force=True)
+            # The file we have open is not touched.
+            assert f.read() == 'foo'
+        assert self.get('out') == 'bar'
+        assert sorted(os.listdir(self.tempdir)) == ['in', 'out']
+
+    def test_failure(self):
+        """The temporary file is removed if writing fails."""
+        def fail():
+            yield b'foo'
+            raise ValueError()
+        from webassets.utils import write_file
+        with pytest.raises(ValueError):
+            write_file(self.path('out'), fail)
+        assert os.listdir(self.tempdir) == ['in']
+
+
+class TestPrecompress(TempEnvironmentHelper):
+    """Test the ``precompress`` option."""
+
+    default_files = {'in': 'foo' * 100}
+
+    def setup_method(self):
+        super().setup_method()
+        self.env.precompress = ['gz']
+        self.env.cache = True
+        self.env.manifest = 'json'
+
+    def test_gz(self):
+        import gzip
+        bundle = self.mkbundle('in', output='out')
+        bundle.build()
+        with open(self.path('out.gz'), 'rb') as f:
+            data = f.read()
+        assert gzip.decompress(data) == b'foo' * 100
+        meta = self.env.manifest.query_meta(bundle, self.env)
+        assert meta['compressed_sizes'] == {'gz': len(data)}
+
+        # Unchanged output is not compressed again.
+        with patch('webassets.bundle._compress_gz') as compress:
+            bundle.build(force=True)
+        assert not compress.called
+
+        self.create_files({'in': 'bar'})
+        bundle.build(force=True)
+        with open(self.path('out.gz'), 'rb') as f:
+            assert gzip.decompress(f.read()) == b'bar'
+
+    def test_missing_copy_written(self):
+        """Files which are up to date get their missing copies."""
+        self.env.precompress = None
+        bundle = self.mkbundle('in', output='out')
+        bundle.build()
+        self.env.precompress = ['gz']
+        bundle.build()
+        assert os.path.exists(self.path('out.gz'))
+        assert 'gz' in self.env.manifest.query_meta(
+            bundle, self.env)['compressed_sizes']
+
+        # Once they exist, checking the bundle does not write anything.
+        with patch.object(type(self.env.manifest), 'remember_meta') as remember, \
+                patch('webassets.merge.FileHunk.id') as hunk_id:
+            bundle.build()
+        assert not remember.called
+        assert not hunk_id.called
+
+    def test_brotli_missing(self):
+        try:
+            import brotli
+        except ImportError:
+            self.env.precompress = ['br']
+            with pytest.raises(EnvironmentError):
+                self.mkbundle('in', output='out').build()
+        else:
+            pytest.skip('brotli is installed')
+
+    def test_unknown_format(self):
+        self.env.precompress = ['zip']
+        with pytest.raises(BuildError):
+            self.mkbundle('in', output='out').build()
+
+
+class PidFilter(Filter):
+    """Tags each piece of the content with the process it was filtered
+    in; used to test ``output_workers``."""
+    concat_distributive = 'rules'
+    def output(self, _in, out, **kw):
+        out.write('%s@%d' % (_in.read(), os.getpid()))
+
+
+class TestOutputWorkers(TempEnvironmentHelper):
+    """Test the ``output_workers`` option."""
+
+    default_files = {'in1': 'a{b:c}d{e:f}', 'in2': 'g{h:i}'}
+
+    def setup_method(self):
+        super().setup_method()
+        self.env.output_workers = 2
+
+    def test_parallel(self):
+        self.mkbundle('in1', 'in2', output='out', filters=PidFilter()).build()
+        pieces = self.get('out').split('\n')
+        assert [p.split('@')[0] for p in pieces] == ['a{b:c}d{e:f}', 'g{h:i}']
+        assert str(os.getpid()) not in self.get('out')
+
+    def test_split_rules(self):
+        with patch('webassets.merge.PARALLEL_CHUNK_SIZE', 1):
+            self.mkbundle('in1', 'in2', output='out',
+                          filters=PidFilter()).build()
+        assert re.sub(r'@\d+', '@', self.get('out')) == \
+            'a{b:c}@d{e:f}@\ng{h:i}@'
+
+    def test_rjsmin(self):
+        self.create_files({'a.js': 'function a ( x ) { return x ; }',
+                           'b.js': 'var b = 1 ;'})
+        self.mkbundle('a.js', 'b.js', output='out', filters='rjsmin').build()
+        assert self.get('out') == 'function a(x){return x;}\nvar b=1;'
+
+    def test_not_in_streaming_mode(self):
+        self.env.streaming = True
+        self.mkbundle('in1', 'in2', output='out', filters=PidFilter()).build()
+        assert self.get('out') == 'a{b:c}d{e:f}\ng{h:i}@%d' % os.getpid()
+
+
+class TestStreaming(TempEnvironmentHelper):
+    """Test building with the ``streaming`` option."""
+
+    default_files = {'in1': 'a' * 100000, 'in2': 'b' * 100000}
+
+    def setup_method(self):
+        super().setup_method()
+        self.env.streaming = True
+
+    def test_streaming_filters(self):
+        """Streaming filters get their input piece by piece, others get
+        all of it at once; they can be combined."""
+        reads = []
+        class StreamingFilter(Filter):
+            streaming = True
+            def output(self, _in, out, **kw):
+                for chunk in iter(lambda: _in.read(1000), ''):
+                    reads.append(len(chunk))
+                    out.write(chunk.upper())
+        class RegularFilter(Filter):
+            def output(self, _in, out, **kw):
+                data = _in.read()
+                reads.append(len(data))
+                out.write(data[::-1])
+        self.mkbundle('in1', 'in2', output='out',
+                      filters=[StreamingFilter()]).build()
+        assert self.get('out') == 'A' * 100000 + '\n' + 'B' * 100000
+        assert max(reads) == 1000
+
+        del reads[:]
+        self.mkbundle('in1', 'in2', output='out2',
+                      filters=[StreamingFilter(), RegularFilter()]).build()
+        assert self.get('out2') == 'B' * 100000 + '\n' + 'A' * 100000
+        assert max(reads) == 200001
+
+    def test_no_filters(self):
+        """Content is merged and written without filters as well."""
+        self.mkbundle('in1', self.mkbundle('in2'), output='out').build()
+        assert self.get('out') == 'a' * 100000 + '\n' + 'b' * 100000
+
+    def test_streaming_hunk_reader(self):
+        """The stream streaming filters read from supports the usual
+        read methods."""
+        from webassets.merge import HunkReader, merge, MemoryHunk
+        hunk = merge([MemoryHunk('foo\nbar'), MemoryHunk('baz\n')], lazy=True)
+        assert list(HunkReader(hunk)) == ['foo\n', 'bar\n', 'baz\n']
+        reader = HunkReader(hunk)
+        assert reader.read(2) == 'fo'
+        assert reader.readline() == 'o\n'
+        assert reader.read() == 'bar\nbaz\n'
+        assert reader.read(5) == ''
+
 
 class TestBuildWithVariousDebugOptions(TempEnvironmentHelper):
     """Test build behavior with respect to the "debug level", and the various
@@ -4,7 +4,9 @@ However, URL generation that is associated with a special feature is
 more likely` found in `test_bundle_various.py``.
 """
 
+import os
 import re
+from unittest.mock import patch
 
 import pytest
 
@@ -144,6 +146,62 @@ class TestUrlsVarious(BaseUrlsTester):
             assert re.match(r'.*/webassets-external/[\da-z]*_foo.css', urls[0]['uri'])
             assert urls[0]['sri'] == _EMPTY_FILE_SRI
 
+    def test_external_refs_binary(self):
+        """External files are copied as they are, not decoded."""
+        self.env.debug = True
+        with TempDirHelper() as h:
+            data = b'\x89PNG\r\n\xff\x00'
+            with open(h.path('foo.png'), 'wb') as f:
+                f.write(data)
+            bundle = self.mkbundle(h.path('foo.png'))
+            url = bundle.urls()[0]
+            filename = self.path(url[len(self.env.url) + 1:])
+            with open(filename, 'rb') as f:
+                assert f.read() == data
+
+    @pytest.mark.parametrize('fail', ['link', 'copy_strategies'])
+    def test_external_refs_copied(self, fail):
+        """If the file cannot be linked, it is copied, and changes to it
+        are noticed.
+        """
+        import webassets.utils
+        self.env.debug = True
+        strategies = webassets.utils._copy_strategies
+        if fail == 'copy_strategies':
+            def unsupported(*a):
+                raise OSError()
+            strategies = [('reflink', unsupported)] + strategies[-1:]
+        with TempDirHelper() as h, \
+                patch('os.link', side_effect=OSError()), \
+                patch('webassets.utils._copy_strategies', strategies):
+            h.create_files({'foo.css': 'foo'})
+            bundle = self.mkbundle(h.path('foo.css'))
+            url = bundle.urls()[0]
+            filename = self.path(url[len(self.env.url) + 1:])
+            assert self.get(filename) == 'foo'
+            assert not os.path.samefile(filename, h.path('foo.css'))
+
+            with patch('webassets.bundle.link_or_copy') as copy:
+                bundle.urls()
+            assert not copy.called
+
+            h.create_files({'foo.css': 'foobar'})
+            assert bundle.urls() == [url]
+            assert self.get(filename) == 'foobar'
+
+    def test_external_refs_collected(self):
+        """External files no bundle refers to anymore are deleted."""
+        from webassets.bundle import collect_external
+        self.env.debug = True
+        with TempDirHelper() as h:
+            h.create_files(['foo.css', 'bar.css'])
+            self.env.register('foo', h.path('foo.css'))
+            foo = self.env['foo'].urls()[0]
+            bar = self.mkbundle(h.path('bar.css')).urls()[0]
+            deleted = collect_external(self.env)
+            assert deleted == [self.path(bar[len(self.env.url) + 1:])]
+            assert os.path.exists(self.path(foo[len(self.env.url) + 1:]))
+
 
 class TestUrlsWithDebugFalse(BaseUrlsTester):
     """Test url generation in production mode - everything is always built.
@@ -492,3 +550,160 @@ class TestUrlsWithDebugMerge(BaseUrlsTester):
             'c', output='out')
         assert bundle.urls(calculate_sri=True) == [{'sri': None, 'uri': '/out'}]
         assert len(self.build_called) == 1
+
+
+class TestSri(TempEnvironmentHelper):
+    """Test how the SRI strings are determined."""
+
+    default_files = {'a': 'foo', 'b': 'bar'}
+
+    def setup_method(self):
+        super().setup_method()
+        self.env.manifest = 'json'
+        self.env.auto_build = False
+
+    def test_computed_at_build(self):
+        from webassets.utils import calculate_sri_on_file
+        bundle = self.mkbundle('a', 'b', output='out')
+        bundle.build()
+        expected = calculate_sri_on_file(self.path('out'))
+        assert self.env.manifest.query_meta(bundle, self.env)['sri'] == expected
+
+        # Neither this bundle, nor one reading the manifest, reads the file.
+        fresh = self.mkbundle('a', 'b', output='out')
+        with patch('webassets.utils.calculate_sri_on_file') as calculate:
+            assert bundle.urls(calculate_sri=True)[0]['sri'] == expected
+            assert fresh.urls(calculate_sri=True)[0]['sri'] == expected
+        assert not calculate.called
+
+    def test_not_in_manifest(self):
+        """Files unknown to the manifest are only hashed once."""
+        from webassets.utils import calculate_sri_on_file
+        self.env.debug = True
+        self.setmtime('a', 'b', mod=-10)
+        bundle = self.mkbundle('a', 'b', output='out')
+        with patch('webassets.utils.calculate_sri_on_file',
+                   wraps=calculate_sri_on_file) as calculate:
+            urls = bundle.urls(calculate_sri=True)
+            assert bundle.urls(calculate_sri=True) == urls
+        assert calculate.call_count == 2
+        assert urls[0]['sri'] == calculate_sri_on_file(self.path('a'))
+
+        self.create_files({'a': 'foobar'})
+        assert bundle.urls(calculate_sri=True)[0]['sri'] == \
+            calculate_sri_on_file(self.path('a'))
+
+
+class TestCompiledUrls(TempEnvironmentHelper):
+    """Test urls() being answered from ``Environment.compile_urls()``."""
+
+    default_files = {'a': 'foo'}
+
+    def setup_method(self):
+        super().setup_method()
+        self.env.manifest = 'json'
+        self.bundle = self.env.register('a_bundle', 'a', output='out')
+        self.bundle.build()
+        self.env.auto_build = False
+
+    def test_no_io(self):
+        urls = self.bundle.urls()
+        sri_urls = self.bundle.urls(calculate_sri=True)
+        self.env.compile_urls()
+        with patch.object(Bundle, '_urls', side_effect=AssertionError), \
+                patch('os.stat', side_effect=AssertionError), \
+                patch('builtins.open', side_effect=AssertionError):
+            assert self.bundle.urls() == urls
+            assert self.bundle.urls(calculate_sri=True) == sri_urls
+        assert sri_urls[0]['sri']
+
+    def test_config_change(self):
+        self.env.compile_urls()
+        self.env.url = '/other'
+        assert self.bundle.urls()[0].startswith('/other/')
+
+    def test_refresh(self):
+        self.env.compile_urls()
+        urls = self.bundle.urls()
+
+        # Another process deploys a new version.
+        with open(self.env.manifest.filename, 'w') as f:
+            f.write('{"out": "new-version"}')
+        assert self.bundle.urls() == urls
+        self.env.refresh_urls()
+        assert self.bundle.urls() == ['/out?new-version']
+
+    def test_refresh_sri(self):
+        """After a deployment by another process, the SRI strings are
+        those of the new files.
+        """
+        from webassets import Environment
+        from webassets.utils import calculate_sri_on_file
+        self.env.compile_urls()
+        old = self.bundle.urls(calculate_sri=True)[0]
+
+        other = Environment(self.tempdir, '', manifest='json')
+        self.create_files({'a': 'bar'})
+        other.register('a_bundle', 'a', output='out').build(force=True)
+
+        self.env.refresh_urls()
+        new = self.bundle.urls(calculate_sri=True)[0]
+        assert new['uri'] != old['uri']
+        assert new['sri'] == calculate_sri_on_file(self.path('out'))
+        assert new['sri'] != old['sri']
+
+    def test_manifest_changed(self):
+        """The index is compiled again when another process changed the
+        manifest, as far as the manifest can tell."""
+        from webassets import Environment
+        self.env.cache = True
+        self.env.manifest = 'cache'
+        self.bundle.build(force=True)
+        self.env.compile_urls()
+        urls = self.bundle.urls(calculate_sri=True)
+
+        other = Environment(self.tempdir, '', cache=True, manifest='cache')
+        self.create_files({'a': 'bar'})
+        other.register('a_bundle', 'a', output='out').build(force=True)
+
+        new = self.bundle.urls(calculate_sri=True)
+        assert new != urls
+        assert new == other['a_bundle'].urls(calculate_sri=True)
+        # From then on, the new index is used.
+        with patch.object(Bundle, '_urls', side_effect=AssertionError):
+            assert self.bundle.urls(calculate_sri=True) == new
+
+    def test_build(self):
+        """A build in this process drops the index."""
+        self.env.compile_urls()
+        urls = self.bundle.urls()
+        self.create_files({'a': 'bar'})
+        self.bundle.build(force=True)
+        assert self.bundle.urls() != urls
+
+
+class TestSriCache(TempDirHelper):
+    """The SRI hashes of files are kept only while they can be trusted."""
+
+    def test_same_stamp_rewrite(self):
+        """[Regression] A file rewritten with the same size and timestamp
+        right after it was hashed gets a new hash."""
+        from webassets.utils import cached_sri_on_file, calculate_sri_on_file
+        self.create_files({'out': 'foo'})
+        mtime = self.setmtime('out')
+        sri = cached_sri_on_file(self.path('out'))
+        self.create_files({'out': 'bar'})
+        self.setmtime('out', mtime=mtime)
+        assert cached_sri_on_file(self.path('out')) != sri
+        assert cached_sri_on_file(self.path('out')) == \
+            calculate_sri_on_file(self.path('out'))
+
+    def test_bounded(self):
+        from webassets import utils
+        self.create_files({'a': 'a', 'b': 'b'})
+        self.setmtime('a', 'b', mod=-10)
+        utils._sri_cache.clear()
+        with patch.object(utils._sri_cache, 'size', 1):
+            utils.cached_sri_on_file(self.path('a'))
+            utils.cached_sri_on_file(self.path('b'))
+        assert list(utils._sri_cache) == [self.path('b')]
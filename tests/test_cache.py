@@ -1,10 +1,14 @@
+import hashlib
 import random
+from unittest.mock import patch
 import pytest
 
 from webassets.filter import Filter
-from webassets.cache import BaseCache, FilesystemCache, MemoryCache
+from webassets.cache import (
+    BaseCache, FilesystemCache, MemoryCache, make_digest)
 from webassets.updater import TimestampUpdater
-from webassets.merge import MemoryHunk
+from webassets.merge import FileHunk, MemoryHunk
+from webassets.utils import resolve_hash_algorithm, using_hash_algorithm
 from .helpers import TempEnvironmentHelper, TempDirHelper
 
 
@@ -121,15 +125,19 @@ class TestCacheIsUsed(TempEnvironmentHelper):
         bundle = self.mkbundle('in1', 'in2', output='out', filters=self.filter)
         self.cache.enabled = False
         bundle.build()
-        assert self.cache.getops == 6  # 2x first, 2x input, 1x output, 1x cache
+        # 2x first, 2x input, 1x output, 1x cache, 2x filter-depends
+        assert self.cache.getops == 8
         assert self.cache.setops == 7  # like getops + 1x bdef
 
     def test_cache_enabled(self):
         bundle = self.mkbundle('in1', 'in2', output='out', filters=self.filter)
         self.cache.enabled = True
         bundle.build()
-        assert self.cache.getops == 6  # # 2x first, 2x input, 1x output, 1x cache
-        assert self.cache.setops == 1  # one hit by (bdef)
+        # 2x first, 2x input, 1x output, 1x cache, 2x filter-depends
+        assert self.cache.getops == 8
+        # one hit by (bdef), one by the build time, as this cache claims
+        # filter-depends for the sources
+        assert self.cache.setops == 2
 
     def test_filesystem_cache(self):
         """Regresssion test for two bugs:
@@ -145,6 +153,177 @@ class TestCacheIsUsed(TempEnvironmentHelper):
         bundle.build(force=True)
 
 
+class TestToolFingerprint(TempEnvironmentHelper):
+
+    def test_fingerprint_in_cache_key(self):
+        """Filter results are not reused from the cache once the external
+        tool a filter uses changes."""
+        self.env.cache = MemoryCache(100)
+        class ToolFilter(Filter):
+            fingerprint = 'v1'
+            def output(self, _in, out, **kw):
+                out.write('built with %s' % self.fingerprint)
+            def tool_fingerprint(self):
+                return self.fingerprint
+        f = ToolFilter()
+
+        self.create_files({'in': 'foo'})
+        bundle = self.mkbundle('in', output='out', filters=f)
+        bundle.build(force=True)
+        assert self.get('out') == 'built with v1'
+
+        f.fingerprint = 'v2'
+        bundle.build(force=True)
+        assert self.get('out') == 'built with v2'
+
+
+class TestDigests(TempEnvironmentHelper):
+    """The digests hunks, filters and bundles contribute to cache keys."""
+
+    def test_digest_protocol(self):
+        """Custom types can be part of a cache key."""
+        class Custom(object):
+            def __init__(self, value):
+                self.value = value
+            def __webassets_digest__(self):
+                return self.value
+        assert make_digest(Custom('a')) == make_digest('a')
+        assert make_digest(Custom('a')) != make_digest(Custom('b'))
+        pytest.raises(ValueError, make_digest, object())
+
+    def test_file_hunk_digest_memoized(self):
+        """A file is only hashed again once it changes."""
+        self.create_files({'in': 'foo'})
+        self.setmtime('in', mod=-10)
+        calls = []
+        class CountingHunk(FileHunk):
+            def chunks(self):
+                calls.append(1)
+                return FileHunk.chunks(self)
+        hunk = CountingHunk(self.path('in'))
+        digest = make_digest(hunk)
+        assert make_digest(CountingHunk(self.path('in'))) == digest
+        assert len(calls) == 1
+
+        self.create_files({'in': 'foobar'})
+        assert make_digest(hunk) != digest
+        assert len(calls) == 2
+
+        # A file changed just now is hashed every time, as another change
+        # might not show in its timestamp.
+        assert make_digest(hunk) != digest
+        assert len(calls) == 3
+
+    def test_file_hunk_digests_bounded(self):
+        """Only so many file digests are remembered."""
+        self.create_files({'a': 'a', 'b': 'b', 'c': 'c'})
+        self.setmtime('a', 'b', 'c', mod=-10)
+        FileHunk._digests.clear()
+        with patch.object(FileHunk._digests, 'size', 2):
+            for name in ('a', 'b', 'a', 'c'):
+                make_digest(FileHunk(self.path(name)))
+        assert [key[1] for key in FileHunk._digests] == \
+            [self.path('a'), self.path('c')]
+
+    def test_filter_id_memoized(self):
+        """Filter ids follow changes to unique()."""
+        class MyFilter(Filter):
+            value = 'a'
+            def unique(self):
+                return {'value': self.value}
+        f = MyFilter()
+        first = f.id()
+        assert f.id() == first
+        f.value = 'b'
+        assert f.id() != first
+
+    def test_bundle_id_invalidated(self):
+        """Bundle ids change when the bundle, or a nested bundle,
+        is modified."""
+        child = self.mkbundle('a', 'b')
+        bundle = self.mkbundle(child, output='out')
+        first = bundle.id()
+        assert bundle.id() == first
+
+        child.contents = ('a',)
+        second = bundle.id()
+        assert second != first
+
+        bundle.filters = 'rjsmin'
+        assert bundle.id() not in (first, second)
+
+
+class TestHashAlgorithm(TempEnvironmentHelper):
+
+    def test_resolve(self):
+        assert resolve_hash_algorithm(None) == ('md5', hashlib.md5)
+        assert resolve_hash_algorithm('blake2b') == \
+            ('blake2b', hashlib.blake2b)
+        assert resolve_hash_algorithm(hashlib.sha1) == ('sha1', hashlib.sha1)
+        pytest.raises(ValueError, resolve_hash_algorithm, 'foo')
+
+    def test_make_digest(self):
+        """The algorithm in effect is used for digests, including the
+        memoized ones of hunks."""
+        hunk = MemoryHunk('foo')
+        md5 = make_digest(hunk)
+        with using_hash_algorithm('sha256'):
+            sha = make_digest(hunk)
+            assert hunk.id() == hashlib.sha256(b'foo').hexdigest()
+        assert sha != md5
+        assert make_digest(hunk) == md5
+        assert hunk.id() == hashlib.md5(b'foo').hexdigest()
+
+    def test_build(self):
+        """The environment option applies to builds, and separates
+        the cache entries."""
+        self.env.cache = True
+        self.create_files({'in': 'foo'})
+        calls = []
+        def my_filter(_in, out):
+            calls.append(1)
+            out.write(_in.read())
+        bundle = self.mkbundle('in', output='out', filters=my_filter)
+        bundle.build(force=True)
+        bundle.build(force=True)
+        assert len(calls) == 1
+
+        self.env.hash_algorithm = 'blake2b'
+        bundle.build(force=True)
+        assert len(calls) == 2
+        bundle.build(force=True)
+        assert len(calls) == 2
+        assert self.get('out') == 'foo'
+
+    def test_outside_build(self):
+        """The cache, versions and ids go by the environment option even
+        outside of a build.
+        """
+        from webassets.version import CacheManifest
+        self.env.cache = True
+        self.env.hash_algorithm = 'blake2b'
+        self.env.manifest = manifest = CacheManifest()
+        self.env.versions = 'hash'
+        self.create_files({'in': 'foo'})
+        bundle = self.mkbundle('in', output='out-%(version)s')
+        bundle.build()
+        version = bundle.version
+
+        generation = manifest.generation(self.env)
+        assert generation
+        bundle.version = None
+        with patch.object(type(self.env.versions), 'determine_version',
+                          side_effect=AssertionError):
+            assert bundle.get_version() == version
+        bundle.build(force=True)
+        assert manifest.generation(self.env) != generation
+
+        with using_hash_algorithm('blake2b'):
+            expected = bundle.id()
+        bundle._id_memo = None
+        assert bundle.id() == expected
+
+
 class TestSpecialCases(TempEnvironmentHelper):
     """Test cachy-things that don't have a place elsewhere.
 
@@ -1,10 +1,12 @@
 import os
+from unittest.mock import patch
 
 import pytest
 
 from webassets import Environment
 from webassets.env import RegisterError
 from webassets import Bundle
+from webassets.test import TempEnvironmentHelper
 
 
 class TestEnvApi(object):
@@ -270,3 +272,53 @@ class TestSpecialProperties(object):
         # Class assign
         self.m.cache = instance = BaseCache
         assert isinstance(self.m.cache, BaseCache)
+
+
+class TestWarmup(TempEnvironmentHelper):
+    """Test ``Environment.warmup()``."""
+
+    default_files = {'a': 'foo', 'b': 'bar'}
+
+    def setup_method(self):
+        super().setup_method()
+        self.env.manifest = 'json'
+        self.a = self.env.register('a', 'a', output='out_a')
+        self.b = self.env.register('b', 'b', output='out_b')
+        self.a.build()
+        self.b.build()
+        self.env.auto_build = False
+
+    @pytest.mark.parametrize('workers', [None, 2])
+    def test_warmup(self, workers):
+        with patch('gc.freeze') as freeze:
+            timings = self.env.warmup(workers=workers)
+        assert freeze.called
+        assert set(timings) == set([self.a, self.b])
+        assert all(t >= 0 for t in timings.values())
+
+        # The urls are now served from the index.
+        assert self.a._resolved_contents is not None
+        with patch('os.stat', side_effect=AssertionError):
+            assert self.a.urls(calculate_sri=True)[0]['sri']
+
+    def test_parallel_builds_serial(self):
+        """With workers, the bundles are still built one at a time."""
+        import threading
+        self.env.auto_build = True
+        threads = set()
+        def urls(bundle, *a, **kw):
+            threads.add(threading.current_thread())
+        with patch.object(Bundle, 'urls', urls):
+            self.env.warmup(freeze=False, workers=2)
+        assert threads == set([threading.current_thread()])
+
+    def test_auto_build(self):
+        """With auto_build, bundles are built, and filters set up."""
+        self.env.auto_build = True
+        self.a.filters = 'rjsmin'
+        self.create_files({'a': 'var  x = 1;'})
+        self.setmtime('a', mod=100)
+        self.env.warmup(freeze=False)
+        assert self.a.filters[0]._setup_version is not None
+        assert self.env._url_index is None
+        assert self.get('out_a') == 'var x=1;'
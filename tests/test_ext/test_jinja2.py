@@ -35,9 +35,12 @@ class TestTemplateTag(object):
                 # instance used by the extension.
                 test_instance.the_bundle = self
             def urls(self, *a, **kw):
+                test_instance.urls_called += 1
                 return self.urls_to_fake
         self._old_bundle_class = AssetsExtension.BundleClass
         AssetsExtension.BundleClass = self.BundleClass = MockBundle
+        self.urls_called = 0
+        self.assets_env = assets_env
 
         # Setup the Jinja2 environment.
         self.jinja_env = JinjaEnvironment()
@@ -103,6 +106,98 @@ class TestTemplateTag(object):
             '{% assets debug="True", "debug1.txt" %}{{ ASSET_URL }};{% endassets %}').render({})
         assert self.the_bundle.dbg == 'True'
 
+    def test_bundle_reused(self):
+        """The bundle of a tag is constructed once for the same options."""
+        template = self.jinja_env.from_string(
+            '{% assets "file1", var, filters=["jsmin", "cssmin"] %}{% endassets %}')
+        template.render({'var': 'file2'})
+        bundle = self.the_bundle
+        template.render({'var': 'file2'})
+        assert self.the_bundle is bundle
+        template.render({'var': 'file3'})
+        assert self.the_bundle is not bundle
+
+        # Options which cannot be hashed are supported, too.
+        self.render_template('"file1", depends={"a": "b"}')
+
+    def test_bundle_not_rebound(self):
+        """The bundle of a tag is connected to the environment for good,
+        so that renders in several threads do not interfere.
+        """
+        from unittest.mock import patch
+        with patch.object(Bundle, 'bind', side_effect=AssertionError):
+            self.render_template('"file1"')
+            self.render_template('"file1"')
+        assert self.the_bundle._env is self.assets_env
+
+    def test_urls_kept(self):
+        """Without auto_build, the urls are only asked for again when
+        they may have changed.
+        """
+        self.assets_env.auto_build = False
+        self.render_template('"file1"')
+        self.render_template('"file1"')
+        assert self.urls_called == 1
+
+        self.assets_env.url = '/other'
+        self.render_template('"file1"')
+        assert self.urls_called == 2
+
+        self.assets_env._urls_changed()
+        self.render_template('"file1"')
+        assert self.urls_called == 3
+
+    def test_urls_manifest_changed(self):
+        """The urls are asked for again when another process changed
+        the manifest.
+        """
+        from webassets.version import Manifest
+        class GenerationManifest(Manifest):
+            current = 1
+            def query(self, bundle, ctx):
+                return None
+            def generation(self, ctx):
+                return self.current
+        self.assets_env.manifest = manifest = GenerationManifest()
+        self.assets_env.auto_build = False
+        self.render_template('"file1"')
+        self.render_template('"file1"')
+        assert self.urls_called == 1
+        manifest.current = 2
+        self.render_template('"file1"')
+        assert self.urls_called == 2
+
+    def test_manifest_resolved_once(self):
+        """A manifest given by name is not loaded again for every render.
+        """
+        from unittest.mock import patch
+        from webassets.version import JsonManifest
+        self.assets_env.manifest = 'json'
+        self.assets_env.auto_build = False
+        with patch.object(JsonManifest, '_load_manifest') as load:
+            self.render_template('"file1"')
+            calls = load.call_count
+            self.render_template('"file1"')
+            self.render_template('"file1"')
+        assert load.call_count == calls
+
+    def test_bundles_evicted(self):
+        """Bundles are evicted least recently used first."""
+        from unittest.mock import patch
+        ext = self.jinja_env.extensions[AssetsExtension.identifier]
+        with patch.object(AssetsExtension, 'BUNDLE_CACHE_SIZE', 2):
+            self.render_template('"file1"')
+            self.render_template('"file2"')
+            self.render_template('"file1"')
+            self.render_template('"file3"')
+        kept = [entry['bundle'].contents for entry in ext._bundles.values()]
+        assert kept == [('file1',), ('file3',)]
+
+    def test_urls_auto_build(self):
+        self.render_template('"file1"')
+        self.render_template('"file1"')
+        assert self.urls_called == 2
+
     def test_extra_values(self):
         self.foo_bundle.extra = {'moo': 42}
         output = self.jinja_env.from_string(
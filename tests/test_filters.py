@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 import os
 import os.path
+import sys
 import shutil
 from subprocess import check_output
 from contextlib import contextmanager
+from io import BytesIO
 
 from unittest.mock import patch, Mock, DEFAULT
 
@@ -11,12 +13,14 @@ import re
 
 import pytest
 
+import webassets
 from webassets.utils import StringIO
 from webassets import Environment
 from webassets.exceptions import FilterError
 from webassets.filter import (
     Filter, ExternalTool, get_filter, register_filter, unique_modules)
 from webassets.filter.compass import CompassConfig
+from webassets.importlib import import_module
 from webassets.bundle import ContextWrapper
 from .helpers import TempEnvironmentHelper
 
@@ -52,6 +56,20 @@ class TestFilterBaseClass(object):
         assert type('Foo', (Filter,), {'name': 'custom'}).name == 'custom'
         assert type('Foo', (Filter,), {'name': None}).name is None
 
+    def test_pickle(self):
+        """Filters can be pickled after setup(), to run them in other
+        processes."""
+        import pickle
+        from webassets.filter.rjsmin import RJSMin
+        f = RJSMin(keep_bang_comments=True)
+        f.set_context(Environment())
+        f.module = re
+        f2 = pickle.loads(pickle.dumps(f))
+        assert f2.ctx is None
+        assert f2.module is re
+        assert f2.keep_bang_comments is True
+        assert f2.id() == f.id()
+
     def test_options(self):
         """Test option declaration.
         """
@@ -252,6 +270,29 @@ class TestExternalToolClass(object):
         assert not getattr(Filter, 'open') is None
         assert not getattr(Filter, 'input') is None
 
+    def test_tool_fingerprint(self, tmp_path):
+        """The fingerprint identifies the binary the tool runs, and
+        changes if the binary is replaced."""
+        from webassets.filter import _TOOL_FINGERPRINTS
+        binary = tmp_path / 'mytool'
+        binary.write_text('v1')
+
+        class Filter(self.MockTool):
+            options = {'binary': 'MYTOOL_BIN'}
+        f = Filter(binary=str(binary))
+        fingerprint = f.tool_fingerprint()
+        assert fingerprint is not None
+
+        # Computed only once per process
+        binary.write_text('version 2')
+        assert Filter(binary=str(binary)).tool_fingerprint() == fingerprint
+        _TOOL_FINGERPRINTS.clear()
+        assert Filter(binary=str(binary)).tool_fingerprint() != fingerprint
+
+        # Without a binary that can be found, there is no fingerprint
+        assert Filter(binary=str(tmp_path / 'missing')).tool_fingerprint() is None
+        assert Filter().tool_fingerprint() is None
+
     def test_subsubclass(self):
         """Test subclassing a class based on ExternalTool again.
 
@@ -309,6 +350,18 @@ class TestExternalToolClass(object):
         self.popen.return_value.communicate.return_value = [b'stdout', b'stderr']
         pytest.raises(FilterError, Filter.subprocess, ['test'], StringIO())
 
+    def test_subprocess_bytes(self):
+        """Binary streams, as used by bytes-capable filters, are passed
+        through without decoding or encoding."""
+        class Filter(ExternalTool): pass
+        self.popen.return_value.returncode = 0
+        self.popen.return_value.communicate.return_value = [
+            b'std\xc3\xb1out', b'stderr']
+        out = BytesIO()
+        Filter.subprocess(['test'], out, data=BytesIO(b'd\xc3\xb1ta'))
+        assert out.getvalue() == b'std\xc3\xb1out'
+        self.popen.return_value.communicate.assert_called_with(b'd\xc3\xb1ta')
+
     def test_input_var(self):
         """Test {input} variable."""
         class Filter(ExternalTool): pass
@@ -378,6 +431,33 @@ class TestExternalToolClass(object):
         assert not os.path.exists(intercepted['filename'])
 
 
+def test_subprocess_streamed():
+    """In streaming mode, data is piped through the process piece by
+    piece, rather than read into memory first."""
+    from webassets.merge import CHUNK_SIZE, HunkReader, MemoryHunk
+    class Filter(ExternalTool): pass
+    upper = [sys.executable, '-c',
+             'import sys; sys.stdout.write(sys.stdin.read().upper())']
+    text = u'fooñ' * CHUNK_SIZE
+    out = StringIO()
+    Filter.subprocess(upper, out, data=HunkReader(MemoryHunk(text)))
+    assert out.getvalue() == text.upper()
+
+    # Placeholders work as well.
+    copy = [sys.executable, '-c',
+            'import shutil, sys; shutil.copy(sys.argv[1], sys.argv[2])',
+            '{input}', '{output}']
+    out = StringIO()
+    Filter.subprocess(copy, out, data=HunkReader(MemoryHunk(text)))
+    assert out.getvalue() == text
+
+    # Errors are reported
+    fail = [sys.executable, '-c', 'import sys; sys.exit("failed")']
+    with pytest.raises(FilterError) as excinfo:
+        Filter.subprocess(fail, StringIO(), data=HunkReader(MemoryHunk(text)))
+    assert 'failed' in str(excinfo.value)
+
+
 def test_register_filter():
     """Test registration of custom filters.
     """
@@ -430,6 +510,60 @@ def test_get_filter():
     pytest.raises(AssertionError, get_filter, lambda: None, 'test')
 
 
+def test_builtin_filters_loaded_lazily():
+    """Importing webassets does not import the builtin filter modules;
+    they are loaded when a filter is requested by name.
+    """
+    code = ('import sys, webassets, webassets.filter as f;'
+            'print(sorted(m for m in sys.modules if m.startswith('
+            '"webassets.filter.")));'
+            'f.get_filter("rjsmin");'
+            'print("webassets.filter.rjsmin" in sys.modules)')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(webassets.__file__))] +
+        ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    output = check_output([sys.executable, '-c', code], env=env)
+    assert output.decode('utf-8').split() == ['[]', 'True']
+
+
+def test_builtin_filter_map():
+    """The static map of builtin filters matches what the filter
+    modules actually define.
+    """
+    from webassets.filter import _BUILTIN_FILTERS
+    found = {}
+    directory = os.path.dirname(webassets.filter.__file__)
+    for name in unique_modules(directory):
+        module = import_module('webassets.filter.%s' % name)
+        for attr in vars(module).values():
+            if isinstance(attr, type) and issubclass(attr, Filter) \
+                    and attr.name and attr.__module__ == module.__name__:
+                found[attr.name] = module.__name__
+    assert found == _BUILTIN_FILTERS
+
+
+def test_user_filter_not_replaced_by_builtin():
+    """A filter registered by the user under the name of a builtin
+    filter is not replaced once the builtin module is loaded.
+    """
+    from webassets.filter import (
+        _FILTERS, _LOADED_MODULES, load_builtin_filters)
+    class MyFilter(Filter):
+        name = 'jspacker'
+    backup = _FILTERS.pop('jspacker', None)
+    _LOADED_MODULES.discard('webassets.filter.jspacker')
+    register_filter(MyFilter)
+    try:
+        load_builtin_filters()
+        assert isinstance(get_filter('jspacker'), MyFilter)
+    finally:
+        del _FILTERS['jspacker']
+        _LOADED_MODULES.discard('webassets.filter.jspacker')
+        if backup:
+            _FILTERS['jspacker'] = backup
+
+
 def test_callable_filter():
     """Simple callables can be used as filters.
 
@@ -446,6 +580,70 @@ def test_callable_filter():
         assert helper.get('out') == 'filter was here'
 
 
+def test_callable_filter_identity():
+    """Callable filters have an identity that is stable across
+    processes, so their results can be cached.
+    """
+    def make(source, **ns):
+        exec(source, ns)
+        return ns['my_filter']
+    source = 'def my_filter(_in, out):\n    out.write(_in.read() + %r)\n'
+
+    # Two separately created, but identical functions share their id
+    # (which they would not if it were based on hash()).
+    a, b = make(source % 'a'), make(source % 'a')
+    assert a is not b
+    assert get_filter(a).id() == get_filter(b).id()
+    # The code matters.
+    assert get_filter(a).id() != get_filter(make(source % 'b')).id()
+
+    # So do the values of closure variables.
+    def closure(suffix):
+        def my_filter(_in, out):
+            out.write(_in.read() + suffix)
+        return my_filter
+    assert get_filter(closure('a')).id() == get_filter(closure('a')).id()
+    assert get_filter(closure('a')).id() != get_filter(closure('b')).id()
+
+    # If the function references arbitrary objects, we fall back to
+    # the callable itself.
+    obj = object()
+    f = closure(obj)
+    assert get_filter(f).unique() is f
+
+    # An explicit cache_id can be given.
+    assert get_filter(f, cache_id='v1').id() == \
+        get_filter(closure(object()), cache_id='v1').id()
+    assert get_filter(f, cache_id='v1').id() != \
+        get_filter(f, cache_id='v2').id()
+    pytest.raises(AssertionError, get_filter, f, foo='bar')
+
+
+def test_replace_filter():
+    from webassets.filter.replace import ReplaceFilter
+    f = ReplaceFilter(pattern=r'a+', repl='b')
+    assert f.transform('caaat') == 'cbt'
+
+    # Several patterns are applied in a single pass.
+    f = ReplaceFilter(pattern={'x': 'y', 'y': 'z', r'\d+': r'<\g<0>>'})
+    assert f.transform('xy12') == 'yz<12>'
+
+    # Literal tokens; the longest match wins.
+    f = ReplaceFilter(pattern={'{{ A }}': r'\1', '{{ A }}{{ A }}': '2',
+                               '.': '!'}, literal=True)
+    assert f.transform('{{ A }}.{{ A }}{{ A }}') == r'\1!2'
+
+    # Patterns with groups are applied one after another.
+    f = ReplaceFilter(pattern={r'(a)(b)': r'\2\1', r'ba': 'c'})
+    assert f.transform('ab') == 'c'
+
+    # Compiled once for as long as the options do not change.
+    matcher = f._matcher()
+    assert f._matcher() is matcher
+    f.pattern['x'] = 'y'
+    assert f._matcher() is not matcher
+
+
 class TestBuiltinFilters(TempEnvironmentHelper):
 
     default_files = {
@@ -766,6 +964,100 @@ class TestCssRewrite(TempEnvironmentHelper):
         }'''
 
 
+    def test_relative_urls_memoized(self):
+        from webassets.filter.cssrewrite import _relative_url
+        _relative_url.cache_clear()
+        self.create_files({'in.css': 'a { background: url(sub/icon.png) }' * 50})
+        self.mkbundle('in.css', filters='cssrewrite', output='g/out.css').build()
+        assert self.get('g/out.css') == \
+            'a { background: url(../sub/icon.png) }' * 50
+        info = _relative_url.cache_info()
+        assert (info.misses, info.hits) == (1, 49)
+
+    def test_replace_mapping_prepared_once(self):
+        cssrewrite = get_filter('cssrewrite', replace={'old': '/new/'})
+        self.create_files({'a.css': 'h1 { background: url(old/a.png) }',
+                           'b.css': 'h1 { background: url(old/b.png) }'})
+        with patch('webassets.filter.cssrewrite.common_path_prefix',
+                   wraps=webassets.filter.cssrewrite.common_path_prefix) as m:
+            self.mkbundle('a.css', 'b.css', filters=cssrewrite,
+                          output='out.css').build()
+        assert m.call_count == 1
+        assert self.get('out.css') == 'h1 { background: url(/new/a.png) }\n' \
+                                      'h1 { background: url(/new/b.png) }'
+
+    def test_digest(self):
+        """Digests of the referenced files can be added to urls."""
+        self.create_files({
+            'in.css': 'a { background: url(sub/icon.png) }\n'
+                      'b { src: url("sub/font.eot?#iefix") }\n'
+                      'c { background: url(sub/missing.png) }\n'
+                      'd { background: url(/abs.png) }',
+            'sub/icon.png': 'foo', 'sub/font.eot': 'bar'})
+        self.mkbundle('in.css', filters=get_filter('cssrewrite', digest=True),
+                      output='g/out.css').build()
+        assert self.get('g/out.css') == (
+            'a { background: url(../sub/icon.png?acbd18db) }\n'
+            'b { src: url("../sub/font.eot?37b51d19#iefix") }\n'
+            'c { background: url(../sub/missing.png) }\n'
+            'd { background: url(/abs.png) }')
+
+        self.env.config['cssrewrite_digest'] = 'filename'
+        self.mkbundle('in.css', filters='cssrewrite',
+                      output='g/out2.css').build()
+        assert self.get('g/out2.css').startswith(
+            'a { background: url(../sub/icon.acbd18db.png) }\n')
+
+    def test_digest_cached(self):
+        """A changed file changes the digest, even with the cache
+        enabled; digests of unchanged files are not recomputed.
+        """
+        from webassets.filter.cssrewrite import CSSRewrite
+        from webassets.merge import MemoryHunk
+        self.env.cache = True
+        self.create_files({'in.css': 'a { background: url(icon.png) }',
+                           'icon.png': 'foo'})
+        self.setmtime('icon.png', mod=-10)
+        cssrewrite = get_filter('cssrewrite', digest=True)
+        self.mkbundle('in.css', filters=cssrewrite, output='out.css').build()
+        assert self.get('out.css') == 'a { background: url(icon.png?acbd18db) }'
+        assert self.env.cache.get(
+            ('filter-depends', self.path('in.css'))) == [self.path('icon.png')]
+
+        # Only producing the output records the files, not computing the
+        # cache key.
+        self.env.cache.set(('filter-depends', self.path('in.css')), [])
+        cssrewrite.get_content_cache_keys(
+            MemoryHunk('a { background: url(icon.png) }'),
+            source_path=self.path('in.css'))
+        assert self.env.cache.get(
+            ('filter-depends', self.path('in.css'))) == []
+
+        CSSRewrite._digests.clear()
+        with patch('webassets.filter.cssrewrite.open', create=True,
+                   side_effect=open) as m:
+            self.mkbundle('in.css', filters=cssrewrite,
+                          output='out.css').build(force=True)
+        assert m.call_count == 0
+
+        self.create_files({'icon.png': 'foobar'})
+        self.mkbundle('in.css', filters=cssrewrite, output='out.css').build(
+            force=True)
+        assert self.get('out.css') == 'a { background: url(icon.png?3858f622) }'
+
+    def test_prefix_trie(self):
+        from webassets.filter.cssrewrite import _PrefixTrie
+        trie = _PrefixTrie()
+        trie.add('a/b/', 1)
+        trie.add('a/', 2)
+        trie.add('a/b/c/', 3)
+        assert trie.match('a/b/c/d') == ('a/b/', 1)
+        assert trie.match('a/x') == ('a/', 2)
+        assert trie.match('b/') is None
+        trie.add('', 4)
+        assert trie.match('b/') == ('', 4)
+
+
 class TestDataUri(TempEnvironmentHelper):
 
     default_files = {
@@ -782,12 +1074,126 @@ class TestDataUri(TempEnvironmentHelper):
         self.mkbundle('in.css', filters='datauri', output='out.css').build()
         assert self.get('out.css') == 'h1 { background: url(sub/icon.png) }'
 
+    def test_query_and_fragment(self):
+        """[Regression] Urls with a query or fragment are left alone, as
+        inlining the file would lose them (svg sprites, the IE font hack).
+        """
+        self.create_files({
+            'sprite.svg': 'foo', 'font.svg': 'bar',
+            'in.css': 'a { b: url(sprite.svg#a) }\n'
+                      'c { d: url(font.svg?#iefix) }'})
+        self.mkbundle('in.css', filters='datauri', output='out.css').build()
+        assert self.get('out.css') == \
+            'a { b: url(sprite.svg#a) }\nc { d: url(font.svg?#iefix) }'
+
+    def test_quoted_url(self):
+        """Urls are unquoted to find the file, as with cssrewrite."""
+        self.create_files({'sub/my icon.png': 'foo',
+                           'in.css': 'h1 { background: url(sub/my%20icon.png) }'})
+        self.mkbundle('in.css', filters='datauri', output='out.css').build()
+        assert self.get('out.css') == 'h1 { background: url(data:image/png;base64,Zm9v) }'
+
     def test_max_size(self):
         self.env.config['datauri_max_size'] = 2
         self.create_files({'sub/icon.png': 'foo'})
         self.mkbundle('in.css', filters='datauri', output='out.css').build()
         assert self.get('out.css') == 'h1 { background: url(sub/icon.png) }'
 
+    def test_cache_notices_changed_file(self):
+        """[Regression] A changed image is not served from the cache."""
+        self.env.cache = True
+        self.create_files({'sub/icon.png': 'foo'})
+        self.mkbundle('in.css', filters='datauri', output='out.css').build()
+        self.create_files({'sub/icon.png': 'foobar'})
+        self.mkbundle('in.css', filters='datauri', output='out.css').build(
+            force=True)
+        assert self.get('out.css') == 'h1 { background: url(data:image/png;base64,Zm9vYmFy) }'
+
+    def test_cache_keys_with_explicit_arguments(self):
+        """[Regression] Filters which name the arguments of
+        ``get_additional_cache_keys()`` can be combined with those
+        asking for the content.
+        """
+        class Explicit(Filter):
+            name = 'explicit'
+            def get_additional_cache_keys(self, source=None, source_path=None,
+                                          output=None, output_path=None):
+                return []
+            def input(self, _in, out, **kw):
+                out.write(_in.read())
+        self.env.cache = True
+        self.create_files({'sub/icon.png': 'foo'})
+        self.mkbundle('in.css', filters=[Explicit(), 'datauri'],
+                      output='out.css').build()
+        assert self.get('out.css') == 'h1 { background: url(data:image/png;base64,Zm9v) }'
+
+    def test_url_matches_in_chunks(self):
+        """The urls are found when the content is read in pieces which
+        split them.
+        """
+        from webassets.filter.cssrewrite.base import iter_url_matches
+        class Chunked(object):
+            def chunks(self):
+                return ['a { b: url(x', '.png) }\nc { d: ur',
+                        'l("y\\)z.png") } e { f: url(w.png)', ' }']
+        urls = [m.group(0) for m in iter_url_matches(Chunked())]
+        assert urls == ['url(x.png)', 'url("y\\)z.png")', 'url(w.png)']
+
+    def test_encoding_memoized(self):
+        """A file used by several stylesheets is only read once."""
+        from webassets.filter.datauri import CSSDataUri
+        CSSDataUri._encoded.clear()
+        self.create_files({'sub/icon.png': 'foo', 'in2.css': 'a { background: url(sub/icon.png) }'})
+        self.setmtime('sub/icon.png', mod=-10)
+        with patch('webassets.filter.datauri.open', create=True,
+                   side_effect=open) as m:
+            self.mkbundle('in.css', 'in2.css', filters='datauri',
+                          output='out.css').build()
+        assert m.call_count == 1
+        assert self.get('out.css') == \
+            'h1 { background: url(data:image/png;base64,Zm9v) }\n' \
+            'a { background: url(data:image/png;base64,Zm9v) }'
+
+    def test_same_stamp_rewrite(self):
+        """[Regression] A file rewritten with the same size and timestamp
+        right after it was encoded is not served from memory.
+        """
+        self.create_files({'sub/icon.png': 'foo'})
+        mtime = self.setmtime('sub/icon.png')
+        self.mkbundle('in.css', filters='datauri', output='out.css').build()
+        self.create_files({'sub/icon.png': 'bar'})
+        self.setmtime('sub/icon.png', mtime=mtime)
+        self.mkbundle('in.css', filters='datauri', output='out.css').build(
+            force=True)
+        assert self.get('out.css') == 'h1 { background: url(data:image/png;base64,YmFy) }'
+
+    def test_fused_with_cssrewrite(self):
+        """datauri and cssrewrite rewrite urls in a single pass, with the
+        same result as when applied one after the other.
+        """
+        from webassets.filter.cssrewrite import base
+        from webassets.merge import _fuse_filters
+        self.create_files({
+            'in.css': 'h1 { background: url(sub/icon.png) }\n'
+                      'h2 { background: url("sub/big.png") }',
+            'sub/icon.png': 'foo', 'sub/big.png': 'x' * 4096})
+        filters = [get_filter('datauri'), get_filter('cssrewrite')]
+        assert len(_fuse_filters(filters, 'input')) == 1
+        assert len(_fuse_filters(filters, 'output')) == 2
+
+        with patch.object(base, 'urltag_re', wraps=base.urltag_re) as regex:
+            self.mkbundle('in.css', filters=filters, output='a/out.css').build()
+        assert regex.sub.call_count == 1
+        assert self.get('a/out.css') == (
+            'h1 { background: url(data:image/png;base64,Zm9v) }\n'
+            'h2 { background: url("../sub/big.png") }')
+
+        # A rewriter with its own patterns is not fused.
+        class OwnPatterns(base.CSSUrlRewriter):
+            patterns = {'rewrite_url': base.urltag_re}
+        assert OwnPatterns().fusion_key is None
+        assert len(_fuse_filters(filters + [OwnPatterns()], 'input')) == 2
+
 
 class TestLess(TempEnvironmentHelper):
 
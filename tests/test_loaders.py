@@ -252,6 +252,7 @@ class TestYAMLCustomFilters(TestYAML):
         """Check that filters can be loaded from YAML """
         # Delete the less filter
         import webassets.filter
+        get_filter('less')
         del webassets.filter._FILTERS['less']
         # Verify that it was deleted
         pytest.raises(ValueError, get_filter, 'less')
@@ -1,4 +1,5 @@
 import os
+from unittest.mock import patch
 
 import pytest
 
@@ -293,3 +294,62 @@ class TestTimestampUpdater(TempEnvironmentHelper):
         now = self.setmtime('out-v1')
         self.setmtime('in', mtime=now-100)
         assert self.env.updater.needs_rebuild(b, self.env) == False
+
+    def test_filter_depends(self):
+        """Files which filters record as dependencies of a source file
+        are checked too.
+        """
+        self.env.cache = MemoryCache(capacity=100)
+        self.create_files({'img.png': ''})
+        bundle = self.mkbundle('in', output='out')
+        self.env.cache.set(('filter-depends', self.path('in')),
+                           [self.path('img.png')])
+
+        now = self.setmtime('out')
+        self.setmtime('in', 'img.png', mtime=now-100)
+        # Make sure the bundle definition check does not interfere.
+        self.updater.build_done(bundle, self.env)
+        # They are remembered for the bundle, not looked up per source.
+        with patch.object(self.env.cache, 'get',
+                          wraps=self.env.cache.get) as get:
+            assert self.updater.needs_rebuild(bundle, self.env) == False
+        assert not [c for c in get.call_args_list
+                    if c[0][0][0] == 'filter-depends']
+
+        self.setmtime('img.png', mtime=now+100)
+        assert self.updater.needs_rebuild(bundle, self.env) == True
+
+    def test_unchanged_output(self):
+        """An output file which is not written again, because its content
+        did not change, does not cause rebuilds from then on.
+        """
+        self.env.cache = MemoryCache(capacity=100)
+        self.create_files({'in': 'foo'})
+        bundle = self.mkbundle('in', output='out')
+        bundle.build(force=True)
+
+        now = self.setmtime('in')
+        self.setmtime('out', mtime=now-100)
+        assert self.updater.needs_rebuild(bundle, self.env) == True
+        bundle.build()
+        assert os.path.getmtime(self.path('out')) == now-100
+        assert self.updater.needs_rebuild(bundle, self.env) == False
+
+    def test_unchanged_output_no_cache(self):
+        """Without a cache, an output file which is not written again has
+        its timestamp updated, so it is not rebuilt over and over.
+        """
+        self.env.cache = False
+        self.env.auto_build = True
+        self.create_files({'in': 'foo'})
+        bundle = self.mkbundle('in', output='out')
+        bundle.build(force=True)
+
+        now = self.setmtime('in')
+        self.setmtime('out', mtime=now-100)
+        with patch.object(bundle, '_merge_and_apply',
+                          wraps=bundle._merge_and_apply) as build:
+            for i in range(3):
+                bundle.urls()
+        assert build.call_count == 1
+        assert self.get('out') == 'foo'
@@ -1,6 +1,7 @@
 """Test the versioners and manifest implementations.
 """
 import hashlib
+import json
 
 import os
 
@@ -114,6 +115,16 @@ class TestHashVersion(TempEnvironmentHelper):
         assert HashVersion(hash=hashlib.sha256).determine_version(
             self.bundle, self.env, hunk) == '2c26b46b'
 
+    def test_hash_algorithm_option(self):
+        """By default, the environment's hash algorithm is used."""
+        hunk = MemoryHunk('foo')
+        self.env.hash_algorithm = 'sha256'
+        assert self.v.determine_version(
+            self.bundle, self.env, hunk) == '2c26b46b'
+        # An explicit hash still takes precedence.
+        assert HashVersion(hash=hashlib.md5).determine_version(
+            self.bundle, self.env, hunk) == 'acbd18db'
+
     def test_with_hunk(self):
         # If a hunk is given, the has will be based on it, not the output file
         self.create_files({self.bundle.output: 'bar'})
@@ -198,6 +209,23 @@ class TestJsonManifest(TempEnvironmentHelper):
         manifest = JsonManifest.make(self.env, 'manifest')
         assert manifest.query(bundle, self.env) == 'the-version'
 
+    def test_meta(self):
+        """Additional information is stored besides the versions."""
+        bundle = self.bundle
+        manifest = JsonManifest.make(self.env, 'manifest')
+        assert manifest.query_meta(bundle, self.env) == {}
+        manifest.remember(bundle, self.env, 'the-version')
+        manifest.remember_meta(bundle, self.env, {'a': 1})
+        manifest.remember_meta(bundle, self.env, {'b': 2})
+
+        manifest = JsonManifest.make(self.env, 'manifest')
+        assert manifest.query_meta(bundle, self.env) == {'a': 1, 'b': 2}
+        assert manifest.query(bundle, self.env) == 'the-version'
+
+        # The manifest itself is not changed by it.
+        with open(self.path('manifest')) as f:
+            assert json.load(f) == {'foo': 'the-version'}
+
 
 class TestCacheManifest(TempEnvironmentHelper):
 
@@ -217,6 +245,14 @@ class TestCacheManifest(TempEnvironmentHelper):
         manifest.remember(self.bundle, self.env, 'the-version')
         assert manifest.query(self.bundle, self.env) == 'the-version'
 
+    def test_meta(self):
+        manifest = CacheManifest()
+        self.env.cache = True
+        assert manifest.query_meta(self.bundle, self.env) == {}
+        manifest.remember_meta(self.bundle, self.env, {'a': 1})
+        manifest.remember_meta(self.bundle, self.env, {'b': 2})
+        assert manifest.query_meta(self.bundle, self.env) == {'a': 1, 'b': 2}
+
     def test_no_cache_attached(self):
         """Test behavior or CacheManifest if no cache is available."""
         manifest = CacheManifest()